@@ -7,10 +7,12 @@ from datetime import datetime
 from dotenv import load_dotenv
 from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from backend.api.routes import api_bp
+from backend.utils.json_provider import NumpyJSONProvider
 from backend.utils.port_finder import find_available_port
-from services.crypto_data import CryptoDataService
-from services.ai_predictor import AIPredictor
+from backend.utils import metrics, profiling, timing
+from config import get_config
 
 # Load environment variables
 load_dotenv()
@@ -30,9 +32,26 @@ def create_app():
                 static_folder='frontend/static')
     
     # Configuration
+    app.config.from_object(get_config())
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['JSON_SORT_KEYS'] = False
     
+    # Client addresses from X-Forwarded-For only when set by our own proxies
+    if app.config.get('TRUSTED_PROXIES'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    
+    # numpy-aware JSON encoding (orjson when installed)
+    app.json = NumpyJSONProvider(app)
+    
+    # Stage timing and Server-Timing headers
+    timing.init_app(app)
+    
+    # Request counters for /api/metrics
+    metrics.init_app(app)
+    
+    # Opt-in request profiling (PROFILING=True)
+    profiling.init_app(app)
+    
     # Enable CORS
     CORS(app)
     
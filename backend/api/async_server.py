@@ -0,0 +1,305 @@
+"""
+Asyncio serving mode for the prediction API
+
+Serves the read endpoints of ``api_bp`` from an aiohttp application. Upstream
+fetches are awaited on the event loop through ``AsyncCryptoDataFetcher`` and
+only the model work runs on a small thread pool, so one worker can hold
+hundreds of slow upstream calls instead of one per WSGI thread. Payloads are
+built and cached by the same ``PredictionService`` code as the Flask routes.
+
+Run with::
+
+    gunicorn backend.api.async_server:async_app --worker-class aiohttp.GunicornWebWorker
+
+Batch predictions and the event stream are only served by the Flask app.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+from aiohttp import web
+from backend.api.prediction_service import (
+    ANALYSIS_TIMEFRAME, COINS_TTL, LONG_SERIES_TTL, MAX_PAGE_SIZE, POPULAR_COINS, PRICE_TTL,
+    PredictionService, parse_horizons, series_ttl
+)
+from backend.data.federation import SeriesRequest
+from backend.data.async_crypto_api import AsyncCryptoDataFetcher
+from backend.utils.cache import CacheEntry
+from backend.utils.json_provider import dumps
+from backend.utils.response_cache import encoded_body
+from config import get_config
+
+
+def _int_arg(request: web.Request, name: str, default: Optional[int] = None) -> Optional[int]:
+    """Integer query argument, ``default`` when missing or malformed (like Flask's ``type=int``)"""
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _error(message: str, status: int) -> web.Response:
+    return web.json_response({'error': message}, status=status, dumps=dumps)
+
+
+def _accepted_encodings(header: str) -> set:
+    """Content codings listed in an Accept-Encoding header with a non-zero q"""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def entry_response(request: web.Request, entry: CacheEntry) -> web.Response:
+    """
+    aiohttp response for a cache entry, mirroring ``cached_response``
+
+    Same weak ETag, Last-Modified, Cache-Control and encoding negotiation,
+    answered from the entry's pre-encoded body.
+    """
+    body = encoded_body(entry)
+    etag = f'W/"{body.etag}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+        not_modified = body.etag in tags or '*' in tags
+    else:
+        try:
+            since = parsedate_to_datetime(request.headers['If-Modified-Since'])
+            not_modified = int(entry.created) <= since.timestamp()
+        except (KeyError, TypeError, ValueError):
+            not_modified = False
+
+    if not_modified:
+        response = web.Response(status=304)
+    else:
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((coding for coding in body.encodings() if coding in accepted), 'identity')
+        response = web.Response(body=body.get(encoding), content_type='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.headers['ETag'] = etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.last_modified = int(entry.created)
+
+    ttl = entry.ttl_remaining()
+    response.headers['Cache-Control'] = f'public, max-age={int(ttl)}' if ttl is not None else 'public'
+    return response
+
+
+class AsyncPredictionAPI:
+    """Request handlers that await upstream data and offload model work"""
+
+    def __init__(self, service: PredictionService, fetcher: AsyncCryptoDataFetcher,
+                 model_workers: int = 4, budget_ms: Optional[float] = None):
+        self.service = service
+        self.cache = service.cache
+        self.fetcher = fetcher
+        self.budget_ms = budget_ms
+        self.executor = ThreadPoolExecutor(max_workers=model_workers, thread_name_prefix='model')
+        self._inflight = {}
+
+    async def close(self, app: web.Application = None):
+        await self.fetcher.close()
+        self.executor.shutdown(wait=False)
+
+    # Shared building blocks
+
+    async def _ensure(self, cache_key: str, fetch: Callable[[], Awaitable], ttl: int):
+        """Cached upstream value, fetched once per TTL however many requests wait for it"""
+        cached = self.cache.get(cache_key)
+        if cached:
+            return cached
+
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(cache_key, fetch, ttl))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        # A cancelled request must not cancel the fetch other requests wait on
+        return await asyncio.shield(task)
+
+    async def _fill(self, cache_key: str, fetch: Callable[[], Awaitable], ttl: int):
+        data = await fetch()
+        if data:
+            self.cache.set(cache_key, data, ttl=ttl)
+        return data
+
+    async def _upstream(self, cache_key: str, fetch: Callable[[], Awaitable], ttl: int, fallback: Callable):
+        """
+        ``_ensure``, degrading like the Flask server when the awaited fetch fails
+
+        The blocking ``fallback`` (the service's own fetch, with its negative
+        cache, last good values and, for series, Yahoo) then runs on the
+        model pool. While ``failed_<cache_key>`` marks a recent failure the
+        awaited fetch is skipped, as ``PredictionService.fetch_fresh`` does.
+        """
+        if self.cache.peek(f'failed_{cache_key}') is None:
+            async def fetch_and_remember():
+                data = await fetch()
+                if data:
+                    self.service.remember(cache_key, data)
+                return data
+
+            data = await self._ensure(cache_key, fetch_and_remember, ttl)
+            if data:
+                return data
+        return await self._run(fallback)
+
+    async def _series(self, source: SeriesRequest):
+        """Prefetch a ``series_source`` into the cache the service reads from"""
+        # Yahoo is blocking, so it is only reached through the service's fallback
+        clients = {'binance': self.fetcher, 'coingecko': self.fetcher}
+        fetch = functools.partial(self.service.federation.fetch_async, source, clients)
+        return await self._upstream(self.service.series_key(source), fetch, series_ttl(source),
+                                    functools.partial(self.service.fetch_series, source))
+
+    async def _history(self, coin_id: str, days: int):
+        """Prefetch CoinGecko price history for ``historical``"""
+        fetch = functools.partial(self.fetcher.get_historical_data, coin_id, days)
+        return await self._upstream(self.service.history_key(coin_id, days), fetch, LONG_SERIES_TTL,
+                                    functools.partial(self.service.history, coin_id, days))
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        """Run CPU-bound service work off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def _cached(self, request: web.Request, cache_key: str, payload, error: str) -> web.Response:
+        if not payload:
+            return _error(error, 404)
+        entry = self.cache.peek(cache_key)
+        if entry is None:
+            return web.json_response(payload, dumps=dumps)
+        return entry_response(request, entry)
+
+    def _budget_ms(self, request: web.Request) -> Optional[float]:
+        try:
+            budget = float(request.query['budget_ms'])
+        except (KeyError, ValueError):
+            budget = self.budget_ms
+        return budget if budget and budget > 0 else None
+
+    # Handlers
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'status': 'healthy',
+            'service': 'crypto-prediction-api',
+            'version': '1.0.0'
+        }, dumps=dumps)
+
+    async def coins(self, request: web.Request) -> web.Response:
+        async def fetch():
+            return {
+                'popular': POPULAR_COINS,
+                'all': (await self.fetcher.get_supported_coins())[:100]
+            }
+
+        payload = await self._ensure('supported_coins', fetch, COINS_TTL)
+        return self._cached(request, 'supported_coins', payload, 'Failed to fetch coins')
+
+    async def price(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        cache_key = f'price_{coin_id}'
+        payload = await self._upstream(cache_key, functools.partial(self.fetcher.get_current_price, coin_id),
+                                       PRICE_TTL, functools.partial(self.service.price, coin_id))
+        return self._cached(request, cache_key, payload, 'Failed to fetch price data')
+
+    async def historical(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        days = _int_arg(request, 'days', 30)
+        max_points = _int_arg(request, 'max_points')
+        cursor = _int_arg(request, 'cursor', 0)
+        limit = _int_arg(request, 'limit')
+
+        if max_points is not None and max_points < 3:
+            return _error('max_points must be at least 3', 400)
+        if cursor < 0 or (limit is not None and not 0 < limit <= MAX_PAGE_SIZE):
+            return _error(f'cursor must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}', 400)
+
+        payload = None
+        if await self._history(coin_id, days):
+            payload = await self._run(self.service.historical, coin_id, days, max_points, cursor, limit)
+        return self._cached(request, self.service.historical_key(coin_id, days, max_points, cursor, limit),
+                            payload, 'Failed to fetch historical data')
+
+    async def predict(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        timeframe = request.query.get('timeframe', '1h')
+        path_points = _int_arg(request, 'path_points')
+        try:
+            horizons = parse_horizons(request.query.get('horizons'))
+        except ValueError:
+            return _error('horizons must be a comma separated list of integers', 400)
+
+        payload = None
+        if await self._series(self.service.series_source(coin_id, timeframe)):
+            payload = await self._run(self.service.prediction, coin_id, timeframe, horizons, path_points,
+                                      self._budget_ms(request))
+        return self._cached(request, self.service.prediction_key(coin_id, timeframe, horizons, path_points),
+                            payload, 'Failed to fetch data for prediction')
+
+    async def predict_all(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        sources = {self.service.series_source(coin_id, tf) for tf in self.service.predictor.TIMEFRAMES}
+        await asyncio.gather(*(self._series(source) for source in sources))
+
+        payload = await self._run(self.service.all_predictions, coin_id, self._budget_ms(request))
+        return self._cached(request, f'prediction_all_{coin_id}', payload, 'Failed to fetch data for prediction')
+
+    async def analyze(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        payload = None
+        if await self._series(self.service.series_source(coin_id, ANALYSIS_TIMEFRAME)):
+            payload = await self._run(self.service.analysis, coin_id)
+        return self._cached(request, f'analysis_{coin_id}', payload, 'Failed to fetch data')
+
+    async def recommendation(self, request: web.Request) -> web.Response:
+        coin_id = request.match_info['coin_id']
+        timeframe = request.query.get('timeframe', '1h')
+
+        result = None
+        if await self._series(self.service.series_source(coin_id, timeframe)):
+            result = await self._run(self.service.recommendation, coin_id, timeframe, self._budget_ms(request))
+        if result is None:
+            return _error('Failed to fetch data for prediction', 404)
+        return web.json_response(result, dumps=dumps)
+
+
+def create_async_app(service: Optional[PredictionService] = None,
+                     fetcher: Optional[AsyncCryptoDataFetcher] = None) -> web.Application:
+    """Create the aiohttp application serving the read endpoints under ``/api``"""
+    config = get_config()
+    if service is None:
+        service = PredictionService()
+    if fetcher is None:
+        fetcher = AsyncCryptoDataFetcher(config.COINGECKO_BASE_URL, config.BINANCE_BASE_URL,
+                                         max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+                                         kline_concurrency=config.BINANCE_KLINE_CONCURRENCY)
+
+    api = AsyncPredictionAPI(service, fetcher, config.MODEL_WORKERS, config.PREDICTION_BUDGET_MS)
+
+    app = web.Application()
+    app.router.add_get('/api/health', api.health)
+    app.router.add_get('/api/coins', api.coins)
+    app.router.add_get('/api/price/{coin_id}', api.price)
+    app.router.add_get('/api/historical/{coin_id}', api.historical)
+    app.router.add_get('/api/predict/{coin_id}', api.predict)
+    app.router.add_get('/api/predict/{coin_id}/all', api.predict_all)
+    app.router.add_get('/api/analyze/{coin_id}', api.analyze)
+    app.router.add_get('/api/recommendation/{coin_id}', api.recommendation)
+    app.on_cleanup.append(api.close)
+    return app
+
+
+async def async_app() -> web.Application:
+    """Application factory for ``aiohttp.GunicornWebWorker``"""
+    return create_async_app()
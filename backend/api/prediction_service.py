@@ -0,0 +1,566 @@
+"""
+Prediction service shared by the API routes
+
+Owns fetching, model evaluation and caching for each (coin, timeframe),
+so the predict, predict-all, recommendation, analyze, batch and stream
+endpoints are thin views over the same computed artifacts. Each artifact
+is built once per cache lifetime, even when several requests ask for it
+at the same moment, and one endpoint's work warms the others.
+"""
+import threading
+import time
+from datetime import datetime
+from functools import cached_property, lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.data.downsample import downsample_points
+from backend.data.federation import (
+    BINANCE_SYMBOLS, YAHOO_SYMBOLS, SeriesFederation, SeriesRequest, default_sources
+)
+from backend.utils import metrics
+from backend.utils.cache import CacheManager
+from config import get_config
+
+
+# Technical analysis reads the same hourly series as 1h predictions, so RSI,
+# MACD and the moving averages span hours, as on the 30 days of hourly
+# CoinGecko prices it used to be computed from
+ANALYSIS_TIMEFRAME = '1h'
+
+# Newest points technical analysis reads: the 50-period MA, the longest window
+# in ``calculate_technical_indicators``, plus warm-up for EMA_26 and the MACD signal
+ANALYSIS_LOOKBACK = 50 + 26 + 9
+
+# Days of price history ``/historical`` serves by default
+HISTORY_DAYS = 30
+
+# Largest page of historical points per request
+MAX_PAGE_SIZE = 5000
+
+# Cache lifetimes in seconds; series spanning a week or more change slowly
+SERIES_TTL = 60
+LONG_SERIES_TTL = 300
+LONG_SERIES_SPAN = 7 * 86400
+PRICE_TTL = 60
+PREDICTION_TTL = 60
+# Failed upstream fetches are retried after this long; until then requests
+# get the last good value (kept as long as UPSTREAM_STALE_MAX_AGE) or fail fast
+NEGATIVE_TTL = 10
+ANALYSIS_TTL = 300
+COINS_TTL = 3600
+
+# Popular coins for quick access
+POPULAR_COINS = [
+    {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+    {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+    {'id': 'binancecoin', 'symbol': 'bnb', 'name': 'Binance Coin'},
+    {'id': 'cardano', 'symbol': 'ada', 'name': 'Cardano'},
+    {'id': 'solana', 'symbol': 'sol', 'name': 'Solana'},
+    {'id': 'ripple', 'symbol': 'xrp', 'name': 'XRP'},
+]
+
+
+class _Flight:
+    """A build in progress that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class PredictionService:
+    """
+    Fetch, evaluate and cache prediction artifacts
+
+    Components that are not passed in are created on first use, so the
+    upstream clients, pandas, sklearn and statsmodels are only imported by
+    the first request that needs them rather than at worker start-up.
+    """
+
+    def __init__(self, data_fetcher=None, preprocessor=None, predictor=None, cache=None):
+        if data_fetcher is not None:
+            self.data_fetcher = data_fetcher
+        if preprocessor is not None:
+            self.preprocessor = preprocessor
+        if predictor is not None:
+            self.predictor = predictor
+        self.cache = cache if cache is not None else CacheManager()
+        # Pre-fork snapshot of series fetched by the master, see ``warmup``
+        self.warm_store = None
+        # Last good upstream value and its fetch time per cache key, for outages
+        self._last_good = {}
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    @cached_property
+    def data_fetcher(self):
+        from backend.data.crypto_api import CryptoDataFetcher
+        from backend.data.recording import Recorder
+        config = get_config()
+        return CryptoDataFetcher(config.COINGECKO_BASE_URL, config.BINANCE_BASE_URL,
+                                 Recorder.from_config(config), config.BINANCE_KLINE_CONCURRENCY)
+
+    @cached_property
+    def yahoo(self):
+        """yfinance client, None when yfinance is not installed"""
+        try:
+            from services.crypto_data import CryptoDataService
+        except ImportError:
+            return None
+        return CryptoDataService()
+
+    @cached_property
+    def federation(self) -> SeriesFederation:
+        # Clients are looked up on every fetch, so replacing ``data_fetcher`` takes effect
+        return SeriesFederation(default_sources(lambda: self.data_fetcher, lambda: self.yahoo))
+
+    @cached_property
+    def preprocessor(self):
+        from backend.data.preprocessor import DataPreprocessor
+        return DataPreprocessor()
+
+    @cached_property
+    def predictor(self):
+        from backend.models.predictor import MultiTimeframePredictor
+        return MultiTimeframePredictor()
+
+    # Cache keys
+
+    @staticmethod
+    def prediction_key(coin_id: str, timeframe: str, horizons: Optional[List[int]] = None,
+                       path_points: Optional[int] = None) -> str:
+        """Cache key for a prediction, including any custom horizons"""
+        cache_key = f'prediction_{coin_id}_{timeframe}'
+        if horizons or path_points:
+            cache_key += f"_{','.join(map(str, horizons or []))}_{path_points or 0}"
+        return cache_key
+
+    @staticmethod
+    def series_key(source: tuple) -> str:
+        return 'series_' + '_'.join(map(str, source))
+
+    @staticmethod
+    def history_key(coin_id: str, days: int) -> str:
+        """Cache key for CoinGecko price history, served as is by ``historical``"""
+        return f'history_{coin_id}_{days}'
+
+    # Shared building blocks
+
+    def _load(self, cache_key: str, build: Callable):
+        """
+        Cached value for ``cache_key``, building it on a miss
+
+        Concurrent misses for the same key wait for a single build instead
+        of repeating it. ``build`` is responsible for storing its result.
+        """
+        cached = self.cache.get(cache_key)
+        if cached:
+            return cached
+
+        with self._inflight_lock:
+            flight = self._inflight.get(cache_key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[cache_key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            return flight.value
+
+        try:
+            flight.value = build()
+        finally:
+            with self._inflight_lock:
+                del self._inflight[cache_key]
+            flight.done.set()
+        return flight.value
+
+    def _load_budgeted(self, cache_key: str, build: Callable) -> Optional[Dict]:
+        """
+        ``_load`` for payloads built within a caller's latency budget
+
+        The budget is not part of ``cache_key``, so ``build`` must not cache
+        degraded payloads. A degraded payload built for another request's
+        budget is not shared either: this caller builds with its own.
+        """
+        built = []
+
+        def build_once():
+            built.append(True)
+            return build()
+
+        result = self._load(cache_key, build_once)
+        if result and not built and is_degraded(result):
+            result = build()
+        return result
+
+    def fetch_fresh(self, cache_key: str, fetch: Callable, ttl: int):
+        """
+        Upstream value from ``fetch``, stored under ``cache_key`` for ``ttl`` seconds
+
+        A failed fetch is remembered under ``failed_<cache_key>`` for
+        ``NEGATIVE_TTL`` seconds, so requests in that window do not wait on
+        the failing upstream again. Meanwhile the last good value, if it is
+        recent enough, is served and cached as briefly (dicts are marked
+        ``stale``); without one the failure result is returned.
+        """
+        failed_key = f'failed_{cache_key}'
+        data = None
+        if self.cache.peek(failed_key) is None:
+            data = fetch()
+            if data:
+                self.cache.set(cache_key, data, ttl=ttl)
+                self.remember(cache_key, data)
+                return data
+            self.cache.set(failed_key, True, ttl=NEGATIVE_TTL)
+        else:
+            metrics.inc('upstream_fallbacks_total', kind='negative')
+
+        stale = self._stale(cache_key)
+        if stale is None:
+            return data
+        metrics.inc('upstream_fallbacks_total', kind='stale')
+        self.cache.set(cache_key, stale, ttl=NEGATIVE_TTL)
+        return stale
+
+    def remember(self, cache_key: str, data):
+        """Keep ``data``, just fetched, as the value served for ``cache_key`` during outages"""
+        self._last_good[cache_key] = (data, time.time())
+
+    def _stale(self, cache_key: str):
+        """Last good value for ``cache_key`` within ``UPSTREAM_STALE_MAX_AGE``, else None"""
+        last = self._last_good.get(cache_key)
+        if last is None:
+            return None
+        data, fetched = last
+        if time.time() - fetched > get_config().UPSTREAM_STALE_MAX_AGE:
+            self._last_good.pop(cache_key, None)
+            return None
+        return dict(data, stale=True) if isinstance(data, dict) else data
+
+    def derived_ttl(self, source_key: str, default: int) -> int:
+        """TTL for a value derived from another cache entry, so both expire together"""
+        entry = self.cache.peek(source_key)
+        ttl = entry.ttl_remaining() if entry is not None else None
+        return max(1, min(default, int(ttl))) if ttl is not None else default
+
+    def series_source(self, coin_id: str, timeframe: str) -> SeriesRequest:
+        """Candle series that feeds a timeframe (unknown timeframes read the daily one)"""
+        plan = plan_series()
+        interval, window = plan.get(timeframe, plan['daily'])
+        return SeriesRequest(coin_id, interval, window)
+
+    def _fetch_warm(self, cache_key: str, warm_key: tuple, fetch: Callable, ttl: int):
+        """``fetch_fresh``, unless the pre-fork warm-up stored the value under ``warm_key``"""
+        warm = self.warm_store.get(warm_key, ttl) if self.warm_store is not None else None
+        if warm is None:
+            return self.fetch_fresh(cache_key, fetch, ttl)
+        # Still fresh from the pre-fork warm-up
+        data, remaining = warm
+        if data:
+            self.cache.set(cache_key, data, ttl=max(1, int(remaining)))
+            self.remember(cache_key, data)
+        return data
+
+    def fetch_series(self, source: SeriesRequest) -> List[dict]:
+        """Candles for a ``series_source``, fetched once per TTL from the best available provider"""
+        cache_key = self.series_key(source)
+        return self._load(cache_key, lambda: self._fetch_warm(
+            cache_key, source, lambda: self.fetch_upstream(source), series_ttl(source)))
+
+    def fetch_upstream(self, source: SeriesRequest) -> List[dict]:
+        """Fetch a ``series_source`` through the federation, bypassing the cache"""
+        return self.federation.fetch(source)
+
+    def series(self, coin_id: str, timeframe: str) -> List[dict]:
+        return self.fetch_series(self.series_source(coin_id, timeframe))
+
+    # Artifacts
+
+    def coins(self) -> Dict:
+        """Popular and top coins"""
+        def build():
+            result = {
+                'popular': POPULAR_COINS,
+                'all': self.data_fetcher.get_supported_coins()[:100]
+            }
+            self.cache.set('supported_coins', result, ttl=COINS_TTL)
+            return result
+
+        return self._load('supported_coins', build)
+
+    def supported(self, coin_id: str) -> bool:
+        """Whether ``coin_id`` is a coin with a candle source or in the supported coins list"""
+        if coin_id in BINANCE_SYMBOLS or coin_id in YAHOO_SYMBOLS:
+            return True
+        coins = self.coins() or {}
+        return any(coin['id'] == coin_id for coin in coins.get('all', []))
+
+    def price(self, coin_id: str) -> Optional[Dict]:
+        """Current price for a coin"""
+        cache_key = f'price_{coin_id}'
+
+        def build():
+            return self.fetch_fresh(cache_key, lambda: self.data_fetcher.get_current_price(coin_id), PRICE_TTL)
+
+        return self._load(cache_key, build)
+
+    @staticmethod
+    def historical_key(coin_id: str, days: int, max_points: Optional[int] = None,
+                       cursor: int = 0, limit: Optional[int] = None) -> str:
+        """Cache key for one page of historical data"""
+        cache_key = f'historical_{coin_id}_{days}'
+        if max_points or cursor or limit:
+            cache_key += f'_{max_points or 0}_{cursor}_{limit or 0}'
+        return cache_key
+
+    def history(self, coin_id: str, days: int) -> List[dict]:
+        """CoinGecko price history (price, volume and market cap per point), fetched once per TTL"""
+        cache_key = self.history_key(coin_id, days)
+        return self._load(cache_key, lambda: self._fetch_warm(
+            cache_key, ('history', coin_id, days), lambda: self.fetch_history(coin_id, days), LONG_SERIES_TTL))
+
+    def fetch_history(self, coin_id: str, days: int) -> List[dict]:
+        """Fetch CoinGecko price history, bypassing the cache"""
+        return self.data_fetcher.get_historical_data(coin_id, days)
+
+    def historical_series(self, coin_id: str, days: int, max_points: Optional[int] = None) -> List[dict]:
+        """Historical points, LTTB-downsampled to ``max_points``, cached per resolution"""
+        if not max_points:
+            return self.history(coin_id, days)
+
+        cache_key = f'{self.history_key(coin_id, days)}_lttb{max_points}'
+
+        def build():
+            data = downsample_points(self.history(coin_id, days) or [], max_points)
+            if data:
+                self.cache.set(cache_key, data, ttl=self.derived_ttl(self.history_key(coin_id, days), LONG_SERIES_TTL))
+            return data
+
+        return self._load(cache_key, build)
+
+    def historical(self, coin_id: str, days: int, max_points: Optional[int] = None,
+                   cursor: int = 0, limit: Optional[int] = None) -> Optional[Dict]:
+        """One page of historical prices for a coin over ``days``"""
+        cache_key = self.historical_key(coin_id, days, max_points, cursor, limit)
+
+        def build():
+            data = self.historical_series(coin_id, days, max_points)
+            if not data:
+                return None
+
+            result = {'coin_id': coin_id, 'days': days}
+            if max_points:
+                result['max_points'] = max_points
+
+            if cursor or limit:
+                end = cursor + limit if limit else len(data)
+                result['total'] = len(data)
+                result['next_cursor'] = end if end < len(data) else None
+                data = data[cursor:end]
+            result['data'] = data
+
+            # Pages expire together with the series they were cut from
+            series_key = self.history_key(coin_id, days)
+            if max_points:
+                series_key += f'_lttb{max_points}'
+            self.cache.set(cache_key, result, ttl=self.derived_ttl(series_key, LONG_SERIES_TTL))
+            return result
+
+        return self._load(cache_key, build)
+
+    def prediction(self, coin_id: str, timeframe: str, horizons: Optional[List[int]] = None,
+                   path_points: Optional[int] = None, budget_ms: Optional[float] = None,
+                   deadline: Optional[float] = None) -> Optional[Dict]:
+        """Prediction for a (coin, timeframe), or None if its data could not be fetched"""
+        cache_key = self.prediction_key(coin_id, timeframe, horizons, path_points)
+
+        def build():
+            data = self.series(coin_id, timeframe)
+            if not data:
+                return None
+
+            prediction = self.predictor.predict_for_timeframe(
+                data, timeframe, horizons, path_points, budget_ms, deadline
+            )
+            result = {
+                'coin_id': coin_id,
+                'prediction': prediction
+            }
+
+            # Budget-skipped predictions are served to their own request only
+            if not is_degraded(result):
+                self.cache.set(cache_key, result, ttl=PREDICTION_TTL)
+            return result
+
+        return self._load_budgeted(cache_key, build)
+
+    def all_predictions(self, coin_id: str, budget_ms: Optional[float] = None) -> Dict:
+        """
+        Predictions for every timeframe of a coin
+
+        Built from the per-timeframe prediction artifacts, so it reuses and
+        warms the same entries ``/predict/<coin_id>`` serves.
+        """
+        cache_key = f'prediction_all_{coin_id}'
+
+        def build():
+            # One latency budget shared by every timeframe that has to be computed
+            deadline = time.perf_counter() + budget_ms / 1000.0 if budget_ms is not None else None
+            predictions = {}
+            ttl = PREDICTION_TTL
+            for timeframe in self.predictor.TIMEFRAMES:
+                result = self.prediction(coin_id, timeframe, deadline=deadline)
+                if result is None:
+                    predictions[timeframe] = {'error': 'Failed to fetch data for prediction'}
+                    # Retried as soon as the failed fetch is, not a whole prediction TTL later
+                    ttl = min(ttl, NEGATIVE_TTL)
+                    continue
+                predictions[timeframe] = result['prediction']
+                ttl = min(ttl, self.derived_ttl(self.prediction_key(coin_id, timeframe), PREDICTION_TTL))
+
+            result = {
+                'coin_id': coin_id,
+                'predictions': predictions
+            }
+            if not is_degraded(result):
+                self.cache.set(cache_key, result, ttl=ttl)
+            return result
+
+        return self._load_budgeted(cache_key, build)
+
+    def recommendation(self, coin_id: str, timeframe: str, budget_ms: Optional[float] = None) -> Optional[Dict]:
+        """Trading recommendation, a view of the cached prediction"""
+        result = self.prediction(coin_id, timeframe, budget_ms=budget_ms)
+        if result is None:
+            return None
+
+        prediction = result['prediction']
+        entry = self.cache.peek(self.prediction_key(coin_id, timeframe))
+        recommendation = {
+            'coin_id': coin_id,
+            'timeframe': timeframe,
+            'recommendation': prediction.get('recommendation', {}),
+            'current_price': prediction.get('current_price'),
+            'timestamp': datetime.fromtimestamp(entry.created).isoformat() if entry is not None else None
+        }
+        if 'error' in prediction:
+            recommendation['error'] = prediction['error']
+        return recommendation
+
+    def analysis(self, coin_id: str) -> Optional[Dict]:
+        """Technical indicator snapshot, computed from the hourly prediction series"""
+        cache_key = f'analysis_{coin_id}'
+        source = self.series_source(coin_id, ANALYSIS_TIMEFRAME)
+
+        def build():
+            data = self.fetch_series(source)
+            if not data:
+                return None
+
+            # Calculate technical indicators
+            df = self.preprocessor.calculate_technical_indicators(data[-ANALYSIS_LOOKBACK:])
+            if df.empty:
+                return None
+
+            # Get latest values
+            import pandas as pd
+            latest = df.iloc[-1]
+
+            def indicator(name):
+                value = latest.get(name)
+                return None if value is None or pd.isna(value) else value
+
+            result = {
+                'coin_id': coin_id,
+                'current_price': indicator('close') or 0,
+                'indicators': {
+                    'MA_7': indicator('MA_7'),
+                    'MA_25': indicator('MA_25'),
+                    'RSI': indicator('RSI'),
+                    'MACD': indicator('MACD'),
+                    'Volatility': indicator('Volatility'),
+                },
+                'technical_analysis': interpret_indicators(latest)
+            }
+
+            self.cache.set(cache_key, result, ttl=self.derived_ttl(self.series_key(source), ANALYSIS_TTL))
+            return result
+
+        return self._load(cache_key, build)
+
+
+@lru_cache(maxsize=None)
+def plan_series() -> Dict[str, Tuple[str, int]]:
+    """
+    Candle interval and window each timeframe is predicted from
+
+    Timeframes read the interval ``MultiTimeframePredictor.TIMEFRAMES``
+    configures for them. Each interval is fetched as one series, as long as
+    its most demanding reader needs: the estimators of every timeframe on
+    it and, for ``ANALYSIS_TIMEFRAME``, technical analysis. Timeframes on
+    an interval share the fetch and each reader takes the newest points it
+    declared.
+    """
+    from backend.models.predictor import MultiTimeframePredictor
+    timeframes = MultiTimeframePredictor.TIMEFRAMES
+
+    windows = {}
+    for timeframe, config in timeframes.items():
+        needed = max(MultiTimeframePredictor.lookbacks(timeframe).values())
+        if timeframe == ANALYSIS_TIMEFRAME:
+            needed = max(needed, ANALYSIS_LOOKBACK)
+        windows[config['interval']] = max(windows.get(config['interval'], 0), needed)
+    return {timeframe: (config['interval'], windows[config['interval']]) for timeframe, config in timeframes.items()}
+
+
+def series_ttl(source: SeriesRequest) -> int:
+    """Cache lifetime of a candle series"""
+    return LONG_SERIES_TTL if source.span >= LONG_SERIES_SPAN else SERIES_TTL
+
+
+def is_degraded(result: Dict) -> bool:
+    """Whether a prediction or ``all_predictions`` payload skipped estimators to meet a budget"""
+    predictions = result.get('predictions') or {'': result.get('prediction') or {}}
+    return any(prediction.get('components', {}).get('degraded') for prediction in predictions.values())
+
+
+def parse_horizons(value: Optional[str]) -> Optional[List[int]]:
+    """Parse a ``horizons=1,7,30`` query value into a sorted list of ints"""
+    if not value:
+        return None
+    return sorted({int(part) for part in value.split(',') if part.strip()})
+
+
+def interpret_indicators(data) -> Dict:
+    """Interpret technical indicators"""
+    import pandas as pd
+    interpretation = {}
+
+    # RSI interpretation
+    rsi = data.get('RSI')
+    if rsi and not pd.isna(rsi):
+        if rsi > 70:
+            interpretation['RSI'] = 'Overbought - Consider selling'
+        elif rsi < 30:
+            interpretation['RSI'] = 'Oversold - Consider buying'
+        else:
+            interpretation['RSI'] = 'Neutral'
+
+    # Moving average cross
+    ma_7 = data.get('MA_7')
+    ma_25 = data.get('MA_25')
+    if ma_7 and ma_25 and not pd.isna(ma_7) and not pd.isna(ma_25):
+        if ma_7 > ma_25:
+            interpretation['MA_Cross'] = 'Bullish - Short MA above long MA'
+        else:
+            interpretation['MA_Cross'] = 'Bearish - Short MA below long MA'
+
+    # MACD
+    macd = data.get('MACD')
+    if macd and not pd.isna(macd):
+        if macd > 0:
+            interpretation['MACD'] = 'Bullish momentum'
+        else:
+            interpretation['MACD'] = 'Bearish momentum'
+
+    return interpretation
@@ -1,21 +1,68 @@
 """
 API routes for crypto prediction service
 """
-import pandas as pd
-from flask import Blueprint, jsonify, request
-from backend.data.crypto_api import CryptoDataFetcher
-from backend.data.preprocessor import DataPreprocessor
-from backend.models.predictor import MultiTimeframePredictor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+from backend.api.prediction_service import MAX_PAGE_SIZE, PredictionService, parse_horizons
+from backend.api.stream import StreamHub, format_event
+from backend.utils import metrics
+from backend.utils.admission import AdmissionController, AdmissionRejected
 from backend.utils.cache import CacheManager
+from backend.utils.response_cache import cached_response
+from backend.utils.timing import span
+from config import get_config
 import traceback
 
 api_bp = Blueprint('api', __name__)
 
-# Initialize services
-data_fetcher = CryptoDataFetcher()
-preprocessor = DataPreprocessor()
-predictor = MultiTimeframePredictor()
+# Maximum number of (coin, timeframe) pairs in one batch request
+MAX_BATCH_SIZE = 50
+
+# Threads shared by the fetches and model runs of one batch request
+BATCH_WORKERS = 4
+
+# Seconds between keep-alive comments on idle event streams
+STREAM_HEARTBEAT = 15
+
+# Initialize services (clients and models are created on first use)
 cache = CacheManager()
+service = PredictionService(cache=cache)
+metrics.track_cache(cache)
+
+
+@api_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of every worker of this server"""
+    return Response(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_bp.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Recent request profiles of this server, newest first"""
+    profiler = current_app.extensions.get('profiler')
+    if profiler is None:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not profiler.authorized(request.headers.get('X-Profile')):
+        return jsonify({'error': 'Missing or invalid X-Profile token'}), 403
+    
+    limit = request.args.get('limit', default=50, type=int)
+    return jsonify({'format': profiler.format, 'profiles': profiler.profiles(limit)})
+
+
+@api_bp.route('/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download one profile listed by ``/profiles``"""
+    profiler = current_app.extensions.get('profiler')
+    if profiler is None:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not profiler.authorized(request.headers.get('X-Profile')):
+        return jsonify({'error': 'Missing or invalid X-Profile token'}), 403
+    
+    path = profiler.path_of(name)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    mimetype = 'text/plain' if name.endswith('.collapsed') else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=name)
 
 
 @api_bp.route('/health', methods=['GET'])
@@ -28,34 +75,63 @@ def health_check():
     })
 
 
+def _cached_response(cache_key, build, endpoint_class='upstream', cost=1):
+    """
+    Serve a cached payload from its pre-encoded body, building it on a miss
+
+    ``build`` stores its payload under ``cache_key`` and returns it, or a
+    falsy value when the data could not be fetched (-> None here). Misses
+    go through admission control and may be answered with 429/503.
+    """
+    with span('cache'):
+        # A miss is counted by the service's own lookup in ``build``
+        entry = cache.get_entry(cache_key, record_miss=False)
+    if entry is None:
+        try:
+            with _admission().admit(_client_id(), endpoint_class, cost):
+                payload = build()
+        except AdmissionRejected as e:
+            return _rejected(e)
+        if not payload:
+            return None
+        entry = cache.peek(cache_key)
+        if entry is None:
+            return jsonify(payload)
+    
+    return cached_response(entry)
+
+
+def _admission():
+    """The app's admission controller, created from its config on first use"""
+    controller = current_app.extensions.get('admission')
+    if controller is None:
+        controller = current_app.extensions['admission'] = AdmissionController.from_config(current_app.config)
+    return controller
+
+
+def _client_id():
+    """
+    Rate limit key for the current client
+
+    The peer address; behind ``TRUSTED_PROXIES`` reverse proxies,
+    ``ProxyFix`` has already replaced it with the address they forwarded.
+    """
+    return request.remote_addr or 'unknown'
+
+
+def _rejected(error):
+    """Fast 429/503 answer for a request turned away by admission control"""
+    response = jsonify({'error': error.message})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 @api_bp.route('/coins', methods=['GET'])
 def get_supported_coins():
     """Get list of supported cryptocurrencies"""
     try:
-        # Check cache first
-        cached = cache.get('supported_coins')
-        if cached:
-            return jsonify(cached)
-        
-        coins = data_fetcher.get_supported_coins()
-        
-        # Popular coins for quick access
-        popular = [
-            {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
-            {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
-            {'id': 'binancecoin', 'symbol': 'bnb', 'name': 'Binance Coin'},
-            {'id': 'cardano', 'symbol': 'ada', 'name': 'Cardano'},
-            {'id': 'solana', 'symbol': 'sol', 'name': 'Solana'},
-            {'id': 'ripple', 'symbol': 'xrp', 'name': 'XRP'},
-        ]
-        
-        result = {
-            'popular': popular,
-            'all': coins[:100]
-        }
-        
-        cache.set('supported_coins', result, ttl=3600)
-        return jsonify(result)
+        return _cached_response('supported_coins', service.coins)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -64,38 +140,42 @@ def get_supported_coins():
 def get_current_price(coin_id):
     """Get current price for a cryptocurrency"""
     try:
-        cache_key = f'price_{coin_id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        data = data_fetcher.get_current_price(coin_id)
-        if not data:
+        response = _cached_response(f'price_{coin_id}', lambda: service.price(coin_id))
+        if response is None:
             return jsonify({'error': 'Failed to fetch price data'}), 404
         
-        cache.set(cache_key, data, ttl=60)
-        return jsonify(data)
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @api_bp.route('/historical/<coin_id>', methods=['GET'])
 def get_historical_data(coin_id):
-    """Get historical price data"""
+    """
+    Get historical price data
+
+    ``max_points`` downsamples the series with LTTB, keeping its visual
+    shape; ``cursor``/``limit`` page through the (downsampled) points.
+    """
     try:
         days = request.args.get('days', default=30, type=int)
-        
-        cache_key = f'historical_{coin_id}_{days}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        data = data_fetcher.get_historical_data(coin_id, days)
-        if not data:
+        max_points = request.args.get('max_points', type=int)
+        cursor = request.args.get('cursor', default=0, type=int)
+        limit = request.args.get('limit', type=int)
+        
+        if max_points is not None and max_points < 3:
+            return jsonify({'error': 'max_points must be at least 3'}), 400
+        if cursor < 0 or (limit is not None and not 0 < limit <= MAX_PAGE_SIZE):
+            return jsonify({'error': f'cursor must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}'}), 400
+        
+        response = _cached_response(
+            service.historical_key(coin_id, days, max_points, cursor, limit),
+            lambda: service.historical(coin_id, days, max_points, cursor, limit)
+        )
+        if response is None:
             return jsonify({'error': 'Failed to fetch historical data'}), 404
         
-        cache.set(cache_key, data, ttl=300)
-        return jsonify({'coin_id': coin_id, 'days': days, 'data': data})
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -105,218 +185,248 @@ def predict_price(coin_id):
     """Generate price predictions for all timeframes"""
     try:
         timeframe = request.args.get('timeframe', default='1h', type=str)
-        
-        cache_key = f'prediction_{coin_id}_{timeframe}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        # Fetch data based on timeframe
-        if timeframe in ['1m', '5m', '10m', '30m', '1h']:
-            # Use Binance for short timeframes
-            symbol_map = {
-                'bitcoin': 'BTCUSDT',
-                'ethereum': 'ETHUSDT',
-                'binancecoin': 'BNBUSDT',
-                'cardano': 'ADAUSDT',
-                'solana': 'SOLUSDT',
-                'ripple': 'XRPUSDT'
-            }
-            binance_symbol = symbol_map.get(coin_id, 'BTCUSDT')
-            
-            interval_map = {
-                '1m': '1m',
-                '5m': '5m',
-                '10m': '5m',
-                '30m': '30m',
-                '1h': '1h'
-            }
-            interval = interval_map.get(timeframe, '1h')
-            
-            data = data_fetcher.get_binance_klines(binance_symbol, interval, 100)
-        else:
-            # Use CoinGecko for longer timeframes
-            days_map = {
-                'daily': 30,
-                'monthly': 90,
-                'yearly': 365
-            }
-            days = days_map.get(timeframe, 30)
-            data = data_fetcher.get_historical_data(coin_id, days)
-        
-        if not data:
+        path_points = request.args.get('path_points', type=int)
+        budget_ms = _budget_ms()
+        try:
+            horizons = parse_horizons(request.args.get('horizons'))
+        except ValueError:
+            return jsonify({'error': 'horizons must be a comma separated list of integers'}), 400
+        
+        response = _cached_response(
+            service.prediction_key(coin_id, timeframe, horizons, path_points),
+            lambda: service.prediction(coin_id, timeframe, horizons, path_points, budget_ms),
+            'model'
+        )
+        if response is None:
             return jsonify({'error': 'Failed to fetch data for prediction'}), 404
         
-        # Generate prediction
-        prediction = predictor.predict_for_timeframe(data, timeframe)
-        
-        result = {
-            'coin_id': coin_id,
-            'prediction': prediction
-        }
-        
-        cache.set(cache_key, result, ttl=60)
-        return jsonify(result)
+        return response
     except Exception as e:
         print(f"Prediction error: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+def _budget_ms():
+    """Latency budget for model work: ``budget_ms`` query arg or app config"""
+    budget = request.args.get('budget_ms', type=float)
+    if budget is None:
+        budget = current_app.config.get('PREDICTION_BUDGET_MS')
+    return budget if budget and budget > 0 else None
+
+
 @api_bp.route('/predict/<coin_id>/all', methods=['GET'])
 def predict_all_timeframes(coin_id):
     """Generate predictions for all timeframes"""
     try:
-        cache_key = f'prediction_all_{coin_id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        # Fetch data for different timeframes
-        historical_data = {}
-        
-        # Short timeframes from Binance
-        symbol_map = {
-            'bitcoin': 'BTCUSDT',
-            'ethereum': 'ETHUSDT',
-            'binancecoin': 'BNBUSDT',
-            'cardano': 'ADAUSDT',
-            'solana': 'SOLUSDT',
-            'ripple': 'XRPUSDT'
-        }
-        binance_symbol = symbol_map.get(coin_id, 'BTCUSDT')
-        
-        for tf in ['1m', '5m', '30m', '1h']:
-            interval_map = {'1m': '1m', '5m': '5m', '30m': '30m', '1h': '1h', '10m': '5m'}
-            data = data_fetcher.get_binance_klines(binance_symbol, interval_map[tf], 100)
-            historical_data[tf] = data
-        
-        # Long timeframes from CoinGecko
-        for tf, days in [('daily', 30), ('monthly', 90), ('yearly', 365)]:
-            data = data_fetcher.get_historical_data(coin_id, days)
-            historical_data[tf] = data
-        
-        # Generate predictions for all timeframes
-        predictions = predictor.predict_all_timeframes(historical_data)
-        
-        result = {
-            'coin_id': coin_id,
-            'predictions': predictions
-        }
-        
-        cache.set(cache_key, result, ttl=120)
-        return jsonify(result)
+        budget_ms = _budget_ms()
+        # One token per timeframe the model may have to evaluate
+        return _cached_response(f'prediction_all_{coin_id}',
+                                lambda: service.all_predictions(coin_id, budget_ms),
+                                'model', cost=len(service.predictor.TIMEFRAMES))
     except Exception as e:
         print(f"All timeframes prediction error: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Generate predictions for many (coin, timeframe) pairs in one call
+
+    Expects ``{"requests": [{"coin_id": "bitcoin", "timeframe": "1h"}, ...]}``
+    and streams one JSON object per line as each pair completes. Pairs fed
+    by the same upstream request share one fetch, and results are cached
+    under the same keys as ``/predict/<coin_id>``.
+    """
+    try:
+        pairs = _parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    release = None
+    pending = sum(1 for pair in pairs if cache.peek(service.prediction_key(*pair)) is None)
+    if pending:
+        try:
+            release = _admission().acquire(_client_id(), 'model', cost=pending)
+        except AdmissionRejected as e:
+            return _rejected(e)
+    
+    budget_ms = _budget_ms()
+    response = Response(stream_with_context(_run_batch(pairs, budget_ms)),
+                        mimetype='application/x-ndjson')
+    if release is not None:
+        # The slot is held until the whole stream has been sent
+        response.call_on_close(release)
+    return response
+
+
+def _parse_batch(body):
+    """Validate a batch body into an ordered, de-duplicated list of pairs"""
+    items = body.get('requests') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError('Body must contain a non-empty "requests" list')
+    
+    pairs = []
+    for item in items:
+        if isinstance(item, dict):
+            pair = (item.get('coin_id'), item.get('timeframe', '1h'))
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            pair = tuple(item)
+        else:
+            raise ValueError(f'Invalid batch entry: {item!r}')
+        
+        if not isinstance(pair[0], str) or not pair[0]:
+            raise ValueError(f'Missing coin_id in batch entry: {item!r}')
+        if pair[1] not in service.predictor.TIMEFRAMES:
+            raise ValueError(f'Invalid timeframe: {pair[1]}')
+        if pair not in pairs:
+            pairs.append(pair)
+    
+    if len(pairs) > MAX_BATCH_SIZE:
+        raise ValueError(f'At most {MAX_BATCH_SIZE} pairs per batch')
+    return pairs
+
+
+def _run_batch(pairs, budget_ms):
+    """Yield NDJSON lines for each pair, cache hits first, then as completed"""
+    pending = []
+    for coin_id, timeframe in pairs:
+        entry = cache.get_entry(service.prediction_key(coin_id, timeframe), record_miss=False)
+        if entry is not None and entry.value:
+            yield _ndjson(dict(entry.value, timeframe=timeframe))
+        else:
+            pending.append((coin_id, timeframe))
+    
+    if not pending:
+        return
+    
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        # Every fetch is queued before any model run, so a model run that
+        # waits on its series never holds a worker its fetch still needs
+        fetches = {}
+        for coin_id, timeframe in pending:
+            source = service.series_source(coin_id, timeframe)
+            if source not in fetches:
+                fetches[source] = executor.submit(service.fetch_series, source)
+        
+        futures = {
+            executor.submit(_predict_pair, coin_id, timeframe,
+                            fetches[service.series_source(coin_id, timeframe)], budget_ms): (coin_id, timeframe)
+            for coin_id, timeframe in pending
+        }
+        
+        for future in as_completed(futures):
+            coin_id, timeframe = futures[future]
+            try:
+                yield _ndjson(future.result())
+            except Exception as e:
+                print(f"Batch prediction error for {coin_id}/{timeframe}: {e}")
+                yield _ndjson({'coin_id': coin_id, 'timeframe': timeframe, 'error': str(e)})
+
+
+def _predict_pair(coin_id, timeframe, fetch, budget_ms):
+    """Run the model for one batch pair once its shared series has arrived"""
+    if not fetch.result():
+        return {'coin_id': coin_id, 'timeframe': timeframe, 'error': 'Failed to fetch data for prediction'}
+    
+    result = service.prediction(coin_id, timeframe, budget_ms=budget_ms)
+    if result is None:
+        return {'coin_id': coin_id, 'timeframe': timeframe, 'error': 'Failed to fetch data for prediction'}
+    return dict(result, timeframe=timeframe)
+
+
+def _ndjson(payload):
+    """Encode one line of a newline delimited JSON stream"""
+    return current_app.json.dumps(payload) + '\n'
+
+
 @api_bp.route('/analyze/<coin_id>', methods=['GET'])
 def analyze_coin(coin_id):
     """Comprehensive analysis with technical indicators"""
     try:
-        cache_key = f'analysis_{coin_id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        # Get historical data
-        data = data_fetcher.get_historical_data(coin_id, 30)
-        if not data:
+        response = _cached_response(f'analysis_{coin_id}', lambda: service.analysis(coin_id), 'model')
+        if response is None:
             return jsonify({'error': 'Failed to fetch data'}), 404
         
-        # Calculate technical indicators
-        df = preprocessor.calculate_technical_indicators(data)
-        
-        # Get latest values
-        latest = df.iloc[-1] if not df.empty else {}
-        
-        result = {
-            'coin_id': coin_id,
-            'current_price': float(latest.get('close', 0)) if latest else 0,
-            'indicators': {
-                'MA_7': float(latest.get('MA_7', 0)) if latest and not pd.isna(latest.get('MA_7')) else None,
-                'MA_25': float(latest.get('MA_25', 0)) if latest and not pd.isna(latest.get('MA_25')) else None,
-                'RSI': float(latest.get('RSI', 50)) if latest and not pd.isna(latest.get('RSI')) else None,
-                'MACD': float(latest.get('MACD', 0)) if latest and not pd.isna(latest.get('MACD')) else None,
-                'Volatility': float(latest.get('Volatility', 0)) if latest and not pd.isna(latest.get('Volatility')) else None,
-            },
-            'technical_analysis': self._interpret_indicators(latest) if latest else {}
-        }
-        
-        cache.set(cache_key, result, ttl=300)
-        return jsonify(result)
+        return response
     except Exception as e:
         print(f"Analysis error: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 
-def _interpret_indicators(data):
-    """Interpret technical indicators"""
-    interpretation = {}
-    
-    # RSI interpretation
-    rsi = data.get('RSI')
-    if rsi and not pd.isna(rsi):
-        if rsi > 70:
-            interpretation['RSI'] = 'Overbought - Consider selling'
-        elif rsi < 30:
-            interpretation['RSI'] = 'Oversold - Consider buying'
-        else:
-            interpretation['RSI'] = 'Neutral'
-    
-    # Moving average cross
-    ma_7 = data.get('MA_7')
-    ma_25 = data.get('MA_25')
-    if ma_7 and ma_25 and not pd.isna(ma_7) and not pd.isna(ma_25):
-        if ma_7 > ma_25:
-            interpretation['MA_Cross'] = 'Bullish - Short MA above long MA'
-        else:
-            interpretation['MA_Cross'] = 'Bearish - Short MA below long MA'
-    
-    # MACD
-    macd = data.get('MACD')
-    if macd and not pd.isna(macd):
-        if macd > 0:
-            interpretation['MACD'] = 'Bullish momentum'
-        else:
-            interpretation['MACD'] = 'Bearish momentum'
-    
-    return interpretation
-
-
 @api_bp.route('/recommendation/<coin_id>', methods=['GET'])
 def get_recommendation(coin_id):
-    """Get trading recommendation"""
+    """
+    Get trading recommendation
+
+    A view of the ``/predict/<coin_id>`` result for the same timeframe,
+    served from (and warming) the same cached prediction.
+    """
     try:
         timeframe = request.args.get('timeframe', default='1h', type=str)
         
-        cache_key = f'recommendation_{coin_id}_{timeframe}'
-        cached = cache.get(cache_key)
-        if cached:
-            return jsonify(cached)
-        
-        # Get prediction
-        prediction_response = predict_price(coin_id)
-        if prediction_response[1] != 200:
-            return prediction_response
-        
-        prediction_data = prediction_response[0].get_json()
-        prediction = prediction_data.get('prediction', {})
-        
-        recommendation = prediction.get('recommendation', {})
+        if cache.peek(service.prediction_key(coin_id, timeframe)) is not None:
+            result = service.recommendation(coin_id, timeframe)
+        else:
+            try:
+                with _admission().admit(_client_id(), 'model'):
+                    result = service.recommendation(coin_id, timeframe, _budget_ms())
+            except AdmissionRejected as e:
+                return _rejected(e)
         
-        result = {
-            'coin_id': coin_id,
-            'timeframe': timeframe,
-            'recommendation': recommendation,
-            'current_price': prediction.get('current_price'),
-            'timestamp': prediction_data.get('timestamp')
-        }
+        if result is None:
+            return jsonify({'error': 'Failed to fetch data for prediction'}), 404
         
-        cache.set(cache_key, result, ttl=60)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/stream/<coin_id>', methods=['GET'])
+def stream_coin(coin_id):
+    """
+    Server-Sent Events stream of price, prediction and analysis updates
+
+    All viewers of a coin share one server-side producer, which only
+    emits an event when the underlying payload changes.
+    """
+    timeframe = request.args.get('timeframe', default='1h', type=str)
+    if timeframe not in service.predictor.TIMEFRAMES:
+        return jsonify({'error': f'Invalid timeframe: {timeframe}'}), 400
+    
+    if not service.supported(coin_id):
+        return jsonify({'error': f'Unsupported coin: {coin_id}'}), 404
+    
+    client_id = _client_id()
+    try:
+        subscription = stream_hub.subscribe(coin_id, timeframe,
+                                            admit=lambda: _admission().acquire(client_id, 'upstream'))
+    except AdmissionRejected as e:
+        return _rejected(e)
+    
+    def events():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.get(timeout=STREAM_HEARTBEAT)
+                if message is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield format_event(*message)
+        finally:
+            stream_hub.unsubscribe(subscription)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Interval and caps are set once per process, from the environment config
+config = get_config()
+stream_hub = StreamHub({
+    'price': service.price,
+    'analysis': service.analysis,
+    'prediction': service.prediction,
+}, config.STREAM_INTERVAL, config.STREAM_MAX_COINS, config.STREAM_MAX_SUBSCRIBERS)
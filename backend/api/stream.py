@@ -0,0 +1,198 @@
+"""
+Server-Sent Events fan-out for live dashboard updates
+
+One producer thread per coin refreshes price, analysis and prediction
+payloads and pushes them to every subscriber only when they change, so
+upstream traffic follows data changes instead of the number of viewers.
+"""
+import queue
+import threading
+from typing import Callable, Dict, Optional
+from backend.data import upstream
+from backend.utils.admission import AdmissionRejected
+from backend.utils.json_provider import dumps
+
+# Fields that differ on every recompute of the same data (fetch and model
+# timings), left out of the fingerprints that decide whether to emit
+VOLATILE_FIELDS = frozenset({'timestamp', 'elapsed_ms'})
+
+
+class Subscription:
+    """A single SSE client listening to one coin and timeframe"""
+
+    def __init__(self, coin_id: str, timeframe: str, max_queue: int = 100):
+        self.coin_id = coin_id
+        self.timeframe = timeframe
+        self.events = queue.Queue(maxsize=max_queue)
+
+    def get(self, timeout: float) -> Optional[tuple]:
+        """Next (event, payload) pair, or None when nothing arrived in time"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def deliver(self, event: str, payload: Dict):
+        """Queue an event, dropping it if the client is not keeping up"""
+        try:
+            self.events.put_nowait((event, payload))
+        except queue.Full:
+            pass
+
+
+class CoinProducer(threading.Thread):
+    """Background refresher publishing one coin's updates to its subscribers"""
+
+    def __init__(self, hub: 'StreamHub', coin_id: str):
+        super().__init__(name=f'stream-{coin_id}', daemon=True)
+        self.hub = hub
+        self.coin_id = coin_id
+        self.subscribers = set()
+        self.snapshot = {}
+        self._fingerprints = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                # Refreshes yield upstream budget to interactive requests
+                with upstream.priority(upstream.BACKGROUND):
+                    self.refresh()
+            except Exception as e:
+                print(f"Stream refresh error for {self.coin_id}: {e}")
+            self._wake.wait(self.hub.interval)
+            self._wake.clear()
+
+    def wake(self):
+        """Refresh now, e.g. because a subscriber asked for a new timeframe"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def refresh(self):
+        """Recompute every payload the current subscribers need"""
+        with self.hub.lock:
+            timeframes = {sub.timeframe for sub in self.subscribers}
+
+        self._publish('price', None, self.hub.sources['price'](self.coin_id),
+                      'Failed to fetch price data')
+        self._publish('analysis', None, self.hub.sources['analysis'](self.coin_id),
+                      'Failed to fetch data')
+        for timeframe in sorted(timeframes):
+            self._publish('prediction', timeframe, self.hub.sources['prediction'](self.coin_id, timeframe),
+                          'Failed to fetch data for prediction')
+
+    def _publish(self, event: str, timeframe: Optional[str], payload: Optional[Dict], error: str):
+        """Send a payload to interested subscribers if it differs from the last one"""
+        payload = payload or {'error': error}
+        key = (event, timeframe)
+        fingerprint = dumps(_data_fields(payload))
+
+        with self.hub.lock:
+            if self._fingerprints.get(key) == fingerprint:
+                return
+            self._fingerprints[key] = fingerprint
+            self.snapshot[key] = payload
+            targets = [sub for sub in self.subscribers if timeframe in (None, sub.timeframe)]
+
+        for sub in targets:
+            sub.deliver(event, payload)
+
+
+class StreamHub:
+    """Registry of per-coin producers and their subscribers"""
+
+    def __init__(self, sources: Dict[str, Callable], interval: float = 15.0,
+                 max_coins: int = 10, max_subscribers: int = 50):
+        """
+        Args:
+            sources: ``price(coin_id)``, ``analysis(coin_id)`` and
+                ``prediction(coin_id, timeframe)`` payload builders
+            interval: Seconds between refreshes of each coin
+            max_coins: Producers (coins streamed at once) allowed, 0 for no limit
+            max_subscribers: Open subscriptions allowed, 0 for no limit
+        """
+        self.sources = sources
+        self.interval = interval
+        self.max_coins = max_coins
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock()
+        self.producers = {}
+
+    def _check_capacity(self, coin_id: str):
+        """Raise ``AdmissionRejected`` (503) when a subscription to ``coin_id`` would exceed a cap"""
+        subscribers = sum(len(producer.subscribers) for producer in self.producers.values())
+        if self.max_subscribers and subscribers >= self.max_subscribers:
+            raise AdmissionRejected(503, 5, 'Too many open streams, try again shortly')
+        if self.max_coins and coin_id not in self.producers and len(self.producers) >= self.max_coins:
+            raise AdmissionRejected(503, 5, 'Too many coins streamed, try again shortly')
+
+    def subscribe(self, coin_id: str, timeframe: str,
+                  admit: Optional[Callable[[], Callable[[], None]]] = None) -> Subscription:
+        """
+        Register a client, replaying the latest known payloads to it
+
+        Starting a producer for a coin nobody streams yet costs upstream
+        calls for as long as it runs, so it first goes through ``admit``
+        (an admission controller's ``acquire``, returning its release).
+        Raises ``AdmissionRejected`` when admission or the hub's caps refuse.
+        """
+        with self.lock:
+            self._check_capacity(coin_id)
+            needs_producer = coin_id not in self.producers
+        if needs_producer and admit is not None:
+            # Charged like a miss; the slot is released at once, as the
+            # producer's refreshes run at background priority
+            admit()()
+
+        sub = Subscription(coin_id, timeframe)
+
+        with self.lock:
+            # Caps again, other clients may have subscribed meanwhile
+            self._check_capacity(coin_id)
+            producer = self.producers.get(coin_id)
+            is_new = producer is None
+            if is_new:
+                producer = CoinProducer(self, coin_id)
+                self.producers[coin_id] = producer
+
+            new_timeframe = all(other.timeframe != timeframe for other in producer.subscribers)
+            producer.subscribers.add(sub)
+
+            for (event, event_timeframe), payload in producer.snapshot.items():
+                if event_timeframe in (None, timeframe):
+                    sub.deliver(event, payload)
+
+        if is_new:
+            producer.start()
+        elif new_timeframe:
+            producer.wake()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        """Remove a client, stopping its coin's producer once nobody listens"""
+        with self.lock:
+            producer = self.producers.get(sub.coin_id)
+            if producer is None:
+                return
+            producer.subscribers.discard(sub)
+            if not producer.subscribers:
+                del self.producers[sub.coin_id]
+                producer.stop()
+
+
+def _data_fields(value):
+    """``value`` without its ``VOLATILE_FIELDS``, at any depth"""
+    if isinstance(value, dict):
+        return {name: _data_fields(item) for name, item in value.items() if name not in VOLATILE_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_data_fields(item) for item in value]
+    return value
+
+
+def format_event(event: str, payload: Dict) -> str:
+    """Encode one SSE message"""
+    return f'event: {event}\ndata: {dumps(payload)}\n\n'
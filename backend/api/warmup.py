@@ -0,0 +1,67 @@
+"""
+Pre-fork warm-up for gunicorn's ``preload_app`` mode
+
+Runs once in the master after the app is imported and before workers are
+forked. Heavy libraries, upstream clients and models are loaded, and the
+popular coins' series are fetched into a ``SeriesStore``, so every worker
+starts with them in memory shared copy-on-write instead of loading its own.
+"""
+import gc
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from backend.api.prediction_service import HISTORY_DAYS, POPULAR_COINS, PredictionService
+from backend.data.series_store import SeriesStore
+
+# Concurrent upstream fetches during warm-up
+WARMUP_WORKERS = 8
+
+
+def warm_up(service: PredictionService, coin_ids: Optional[List[str]] = None) -> Dict:
+    """
+    Load everything the workers would otherwise load on their first requests
+
+    Returns a summary of what was loaded.
+    """
+    start = time.perf_counter()
+
+    # Import sklearn/statsmodels/pandas and build clients and models once
+    predictor = service.predictor
+    service.preprocessor
+    service.data_fetcher
+    try:
+        import statsmodels.tsa.arima.model  # noqa: F401  (imported lazily by predict_arima)
+    except ImportError:
+        pass
+
+    coins = service.coins()
+
+    coin_ids = coin_ids or [coin['id'] for coin in POPULAR_COINS]
+    sources = sorted({service.series_source(coin_id, timeframe)
+                      for coin_id in coin_ids for timeframe in predictor.TIMEFRAMES})
+    # Threads are joined here, before any fork
+    with ThreadPoolExecutor(max_workers=WARMUP_WORKERS) as executor:
+        series = dict(zip(sources, executor.map(service.fetch_upstream, sources)))
+        # Default ``/historical`` range, stored under the key ``history`` looks up
+        histories = [('history', coin_id, HISTORY_DAYS) for coin_id in coin_ids]
+        series.update(zip(histories, executor.map(lambda key: service.fetch_history(*key[1:]), histories)))
+
+    store = SeriesStore(series)
+    service.warm_store = store
+
+    # Workers must not share the master's keep-alive connections
+    session = getattr(service.data_fetcher, 'session', None)
+    if session is not None:
+        session.close()
+
+    # Keep the collector in workers from writing to the master's objects
+    gc.collect()
+    gc.freeze()
+
+    return {
+        'coins': len(coins.get('all', [])) if coins else 0,
+        'series': len(store),
+        'series_failed': len(series) - len(store),
+        'store_bytes': store.nbytes,
+        'seconds': round(time.perf_counter() - start, 2),
+    }
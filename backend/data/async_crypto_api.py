@@ -0,0 +1,205 @@
+"""
+Asyncio crypto API client
+
+Non-blocking counterpart of ``CryptoDataFetcher``: requests go through one
+pooled aiohttp session, so a single event loop can wait on hundreds of
+upstream calls at once. Responses are formatted exactly like the blocking
+client's. ``BlockingBridge`` runs clients without an async API (e.g. the
+yfinance based ``CryptoDataService``) on a dedicated thread pool.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import aiohttp
+import numpy as np
+from backend.data.crypto_api import (
+    BINANCE_BASE_URL, BINANCE_KLINES_LIMIT, COINGECKO_BASE_URL,
+    format_coins, format_kline_columns, format_klines, format_market_chart, format_price,
+    kline_pages, stitch_klines
+)
+from backend.data.upstream import BudgetRouter, count_request, get_breaker, get_budget, get_latency
+from backend.utils.timing import span
+
+
+class AsyncCryptoDataFetcher:
+    """Fetch crypto data from multiple sources without blocking the event loop"""
+
+    def __init__(self, coingecko_base_url: Optional[str] = None, binance_base_url: Optional[str] = None,
+                 timeout: float = 10, max_connections: int = 200, kline_concurrency: int = 4):
+        """
+        Args:
+            coingecko_base_url: CoinGecko API root, e.g. a local stand-in
+            binance_base_url: Binance API root
+            timeout: Upper bound in seconds on the adaptive per-request timeout
+            max_connections: Upper bound on concurrently open upstream connections
+            kline_concurrency: Klines pages of a long range fetched at once
+        """
+        self.coingecko_base_url = (coingecko_base_url or COINGECKO_BASE_URL).rstrip('/')
+        self.binance_base_url = (binance_base_url or BINANCE_BASE_URL).rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.kline_concurrency = max(1, kline_concurrency)
+        self.router = BudgetRouter({
+            self.coingecko_base_url: get_budget('coingecko'),
+            self.binance_base_url: get_budget('binance'),
+        })
+        self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Shared session, created on first use inside the running loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_json(self, url: str, params: Optional[Dict] = None) -> Any:
+        budget = self.router.budget_for(url)
+        if budget is not None:
+            breaker = get_breaker(budget.provider)
+            breaker.before_request()
+            await budget.acquire_async(budget.weight_of(url, params))
+
+        session = await self.session()
+        if budget is None:
+            async with session.get(url, params=params) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+        latency = get_latency(budget.provider)
+        timeout = aiohttp.ClientTimeout(total=min(self.timeout.total, latency.timeout()))
+        status = None
+        start = time.perf_counter()
+        try:
+            with span(budget.provider):
+                async with session.get(url, params=params, timeout=timeout) as response:
+                    status = response.status
+                    if status < 500:
+                        latency.observe(time.perf_counter() - start)
+                    # Off the loop, like ``acquire_async``: it may lock the shared state file
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, budget.record, response.status, response.headers)
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+        except asyncio.TimeoutError:
+            latency.observe(time.perf_counter() - start)
+            raise
+        finally:
+            count_request(budget.provider, status)
+            breaker.record(status)
+
+    async def get_current_price(self, symbol: str = "bitcoin") -> Dict:
+        """Get current price for a cryptocurrency"""
+        try:
+            data = await self._get_json(f"{self.coingecko_base_url}/simple/price", {
+                'ids': symbol,
+                'vs_currencies': 'usd',
+                'include_24hr_change': 'true',
+                'include_24hr_vol': 'true',
+                'include_market_cap': 'true'
+            })
+            return format_price(symbol, data)
+        except Exception as e:
+            print(f"Error fetching current price: {e}")
+            return None
+
+    async def get_historical_data(self, symbol: str = "bitcoin", days: int = 30) -> List[Dict]:
+        """Get historical price data"""
+        try:
+            data = await self._get_json(f"{self.coingecko_base_url}/coins/{symbol}/market_chart", {
+                'vs_currency': 'usd',
+                'days': days
+            })
+            return format_market_chart(data)
+        except Exception as e:
+            print(f"Error fetching historical data: {e}")
+            return []
+
+    async def get_binance_klines(self, symbol: str = "BTCUSDT", interval: str = "1m", limit: int = 100,
+                                 start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+        """Get candlestick data from Binance, paged like ``CryptoDataFetcher.get_binance_klines``"""
+        if start is not None or end is not None or limit > BINANCE_KLINES_LIMIT:
+            columns = await self.get_binance_kline_columns(symbol, interval, limit, start, end)
+            return format_kline_columns(columns) if columns is not None else []
+        try:
+            klines = await self._get_json(f"{self.binance_base_url}/klines", {
+                'symbol': symbol.upper(),
+                'interval': interval,
+                'limit': limit
+            })
+            return format_klines(klines)
+        except Exception as e:
+            print(f"Error fetching Binance klines: {e}")
+            return []
+
+    async def get_binance_kline_columns(self, symbol: str = "BTCUSDT", interval: str = "1m", limit: int = 100,
+                                        start: Optional[datetime] = None,
+                                        end: Optional[datetime] = None) -> Optional[Dict[str, np.ndarray]]:
+        """Candles of a range as columns, ``kline_concurrency`` pages at a time (None when any fails)"""
+        semaphore = asyncio.Semaphore(self.kline_concurrency)
+
+        async def fetch(page: Dict) -> List:
+            async with semaphore:
+                return await self._get_json(f"{self.binance_base_url}/klines", page)
+
+        try:
+            pages = [dict(page, symbol=symbol.upper(), interval=interval)
+                     for page in kline_pages(interval, limit, start, end)]
+            responses = await asyncio.gather(*(fetch(page) for page in pages))
+            return stitch_klines(responses)
+        except Exception as e:
+            print(f"Error fetching Binance klines: {e}")
+            return None
+
+    async def get_supported_coins(self) -> List[Dict]:
+        """Get list of supported cryptocurrencies"""
+        try:
+            return format_coins(await self._get_json(f"{self.coingecko_base_url}/coins/list"))
+        except Exception as e:
+            print(f"Error fetching supported coins: {e}")
+            return []
+
+    async def get_multi_coin_data(self, symbols: List[str]) -> Dict:
+        """Get data for multiple cryptocurrencies concurrently"""
+        prices = await asyncio.gather(*(self.get_current_price(symbol) for symbol in symbols))
+        return {symbol: data for symbol, data in zip(symbols, prices) if data}
+
+
+class BlockingBridge:
+    """
+    Awaitable view of a blocking client
+
+    Every method call runs on the bridge's own thread pool, so slow calls
+    (yfinance downloads, for instance) never stall the event loop nor use
+    up the loop's default executor::
+
+        service = BlockingBridge(CryptoDataService())
+        data = await service.get_historical_data('BTC-USD', '1h')
+    """
+
+    def __init__(self, target: Any, max_workers: int = 32):
+        self.target = target
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix=f'bridge-{type(target).__name__}')
+
+    def __getattr__(self, name: str):
+        method = getattr(self.target, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -2,20 +2,173 @@
 Crypto API client for fetching real-time and historical data
 Supports CoinGecko and Binance APIs
 """
+import contextvars
+import math
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
-import requests
-from pycoingecko import CoinGeckoAPI
+import numpy as np
+from backend.data.recording import Recorder
+from backend.data.upstream import UpstreamSession, get_budget
+from backend.utils.timing import timed
+
+
+COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
+BINANCE_BASE_URL = "https://api.binance.com/api/v3"
+
+# Most klines Binance returns for one request
+BINANCE_KLINES_LIMIT = 1000
+
+# Fixed-length Binance kline intervals, in seconds
+INTERVAL_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, '2h': 7200,
+    '4h': 14400, '6h': 21600, '8h': 28800, '12h': 43200, '1d': 86400, '3d': 259200, '1w': 604800,
+}
+
+KLINE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def kline_pages(interval: str, limit: int = 100, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> List[Dict]:
+    """
+    ``klines`` query parameters covering a range, one dict per request
+
+    With ``start`` and ``end`` the range is every candle opening between
+    them; with only one of them, ``limit`` candles from ``start`` or up to
+    ``end``; with neither, the last ``limit`` candles. Each page holds at
+    most ``BINANCE_KLINES_LIMIT`` candles.
+    """
+    step = INTERVAL_SECONDS[interval] * 1000
+    if start is not None:
+        first = int(start.timestamp() * 1000)
+        last = int(end.timestamp() * 1000) if end is not None else first + limit * step - 1
+    else:
+        last = int((end.timestamp() if end is not None else time.time()) * 1000)
+        first = last - limit * step + 1
+
+    span = BINANCE_KLINES_LIMIT * step
+    return [
+        {'startTime': page, 'endTime': min(page + span, last + 1) - 1,
+         'limit': min(BINANCE_KLINES_LIMIT, math.ceil((min(page + span, last + 1) - page) / step))}
+        for page in range(first, last + 1, span)
+    ]
+
+
+@timed('parse')
+def format_price(symbol: str, data: Dict) -> Dict:
+    """Current price record from a CoinGecko ``simple/price`` response"""
+    return {
+        'symbol': symbol,
+        'price': data[symbol]['usd'],
+        'change_24h': data[symbol].get('usd_24h_change', 0),
+        'volume_24h': data[symbol].get('usd_24h_vol', 0),
+        'market_cap': data[symbol].get('usd_market_cap', 0),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+@timed('parse')
+def format_market_chart(data: Dict) -> List[Dict]:
+    """Historical points from a CoinGecko ``market_chart`` response"""
+    prices = data['prices']
+    volumes = data['total_volumes']
+    market_caps = data['market_caps']
+    
+    historical_data = []
+    for i in range(len(prices)):
+        historical_data.append({
+            'timestamp': datetime.fromtimestamp(prices[i][0] / 1000).isoformat(),
+            'price': prices[i][1],
+            'volume': volumes[i][1] if i < len(volumes) else 0,
+            'market_cap': market_caps[i][1] if i < len(market_caps) else 0
+        })
+    
+    return historical_data
+
+
+@timed('parse')
+def format_klines(klines: List[list]) -> List[Dict]:
+    """Candles from a Binance ``klines`` response"""
+    formatted_data = []
+    
+    for kline in klines:
+        formatted_data.append({
+            'timestamp': datetime.fromtimestamp(kline[0] / 1000).isoformat(),
+            'open': float(kline[1]),
+            'high': float(kline[2]),
+            'low': float(kline[3]),
+            'close': float(kline[4]),
+            'volume': float(kline[5]),
+        })
+    
+    return formatted_data
+
+
+@timed('parse')
+def stitch_klines(pages: List[List[list]]) -> Dict[str, np.ndarray]:
+    """
+    One columnar series from Binance ``klines`` responses
+
+    Candles are put in time order and those in more than one page (pages
+    that overlap, or a candle that closed between two requests) kept once.
+    """
+    rows = [kline[:6] for page in pages for kline in page]
+    table = np.array(rows, dtype=float).reshape(-1, 6)
+    _, unique = np.unique(table[:, 0], return_index=True)
+    table = table[unique]
+    columns = {'open_time': table[:, 0].astype(np.int64)}
+    columns.update((name, table[:, i + 1]) for i, name in enumerate(KLINE_FIELDS))
+    return columns
+
+
+@timed('parse')
+def format_kline_columns(columns: Dict[str, np.ndarray]) -> List[Dict]:
+    """Candles, as ``format_klines`` returns them, from ``stitch_klines`` columns"""
+    timestamps = [datetime.fromtimestamp(ms / 1000).isoformat() for ms in columns['open_time'].tolist()]
+    values = zip(*(columns[name].tolist() for name in KLINE_FIELDS))
+    return [{'timestamp': ts, **dict(zip(KLINE_FIELDS, row))} for ts, row in zip(timestamps, values)]
+
+
+@timed('parse')
+def format_coins(coins: List[Dict]) -> List[Dict]:
+    """Top coins from a CoinGecko ``coins/list`` response"""
+    return [
+        {'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name']}
+        for coin in coins[:100]
+    ]
 
 
 class CryptoDataFetcher:
     """Fetch crypto data from multiple sources"""
     
-    def __init__(self):
+    def __init__(self, coingecko_base_url: Optional[str] = None, binance_base_url: Optional[str] = None,
+                 recorder: Optional[Recorder] = None, kline_concurrency: int = 4):
+        """
+        Args:
+            coingecko_base_url: CoinGecko API root, e.g. a local stand-in
+            binance_base_url: Binance API root
+            recorder: Records every upstream response, or replays them without network
+            kline_concurrency: Klines pages of a long range fetched at once
+        """
+        # Imported here so the formatting helpers can be used without the client
+        from pycoingecko import CoinGeckoAPI
+        
         self.coingecko = CoinGeckoAPI()
-        self.binance_base_url = "https://api.binance.com/api/v3"
+        if coingecko_base_url:
+            self.coingecko.api_base_url = coingecko_base_url.rstrip('/') + '/'
+        self.binance_base_url = (binance_base_url or BINANCE_BASE_URL).rstrip('/')
+        self.kline_concurrency = max(1, kline_concurrency)
+        
+        # Every upstream call draws from the host-wide per-provider budget
+        self.session = UpstreamSession({
+            self.coingecko.api_base_url: get_budget('coingecko'),
+            self.binance_base_url: get_budget('binance'),
+        }, retry_roots=(self.coingecko.api_base_url,))
+        self.coingecko.session = self.session
+        if recorder is not None:
+            recorder.install(self.session)
         
     def get_current_price(self, symbol: str = "bitcoin") -> Dict:
         """Get current price for a cryptocurrency"""
@@ -27,14 +180,7 @@ class CryptoDataFetcher:
                 include_24hr_vol=True,
                 include_market_cap=True
             )
-            return {
-                'symbol': symbol,
-                'price': data[symbol]['usd'],
-                'change_24h': data[symbol].get('usd_24h_change', 0),
-                'volume_24h': data[symbol].get('usd_24h_vol', 0),
-                'market_cap': data[symbol].get('usd_market_cap', 0),
-                'timestamp': datetime.now().isoformat()
-            }
+            return format_price(symbol, data)
         except Exception as e:
             print(f"Error fetching current price: {e}")
             return None
@@ -47,75 +193,69 @@ class CryptoDataFetcher:
                 vs_currency='usd',
                 days=days
             )
-            
-            prices = data['prices']
-            volumes = data['total_volumes']
-            market_caps = data['market_caps']
-            
-            historical_data = []
-            for i in range(len(prices)):
-                historical_data.append({
-                    'timestamp': datetime.fromtimestamp(prices[i][0] / 1000).isoformat(),
-                    'price': prices[i][1],
-                    'volume': volumes[i][1] if i < len(volumes) else 0,
-                    'market_cap': market_caps[i][1] if i < len(market_caps) else 0
-                })
-            
-            return historical_data
+            return format_market_chart(data)
         except Exception as e:
             print(f"Error fetching historical data: {e}")
             return []
     
-    def get_binance_klines(self, symbol: str = "BTCUSDT", interval: str = "1m", limit: int = 100) -> List[Dict]:
-        """Get candlestick data from Binance"""
+    def get_binance_klines(self, symbol: str = "BTCUSDT", interval: str = "1m", limit: int = 100,
+                           start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+        """
+        Get candlestick data from Binance
+
+        The last ``limit`` candles, or a range (see ``kline_pages``). Ranges
+        longer than one request are fetched by ``get_binance_kline_columns``.
+        """
+        if start is not None or end is not None or limit > BINANCE_KLINES_LIMIT:
+            columns = self.get_binance_kline_columns(symbol, interval, limit, start, end)
+            return format_kline_columns(columns) if columns is not None else []
         try:
-            url = f"{self.binance_base_url}/klines"
-            params = {
-                'symbol': symbol.upper(),
-                'interval': interval,
-                'limit': limit
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            klines = response.json()
-            formatted_data = []
-            
-            for kline in klines:
-                formatted_data.append({
-                    'timestamp': datetime.fromtimestamp(kline[0] / 1000).isoformat(),
-                    'open': float(kline[1]),
-                    'high': float(kline[2]),
-                    'low': float(kline[3]),
-                    'close': float(kline[4]),
-                    'volume': float(kline[5]),
-                })
-            
-            return formatted_data
+            return format_klines(self._get_klines({'symbol': symbol.upper(), 'interval': interval, 'limit': limit}))
         except Exception as e:
             print(f"Error fetching Binance klines: {e}")
             return []
     
+    def get_binance_kline_columns(self, symbol: str = "BTCUSDT", interval: str = "1m", limit: int = 100,
+                                  start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Candles of a range as columns, fetched in concurrent pages
+
+        Every page draws from the Binance budget, so a long range waits for
+        budget instead of exceeding it. Returns None when any page fails, as
+        a series with a gap in it would mislead the models.
+        """
+        try:
+            pages = [dict(page, symbol=symbol.upper(), interval=interval)
+                     for page in kline_pages(interval, limit, start, end)]
+            with ThreadPoolExecutor(max(1, min(self.kline_concurrency, len(pages)))) as pool:
+                # Pages keep the caller's upstream priority and timing spans
+                futures = [pool.submit(contextvars.copy_context().run, self._get_klines, page) for page in pages]
+                return stitch_klines([future.result() for future in futures])
+        except Exception as e:
+            print(f"Error fetching Binance klines: {e}")
+            return None
+    
+    def _get_klines(self, params: Dict) -> List[list]:
+        response = self.session.get(f"{self.binance_base_url}/klines", params=params)
+        response.raise_for_status()
+        return response.json()
+    
     def get_supported_coins(self) -> List[Dict]:
         """Get list of supported cryptocurrencies"""
         try:
             coins = self.coingecko.get_coins_list()
             # Return top coins only
-            return [
-                {'id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name']}
-                for coin in coins[:100]
-            ]
+            return format_coins(coins)
         except Exception as e:
             print(f"Error fetching supported coins: {e}")
             return []
     
     def get_multi_coin_data(self, symbols: List[str]) -> Dict:
-        """Get data for multiple cryptocurrencies"""
+        """Get data for multiple cryptocurrencies, paced by the CoinGecko budget"""
         result = {}
         for symbol in symbols:
             data = self.get_current_price(symbol)
             if data:
                 result[symbol] = data
-            time.sleep(0.5)  # Rate limiting
         return result
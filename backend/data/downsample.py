@@ -0,0 +1,71 @@
+"""
+Series downsampling for chart payloads
+"""
+from typing import List, Optional
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets point selection
+
+    Keeps the first and last points and, for every bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Bucket averages and triangle areas are
+    computed with numpy; only the bucket-to-bucket chaining is a loop.
+
+    Args:
+        x: Monotonic x values
+        y: Values to preserve the visual shape of
+        threshold: Number of points to keep
+
+    Returns:
+        Sorted indices of the kept points
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Interior points split into threshold - 2 buckets
+    edges = (np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(int) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+
+    # Average of each bucket; the bucket after the last one is the final point
+    avg_x = np.append(np.add.reduceat(x[:-1], starts) / sizes, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], starts) / sizes, y[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_points(points: List[dict], max_points: int, field: Optional[str] = None) -> List[dict]:
+    """
+    Downsample a list of price points with LTTB
+
+    Points are assumed evenly spaced in time, so their position is used as
+    the x axis. ``field`` defaults to ``price`` (CoinGecko) or ``close``.
+    """
+    if not points or len(points) <= max_points:
+        return points
+
+    if field is None:
+        field = 'price' if 'price' in points[0] else 'close'
+
+    y = np.fromiter((p.get(field, 0) for p in points), dtype=float, count=len(points))
+    keep = lttb_indices(np.arange(len(points)), y, max_points)
+    return [points[i] for i in keep]
@@ -0,0 +1,275 @@
+"""
+Candle series federated across Binance, CoinGecko and Yahoo Finance
+
+A ``SeriesRequest`` asks for the last ``window`` candles of a coin at an
+interval. Every source able to serve it is ranked by availability (its
+provider's circuit breaker), remaining rate budget and recent latency, and
+the sources are tried in that order until one returns data. An outage or
+slowdown at one provider moves requests to the next instead of stalling
+predictions. Whichever source answers, the points have the same schema,
+``CANDLE_FIELDS``.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from backend.data.crypto_api import INTERVAL_SECONDS, kline_pages
+from backend.data.upstream import OPEN, CircuitOpen, LatencyTracker, binance_weight, get_breaker, get_budget
+from backend.utils import metrics
+
+CANDLE_FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+# Binance trading pairs
+BINANCE_SYMBOLS = {
+    'bitcoin': 'BTCUSDT',
+    'ethereum': 'ETHUSDT',
+    'binancecoin': 'BNBUSDT',
+    'cardano': 'ADAUSDT',
+    'solana': 'SOLUSDT',
+    'ripple': 'XRPUSDT',
+    'polkadot': 'DOTUSDT',
+    'dogecoin': 'DOGEUSDT',
+}
+
+# Yahoo Finance tickers
+YAHOO_SYMBOLS = {
+    'bitcoin': 'BTC-USD',
+    'ethereum': 'ETH-USD',
+    'binancecoin': 'BNB-USD',
+    'cardano': 'ADA-USD',
+    'solana': 'SOL-USD',
+    'ripple': 'XRP-USD',
+    'polkadot': 'DOT-USD',
+    'dogecoin': 'DOGE-USD',
+}
+
+# Most candles Yahoo returns per interval, for the intervals ``CryptoDataService``
+# requests natively (1 day of 1m, 5 days of 5m and 15m, 1 month of 1h, 1 year of 1d)
+YAHOO_LIMITS = {'1m': 1440, '5m': 1440, '15m': 480, '1h': 720, '1d': 365}
+
+# Latencies this close count as equal, so the sources' own order decides
+LATENCY_STEP = 0.1
+
+
+class SeriesRequest(NamedTuple):
+    """The last ``window`` candles of ``coin_id`` at ``interval``"""
+    coin_id: str
+    interval: str
+    window: int
+
+    @property
+    def span(self) -> float:
+        """Seconds covered by the window"""
+        return self.window * INTERVAL_SECONDS[self.interval]
+
+
+class Source(ABC):
+    """
+    One provider of candles
+
+    ``client`` returns the object whose method ``call`` names, so tests and
+    the async server can swap clients without rebuilding the federation.
+    Subclasses implement ``supports``, ``call`` and ``normalize``.
+    """
+
+    name = ''
+    # Budget and breaker in ``backend.data.upstream``, None when there are none
+    provider = None
+    # Breaker the federation reports every fetch to, for sources whose client
+    # does not go through an ``UpstreamSession`` that would
+    breaker = None
+    # Seconds assumed per fetch until the federation has timed the source
+    expected_latency = 1.0
+
+    def __init__(self, client: Callable[[], Any]):
+        self.client = client
+
+    @abstractmethod
+    def supports(self, request: SeriesRequest) -> bool:
+        """Whether the source can serve ``request``"""
+
+    @abstractmethod
+    def call(self, request: SeriesRequest) -> Tuple[str, tuple]:
+        """Client method name and arguments that fetch ``request``"""
+
+    @abstractmethod
+    def normalize(self, raw, request: SeriesRequest) -> List[dict]:
+        """Candles in ``CANDLE_FIELDS`` from the client's result"""
+
+    def weight(self, request: SeriesRequest) -> int:
+        """Budget weight of the fetch"""
+        return 1
+
+
+class BinanceSource(Source):
+    """Klines, native OHLCV at every interval Binance offers, paged beyond one request"""
+
+    name = 'binance'
+    provider = 'binance'
+    expected_latency = 0.2
+
+    def supports(self, request: SeriesRequest) -> bool:
+        return request.coin_id in BINANCE_SYMBOLS and request.interval in INTERVAL_SECONDS
+
+    def call(self, request: SeriesRequest) -> Tuple[str, tuple]:
+        return 'get_binance_klines', (BINANCE_SYMBOLS[request.coin_id], request.interval, request.window)
+
+    def normalize(self, raw, request: SeriesRequest) -> List[dict]:
+        # ``format_klines`` already returns candles
+        return list((raw or [])[-request.window:])
+
+    def weight(self, request: SeriesRequest) -> int:
+        return sum(binance_weight('/klines', page) for page in kline_pages(request.interval, request.window))
+
+
+class CoinGeckoSource(Source):
+    """
+    Market charts, one price per point (open = high = low = close)
+
+    CoinGecko picks the granularity from the number of days: 5-minute
+    points for 1 day, hourly for 2 to 90 days and daily beyond, so only
+    windows that fit one of those are served.
+    """
+
+    name = 'coingecko'
+    provider = 'coingecko'
+    expected_latency = 0.5
+
+    @staticmethod
+    def days(request: SeriesRequest) -> Optional[int]:
+        """Days to request for ``request``, None when no granularity matches"""
+        if request.interval == '5m' and request.window <= 288:
+            return 1
+        if request.interval == '1h' and request.window <= 90 * 24:
+            return max(2, math.ceil(request.window / 24))
+        if request.interval == '1d':
+            return max(91, request.window)
+        return None
+
+    def supports(self, request: SeriesRequest) -> bool:
+        return self.days(request) is not None
+
+    def call(self, request: SeriesRequest) -> Tuple[str, tuple]:
+        return 'get_historical_data', (request.coin_id, self.days(request))
+
+    def normalize(self, raw, request: SeriesRequest) -> List[dict]:
+        return [
+            {'timestamp': point['timestamp'], 'open': point['price'], 'high': point['price'],
+             'low': point['price'], 'close': point['price'], 'volume': point.get('volume', 0)}
+            for point in (raw or [])[-request.window:]
+        ]
+
+
+class YahooSource(Source):
+    """Yahoo Finance history through ``CryptoDataService`` (yfinance)"""
+
+    name = 'yahoo'
+    breaker = 'yahoo'
+    expected_latency = 1.0
+
+    def supports(self, request: SeriesRequest) -> bool:
+        return request.coin_id in YAHOO_SYMBOLS and request.window <= YAHOO_LIMITS.get(request.interval, 0)
+
+    def call(self, request: SeriesRequest) -> Tuple[str, tuple]:
+        return 'get_historical_data', (YAHOO_SYMBOLS[request.coin_id], request.interval, request.window)
+
+    def normalize(self, raw, request: SeriesRequest) -> List[dict]:
+        if raw is None or raw.empty:
+            return []
+        frame = raw.tail(request.window)
+        return [
+            # Naive local time, like the Binance and CoinGecko formatters
+            {'timestamp': datetime.fromtimestamp(ts.timestamp()).isoformat(), 'open': float(row['Open']), 'high': float(row['High']),
+             'low': float(row['Low']), 'close': float(row['Close']), 'volume': float(row['Volume'])}
+            for ts, row in frame.iterrows()
+        ]
+
+
+def default_sources(crypto_client: Callable[[], Any], yahoo_client: Callable[[], Any]) -> List[Source]:
+    """Binance, CoinGecko and Yahoo, in order of preference when they are equally fast"""
+    return [BinanceSource(crypto_client), CoinGeckoSource(crypto_client), YahooSource(yahoo_client)]
+
+
+class SeriesFederation:
+    """Serves ``SeriesRequest``s from the best available source, failing over to the others"""
+
+    def __init__(self, sources: List[Source]):
+        self.sources = sources
+        # Whole fetches as the federation sees them, parsing included
+        self.latency = {source.name: LatencyTracker(source.name, hedge_rate=0) for source in sources}
+
+    def _rank(self, source: Source, request: SeriesRequest) -> tuple:
+        unavailable = starved = False
+        if source.provider is not None:
+            unavailable = get_breaker(source.provider).state == OPEN
+            starved = get_budget(source.provider).available() < source.weight(request)
+        if source.breaker is not None:
+            unavailable = unavailable or get_breaker(source.breaker).state == OPEN
+        estimate = self.latency[source.name].percentile(50)
+        if estimate is None:
+            estimate = source.expected_latency
+        return unavailable, starved, round(estimate / LATENCY_STEP)
+
+    def candidates(self, request: SeriesRequest) -> List[Source]:
+        """Sources able to serve ``request``, best first"""
+        ranked = [(self._rank(source, request), order, source)
+                  for order, source in enumerate(self.sources) if source.supports(request)]
+        ranked.sort(key=lambda item: item[:2])
+        return [source for _, _, source in ranked]
+
+    @staticmethod
+    def _admit(source: Source) -> bool:
+        """Whether the source's own breaker lets a fetch through"""
+        if source.breaker is None:
+            return True
+        try:
+            get_breaker(source.breaker).before_request()
+            return True
+        except CircuitOpen:
+            return False
+
+    def _settle(self, source: Source, request: SeriesRequest, raw, start: float) -> List[dict]:
+        candles = source.normalize(raw, request)
+        # Failures are timed too, so a source that is slow to fail ranks lower
+        self.latency[source.name].observe(time.perf_counter() - start)
+        if source.breaker is not None:
+            get_breaker(source.breaker).record(200 if candles else None)
+        metrics.inc('series_fetches_total', source=source.name, result='ok' if candles else 'failed')
+        return candles
+
+    def fetch(self, request: SeriesRequest) -> List[dict]:
+        """Candles for ``request``, or an empty list when no source could serve it"""
+        for source in self.candidates(request):
+            client = source.client()
+            if client is None or not self._admit(source):
+                continue
+            method, args = source.call(request)
+            start = time.perf_counter()
+            try:
+                raw = getattr(client, method)(*args)
+            except Exception as e:
+                print(f"Error fetching {request} from {source.name}: {e}")
+                raw = None
+            candles = self._settle(source, request, raw, start)
+            if candles:
+                return candles
+        return []
+
+    async def fetch_async(self, request: SeriesRequest, clients: Dict[str, Any]) -> List[dict]:
+        """``fetch`` with awaitable clients, by source name; sources without one are skipped"""
+        for source in self.candidates(request):
+            client = clients.get(source.name)
+            if client is None or not self._admit(source):
+                continue
+            method, args = source.call(request)
+            start = time.perf_counter()
+            try:
+                raw = await getattr(client, method)(*args)
+            except Exception as e:
+                print(f"Error fetching {request} from {source.name}: {e}")
+                raw = None
+            candles = self._settle(source, request, raw, start)
+            if candles:
+                return candles
+        return []
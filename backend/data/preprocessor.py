@@ -4,13 +4,15 @@ Data preprocessing for ML models
 import numpy as np
 import pandas as pd
 from typing import Tuple, List
-from sklearn.preprocessing import MinMaxScaler
+from backend.utils.timing import timed
 
 
 class DataPreprocessor:
     """Preprocess crypto data for ML models"""
     
     def __init__(self):
+        # sklearn is imported on first use to keep app start-up fast
+        from sklearn.preprocessing import MinMaxScaler
         self.scaler = MinMaxScaler()
         
     def prepare_time_series_data(self, data: List[dict], sequence_length: int = 60) -> Tuple[np.ndarray, np.ndarray]:
@@ -43,6 +45,7 @@ class DataPreprocessor:
         
         return np.array(X), np.array(y)
     
+    @timed('indicators')
     def calculate_technical_indicators(self, data: List[dict]) -> pd.DataFrame:
         """Calculate technical indicators from price data"""
         if not data:
@@ -0,0 +1,172 @@
+"""
+Record and replay upstream HTTP responses
+
+In ``record`` mode every response the upstream clients receive is also
+written to an archive directory, one gzip-compressed JSON file per request
+(method, URL with sorted query parameters, body). In ``replay`` mode the
+same requests are answered from the archive without touching the network,
+optionally after the delay the original response took, so perf tests,
+backtests and bug reproductions see exactly the recorded market data.
+
+Both modes work at the transport level (a ``requests`` adapter), so the
+Binance and CoinGecko clients of ``CryptoDataFetcher`` and yfinance in
+``CryptoDataService`` are covered without changes to their parsing.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Query parameters that change between sessions without changing the response
+IGNORED_PARAMS = frozenset({'crumb'})
+
+# Headers describing the wire encoding; recorded bodies are stored decoded
+WIRE_HEADERS = frozenset({'content-encoding', 'content-length', 'transfer-encoding', 'connection'})
+
+
+class ReplayMiss(requests.ConnectionError):
+    """A replayed request has no recording; raised like a network failure"""
+
+
+def request_key(method: str, url: str, body=None) -> str:
+    """Archive key of a request: hash of its method, normalized URL and body"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    normalized = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+    if isinstance(body, str):
+        body = body.encode()
+    digest = hashlib.sha256(f'{method.upper()} {normalized}\n'.encode())
+    digest.update(body or b'')
+    return digest.hexdigest()[:32]
+
+
+class UpstreamArchive:
+    """Directory of recorded responses, one ``<key>.json.gz`` file per request"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.json.gz')
+
+    def save(self, key: str, request: requests.PreparedRequest, response: requests.Response, elapsed: float):
+        record = {
+            'method': request.method,
+            'url': request.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in WIRE_HEADERS},
+            'body': base64.b64encode(response.content).decode('ascii'),
+            'elapsed': elapsed,
+            'recorded_at': datetime.now().isoformat(),
+        }
+        # Write-then-rename, so concurrent workers never read a partial file
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(json.dumps(record).encode(), compresslevel=6))
+        os.replace(temp, self._file(key))
+
+    def load(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._file(key), 'rb') as f:
+                return json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(self.path) if name.endswith('.json.gz'))
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """Transport adapter that records responses, or replays them instead of sending"""
+
+    def __init__(self, archive: UpstreamArchive, mode: str, simulate_timing: bool = False, **kwargs):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f'Unknown upstream recording mode: {mode}')
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.mode = mode
+        self.simulate_timing = simulate_timing
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = request_key(request.method, request.url, request.body)
+        if self.mode == REPLAY:
+            record = self.archive.load(key)
+            if record is None:
+                raise ReplayMiss(f'No recorded response for {request.method} {request.url}', request=request)
+            if self.simulate_timing:
+                time.sleep(record['elapsed'])
+            return self._replayed(request, record)
+
+        start = time.perf_counter()
+        response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        elapsed = time.perf_counter() - start
+        try:
+            self.archive.save(key, request, response, elapsed)
+        except OSError as e:
+            print(f"Error recording upstream response: {e}")
+        return response
+
+    def _replayed(self, request: requests.PreparedRequest, record: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = record['status']
+        response.reason = record['reason']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response._content = base64.b64decode(record['body'])
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.connection = self
+        return response
+
+
+class Recorder:
+    """Installs record/replay adapters on ``requests`` sessions"""
+
+    def __init__(self, archive_dir: str, mode: str, simulate_timing: bool = False):
+        """
+        Args:
+            archive_dir: Directory holding the recorded responses
+            mode: ``record`` (pass through and save) or ``replay`` (serve from the archive only)
+            simulate_timing: When replaying, wait as long as the original response took
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f'Unknown upstream recording mode: {mode}')
+        self.archive = UpstreamArchive(archive_dir)
+        self.mode = mode
+        self.simulate_timing = simulate_timing
+
+    @classmethod
+    def from_config(cls, config) -> Optional['Recorder']:
+        """Recorder for ``UPSTREAM_RECORDING``, or None when recording is off"""
+        mode = getattr(config, 'UPSTREAM_RECORDING', None)
+        if not mode:
+            return None
+        return cls(config.UPSTREAM_ARCHIVE_DIR, mode, config.UPSTREAM_REPLAY_TIMING)
+
+    def install(self, session: requests.Session) -> requests.Session:
+        """Route every adapter of ``session`` through the archive, keeping their retry settings"""
+        for prefix, adapter in list(session.adapters.items()):
+            session.mount(prefix, RecordReplayAdapter(self.archive, self.mode, self.simulate_timing,
+                                                      max_retries=adapter.max_retries))
+        if self.mode == REPLAY and hasattr(session, 'metered'):
+            # Replayed responses cost the providers nothing
+            session.metered = False
+        return session
+
+    def session(self) -> requests.Session:
+        """A new ``requests.Session`` that records or replays"""
+        return self.install(requests.Session())
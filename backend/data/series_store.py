@@ -0,0 +1,75 @@
+"""
+Columnar price series snapshot shared copy-on-write between workers
+
+A list of point dicts is thousands of small Python objects whose reference
+counts are written on every access, so a forked worker soon owns a private
+copy of every page they live on. Packing the series into one contiguous
+numpy array per field keeps the data in a handful of large buffers that
+workers only read, and that therefore stay shared with the master process.
+"""
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class SeriesStore:
+    """Read-only snapshot of many price series, one contiguous array per field"""
+
+    def __init__(self, series: Dict[tuple, List[dict]], created: Optional[float] = None):
+        """
+        Args:
+            series: Point lists keyed by ``PredictionService.series_source`` tuples
+            created: When the series were fetched (defaults to now)
+        """
+        self.created = created or time.time()
+        self.index = {}
+
+        fields = sorted({name for points in series.values() if points
+                         for name in points[0] if name != 'timestamp'})
+        total = sum(len(points) for points in series.values())
+
+        self.timestamps = np.empty(total, dtype='datetime64[us]')
+        self.columns = {name: np.full(total, np.nan) for name in fields}
+
+        start = 0
+        for source, points in series.items():
+            if not points:
+                continue
+            stop = start + len(points)
+            names = tuple(name for name in points[0] if name != 'timestamp')
+            has_timestamps = 'timestamp' in points[0]
+            self.timestamps[start:stop] = [p['timestamp'] for p in points] if has_timestamps else np.datetime64('NaT')
+            for name in names:
+                self.columns[name][start:stop] = [p.get(name, np.nan) for p in points]
+            self.index[source] = (start, stop, names, has_timestamps)
+            start = stop
+
+    def __contains__(self, source: tuple) -> bool:
+        return source in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def get(self, source: tuple, max_age: float) -> Optional[Tuple[List[dict], float]]:
+        """
+        Points for ``source`` and their remaining lifetime in seconds
+
+        Returns None when the source is not in the snapshot or the snapshot
+        is older than ``max_age``.
+        """
+        remaining = max_age - (time.time() - self.created)
+        if source not in self.index or remaining <= 0:
+            return None
+
+        start, stop, names, has_timestamps = self.index[source]
+        columns = [self.columns[name][start:stop].tolist() for name in names]
+        points = [dict(zip(names, values)) for values in zip(*columns)]
+        if has_timestamps:
+            timestamps = self.timestamps[start:stop].astype(datetime)
+            points = [{'timestamp': ts.isoformat(), **point} for ts, point in zip(timestamps, points)]
+        return points, remaining
@@ -0,0 +1,627 @@
+"""
+Host-wide rate budgets for upstream APIs
+
+Binance and CoinGecko limit request weight per minute and per IP, so
+every worker process on a host draws from one shared budget per provider.
+The budget state lives in a small file under ``UPSTREAM_STATE_DIR`` and
+is updated under an exclusive ``flock``.
+
+- Interactive fetches (the default) may use the whole budget. Background
+  refreshes leave ``UPSTREAM_INTERACTIVE_RESERVE`` of it free, and while
+  an interactive fetch waits for budget in any process, background ones
+  wait behind it instead of taking the budget first.
+- A ``Retry-After`` on 429/418 blocks the provider for every process.
+- Binance's ``X-MBX-USED-WEIGHT-1M`` header corrects the local count.
+- A circuit breaker per provider and process fails requests fast while
+  the provider is down, without spending budget on them.
+- Timeouts follow each provider's recent latency, and slow GETs can be
+  hedged with a duplicate request, see ``LatencyTracker``.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_for
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import get_config
+from backend.utils import metrics
+from backend.utils.timing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: budgets are shared between threads of one process only
+    fcntl = None
+
+
+# Fetch priorities, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar('upstream_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Run the enclosed upstream fetches at the given priority"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+# Seconds a waiting fetch's place in line outlives its next retry, so the
+# places of processes that died while waiting lapse
+WAITER_GRACE = 1.0
+
+
+class UpstreamBusy(Exception):
+    """The provider's budget had no room before the caller's wait limit"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f'{provider} rate budget exhausted, retry in {retry_after:.1f}s')
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def binance_weight(path: str, params: Dict) -> int:
+    """Request weight of a Binance REST call"""
+    if path.endswith('/klines'):
+        limit = int(params.get('limit', 500))
+        if limit < 100:
+            return 1
+        if limit < 500:
+            return 2
+        if limit <= 1000:
+            return 5
+        return 10
+    return 1
+
+
+class RateBudget:
+    """Per-provider weight budget over fixed windows, shared across processes"""
+
+    def __init__(self, provider: str, capacity: int, window: float = 60.0,
+                 reserve: float = 0.2, state_dir: Optional[str] = None,
+                 weigh: Optional[Callable[[str, Dict], int]] = None,
+                 used_weight_header: Optional[str] = None):
+        """
+        Args:
+            provider: Name used for the state file and in errors
+            capacity: Weight allowed per window
+            window: Window length in seconds, aligned to the wall clock like the providers'
+            reserve: Share of the capacity background fetches leave for interactive ones
+            state_dir: Directory of the shared state file
+            weigh: ``(path, params) -> weight`` of a request, 1 when not given
+            used_weight_header: Response header reporting the weight used this window
+        """
+        self.provider = provider
+        self.capacity = capacity
+        self.window = window
+        self.reserve = reserve
+        self.weigh = weigh or (lambda path, params: 1)
+        self.used_weight_header = used_weight_header
+        self.path = os.path.join(state_dir or tempfile.gettempdir(), f'epiccrypto-upstream-{provider}.json')
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """Exclusive read-modify-write access to the shared state"""
+        with self._lock, open(self.path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except ValueError:
+                    state = {}
+
+                now = time.time()
+                window_start = now - now % self.window
+                if state.get('window_start') != window_start:
+                    state['window_start'] = window_start
+                    state['used'] = 0
+                before = dict(state)
+
+                yield state, now
+
+                if state != before:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def try_acquire(self, weight: int, level: int = INTERACTIVE, waiter: Optional[str] = None) -> float:
+        """
+        Reserve ``weight`` now, returning 0, or the seconds to wait before retrying
+
+        Fetches waiting for budget pass a ``waiter`` id that is the same on
+        every retry. Refused ones hold a place in line until they retry, and
+        no fetch of a lower priority is admitted while a place is held.
+        """
+        limit = self.capacity if level == INTERACTIVE else self.capacity * (1 - self.reserve)
+        weight = min(weight, self.capacity)
+
+        with self._state() as (state, now):
+            # waiter -> [level, next retry, expiry]
+            waiters = {key: place for key, place in state.get('waiters', {}).items() if place[2] > now}
+            blocked_until = state.get('blocked_until', 0)
+            ahead = [place[1] for key, place in waiters.items() if place[0] < level and key != waiter]
+            if now < blocked_until:
+                wait = blocked_until - now
+            elif ahead:
+                wait = max(0.01, min(ahead) - now)
+            elif state['used'] + weight <= limit:
+                state['used'] += weight
+                wait = 0.0
+            else:
+                wait = max(0.01, state['window_start'] + self.window - now)
+
+            if waiter is not None and wait:
+                waiters[waiter] = [level, now + wait, now + wait + WAITER_GRACE]
+            else:
+                waiters.pop(waiter, None)
+            if waiters or 'waiters' in state:
+                state['waiters'] = waiters
+            return wait
+
+    def _leave(self, waiter: str):
+        """Give up a place in line, e.g. after waiting too long"""
+        with self._state() as (state, now):
+            state.get('waiters', {}).pop(waiter, None)
+
+    def available(self, level: Optional[int] = None) -> float:
+        """Weight that could be acquired now without waiting"""
+        level = current_priority() if level is None else level
+        limit = self.capacity if level == INTERACTIVE else self.capacity * (1 - self.reserve)
+        with self._state() as (state, now):
+            if now < state.get('blocked_until', 0):
+                return 0
+            return max(0, limit - state['used'])
+
+    def acquire(self, weight: int = 1, level: Optional[int] = None, max_wait: Optional[float] = None):
+        """Block until ``weight`` fits in the budget, or raise ``UpstreamBusy``"""
+        level = current_priority() if level is None else level
+        deadline = time.monotonic() + (self.max_wait(level) if max_wait is None else max_wait)
+        waiter = uuid.uuid4().hex
+        while True:
+            wait = self.try_acquire(weight, level, waiter)
+            if not wait:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                self._leave(waiter)
+                raise UpstreamBusy(self.provider, wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, weight: int = 1, level: Optional[int] = None,
+                            max_wait: Optional[float] = None):
+        """``acquire`` for coroutines, waiting on the event loop instead of a thread"""
+        level = current_priority() if level is None else level
+        deadline = time.monotonic() + (self.max_wait(level) if max_wait is None else max_wait)
+        loop = asyncio.get_running_loop()
+        waiter = uuid.uuid4().hex
+        while True:
+            # The shared state file is locked, which must not stall the loop
+            wait = await loop.run_in_executor(None, self.try_acquire, weight, level, waiter)
+            if not wait:
+                return
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                await loop.run_in_executor(None, self._leave, waiter)
+                raise UpstreamBusy(self.provider, wait)
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def max_wait(level: int) -> float:
+        """Seconds a fetch may wait for budget: short for interactive, longer for background"""
+        config = get_config()
+        return config.UPSTREAM_MAX_WAIT if level == INTERACTIVE else config.UPSTREAM_MAX_WAIT * 6
+
+    def record(self, status: int, headers):
+        """Update the shared state from an upstream response"""
+        retry_after = headers.get('Retry-After') if status in (418, 429) else None
+        used = headers.get(self.used_weight_header) if self.used_weight_header else None
+        if retry_after is None and used is None:
+            return
+
+        with self._state() as (state, now):
+            if used is not None:
+                try:
+                    state['used'] = max(state['used'], int(used))
+                except ValueError:
+                    pass
+            if retry_after is not None:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    delay = self.window
+                state['blocked_until'] = max(state.get('blocked_until', 0), now + delay)
+                if status == 429:
+                    state['used'] = max(state['used'], self.capacity)
+
+    def weight_of(self, url: str, params: Optional[Dict] = None) -> int:
+        parsed = urlparse(url)
+        merged = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        merged.update(params or {})
+        return self.weigh(parsed.path, merged)
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def get_budget(provider: str) -> RateBudget:
+    """Process-wide budget object for ``binance`` or ``coingecko``"""
+    with _budgets_lock:
+        budget = _budgets.get(provider)
+        if budget is None:
+            config = get_config()
+            if provider == 'binance':
+                budget = RateBudget('binance', config.BINANCE_WEIGHT_PER_MINUTE,
+                                    reserve=config.UPSTREAM_INTERACTIVE_RESERVE,
+                                    state_dir=config.UPSTREAM_STATE_DIR, weigh=binance_weight,
+                                    used_weight_header='X-MBX-USED-WEIGHT-1M')
+            else:
+                budget = RateBudget(provider, config.COINGECKO_CALLS_PER_MINUTE,
+                                    reserve=config.UPSTREAM_INTERACTIVE_RESERVE,
+                                    state_dir=config.UPSTREAM_STATE_DIR)
+            _budgets[provider] = budget
+        return budget
+
+
+def count_request(provider: str, status: Optional[int]):
+    """Count an upstream request by status class, ``error`` when no response came back"""
+    metrics.inc('upstream_requests_total', provider=provider,
+                status=f'{status // 100}xx' if status else 'error')
+
+
+class CircuitOpen(Exception):
+    """The provider's circuit breaker is open, so the request was not sent"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f'{provider} circuit open, retry in {retry_after:.1f}s')
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for one provider
+
+    After ``threshold`` consecutive failures (connection errors, timeouts
+    and 5xx responses) the breaker opens and requests fail at once with
+    ``CircuitOpen`` for ``cooldown`` seconds. Then it lets a single probe
+    through (half-open): a response closes it again, another failure
+    reopens it for a further cooldown. A probe that never reports back
+    frees its slot after one cooldown. Rate limiting (418/429) is left to
+    the budgets and counts as neither success nor failure.
+    """
+
+    def __init__(self, provider: str, threshold: int = 5, cooldown: float = 30.0):
+        self.provider = provider
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        self.state = state
+        metrics.inc('upstream_breaker_transitions_total', provider=self.provider, state=state)
+
+    def before_request(self):
+        """Raise ``CircuitOpen`` unless a request may be sent now"""
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self.opened_at + self.cooldown - now
+                if remaining > 0:
+                    raise CircuitOpen(self.provider, remaining)
+                self._transition(HALF_OPEN)
+            elif self.state == HALF_OPEN and self.probe_started is not None:
+                remaining = self.probe_started + self.cooldown - now
+                if remaining > 0:
+                    raise CircuitOpen(self.provider, remaining)
+            elif self.state == CLOSED:
+                return
+            self.probe_started = now
+
+    def record(self, status: Optional[int]):
+        """Update the breaker from a response status, None when no response came back"""
+        if status in (418, 429):
+            return
+        with self._lock:
+            self.probe_started = None
+            if status is not None and status < 500:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._transition(CLOSED)
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+
+_breakers = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Process-wide circuit breaker for a provider"""
+    with _budgets_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            config = get_config()
+            breaker = _breakers[provider] = CircuitBreaker(provider, config.UPSTREAM_BREAKER_THRESHOLD,
+                                                           config.UPSTREAM_BREAKER_COOLDOWN)
+        return breaker
+
+
+# Adaptive timeouts are this many times the provider's recent p99 latency
+TIMEOUT_FACTOR = 3
+# Response times kept per provider, and needed before they are relied on
+LATENCY_WINDOW = 256
+MIN_SAMPLES = 20
+# Hedge credit is capped, so a quiet period does not bank a burst of hedges
+MAX_HEDGE_CREDIT = 2.0
+# Threads per session running hedged requests (each uses one or two)
+HEDGE_WORKERS = 32
+
+
+class LatencyTracker:
+    """
+    Recent response times of one provider, for adaptive timeouts and hedging
+
+    Until ``MIN_SAMPLES`` responses have been seen, requests use the
+    maximum timeout and are not hedged. Every request earns ``hedge_rate``
+    of a hedge credit and every hedge spends one, so at most that share of
+    requests is sent twice.
+    """
+
+    def __init__(self, provider: str, min_timeout: float = 1.0, max_timeout: float = 10.0,
+                 hedge_rate: float = 0.05):
+        """
+        Args:
+            provider: Name used in metrics
+            min_timeout: Lower bound of the adaptive timeout in seconds
+            max_timeout: Upper bound, and the timeout until enough responses were seen
+            hedge_rate: Largest share of requests that may be hedged, 0 disables hedging
+        """
+        self.provider = provider
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.hedge_rate = hedge_rate
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.credit = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """``q``-th percentile of the recent response times, None while there are too few"""
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100.0))]
+
+    def timeout(self) -> float:
+        """Seconds to wait for a response: a multiple of p99, within the bounds"""
+        p99 = self.percentile(99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, TIMEOUT_FACTOR * p99))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a request may be hedged (p95), or None when it may not be"""
+        if self.hedge_rate <= 0:
+            return None
+        with self._lock:
+            self.credit = min(MAX_HEDGE_CREDIT, self.credit + self.hedge_rate)
+            if self.credit < 1:
+                return None
+        return self.percentile(95)
+
+    def take_hedge(self) -> bool:
+        """Spend a hedge credit, False when none is left"""
+        with self._lock:
+            if self.credit < 1:
+                return False
+            self.credit -= 1
+            return True
+
+    def refund_hedge(self):
+        """Return a credit spent on a hedge that was not sent after all"""
+        with self._lock:
+            self.credit = min(MAX_HEDGE_CREDIT, self.credit + 1)
+
+
+_latencies = {}
+
+
+def get_latency(provider: str) -> LatencyTracker:
+    """Process-wide latency tracker for a provider"""
+    with _budgets_lock:
+        latency = _latencies.get(provider)
+        if latency is None:
+            config = get_config()
+            latency = _latencies[provider] = LatencyTracker(provider, config.UPSTREAM_TIMEOUT_MIN,
+                                                            config.UPSTREAM_TIMEOUT,
+                                                            config.UPSTREAM_HEDGE_RATE)
+        return latency
+
+
+class BudgetRouter:
+    """Maps request URLs to the budget of the API root they start with"""
+
+    def __init__(self, roots: Dict[str, RateBudget]):
+        # Longest root first, so a stand-in serving both APIs on one host still splits them
+        self.roots = sorted(((root.rstrip('/'), budget) for root, budget in roots.items()),
+                            key=lambda item: len(item[0]), reverse=True)
+
+    def budget_for(self, url: str) -> Optional[RateBudget]:
+        for root, budget in self.roots:
+            if url.startswith(root):
+                return budget
+        return None
+
+
+class UpstreamSession(requests.Session):
+    """
+    ``requests.Session`` that draws every request from its provider's budget
+
+    Requests time out after the provider's adaptive timeout (or the
+    caller's, when shorter). A GET still unanswered after the provider's
+    p95 latency is sent a second time, when hedge credit, the breaker and
+    the budget allow it without waiting, and the first response wins.
+    Hedged requests run on the session's own threads, which ``close``
+    stops; the losing response is closed as soon as it arrives.
+    """
+
+    def __init__(self, roots: Dict[str, RateBudget], retry_roots: Tuple[str, ...] = (), retries: int = 5):
+        """
+        Args:
+            roots: Budget for each API root URL
+            retry_roots: Roots whose transient errors (connection, 502-504)
+                are retried with backoff, like pycoingecko's own session
+            retries: Retry attempts for those roots
+        """
+        super().__init__()
+        self.router = BudgetRouter(roots)
+        # False when responses do not come from the providers (e.g. replayed ones)
+        self.metered = True
+        self._hedge_pool = None
+        self._hedge_pool_lock = threading.Lock()
+        for root in retry_roots:
+            self.mount(root, HTTPAdapter(max_retries=Retry(total=retries, backoff_factor=0.5,
+                                                           status_forcelist=[502, 503, 504])))
+
+    def request(self, method, url, params=None, **kwargs):
+        budget = self.router.budget_for(url)
+        if budget is None:
+            return super().request(method, url, params=params, **kwargs)
+
+        latency = get_latency(budget.provider)
+        timeout = latency.timeout()
+        # The caller's timeout is an upper bound (pycoingecko always sends 120 s)
+        if isinstance(kwargs.get('timeout'), (int, float)):
+            timeout = min(timeout, kwargs['timeout'])
+        kwargs['timeout'] = timeout
+
+        breaker = get_breaker(budget.provider) if self.metered else None
+        if breaker is not None:
+            # Before the budget, so an outage does not use up quota
+            breaker.before_request()
+            budget.acquire(budget.weight_of(url, params))
+        with span(budget.provider):
+            # Only a request that could be hedged pays for a second thread
+            hedgeable = breaker is not None and breaker.state == CLOSED and method.upper() == 'GET'
+            delay = latency.hedge_delay() if hedgeable else None
+            if delay is None:
+                return self._attempt(budget, breaker, latency, method, url, params, kwargs)
+            return self._hedged(budget, breaker, latency, delay, method, url, params, kwargs)
+
+    def _attempt(self, budget: RateBudget, breaker: Optional[CircuitBreaker], latency: LatencyTracker,
+                 method, url, params, kwargs) -> requests.Response:
+        """Send one request, reporting its outcome to the budget, breaker and latency tracker"""
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, params=params, **kwargs)
+        except requests.RequestException as e:
+            if isinstance(e, requests.Timeout):
+                # Timeouts count at their full length, so a slowing provider raises its timeout
+                latency.observe(time.perf_counter() - start)
+            count_request(budget.provider, None)
+            if breaker is not None:
+                breaker.record(None)
+            raise
+        if response.status_code < 500:
+            latency.observe(time.perf_counter() - start)
+        count_request(budget.provider, response.status_code)
+        if breaker is not None:
+            breaker.record(response.status_code)
+            budget.record(response.status_code, response.headers)
+        return response
+
+    def _hedged(self, budget: RateBudget, breaker: CircuitBreaker, latency: LatencyTracker, delay: float,
+                method, url, params, kwargs) -> requests.Response:
+        """Send a request, and a duplicate if it is unanswered after ``delay``; the first response wins"""
+        def attempt():
+            return self._attempt(budget, breaker, latency, method, url, params, kwargs)
+
+        pool = self._hedge_executor()
+        primary = pool.submit(attempt)
+        attempts = {primary: False}
+        if not wait_for([primary], timeout=delay).done and breaker.state == CLOSED and latency.take_hedge():
+            if budget.try_acquire(budget.weight_of(url, params)):
+                latency.refund_hedge()
+            else:
+                attempts[pool.submit(attempt)] = True
+
+        # An error only wins when the other attempt fails as well
+        winner = None
+        for future in as_completed(attempts):
+            winner = future
+            if future.exception() is None:
+                break
+        for future in attempts:
+            if future is not winner:
+                future.add_done_callback(_close_response)
+
+        if len(attempts) > 1:
+            metrics.inc('upstream_hedges_total', provider=budget.provider,
+                        result='won' if attempts[winner] else 'lost')
+        return winner.result()
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        """Threads for hedged requests, created on first use and stopped by ``close``"""
+        with self._hedge_pool_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix='upstream-hedge')
+            return self._hedge_pool
+
+    def close(self):
+        """Close the connections, then wait for attempts still running (their timeouts bound the wait)"""
+        super().close()
+        with self._hedge_pool_lock:
+            pool, self._hedge_pool = self._hedge_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+def _close_response(future: Future):
+    """Release the connection of a hedged attempt whose response lost the race"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
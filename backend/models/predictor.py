@@ -2,19 +2,39 @@
 AI/ML models for crypto price prediction
 Supports multiple timeframes and prediction methods
 """
+import threading
+import time
 import numpy as np
 from typing import Dict, List, Tuple, Optional
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import LinearRegression
-from statsmodels.tsa.arima.model import ARIMA
+from backend.utils.timing import timed
 import warnings
 warnings.filterwarnings('ignore')
 
 
+def _horizon_steps(periods_ahead: int, horizons: Optional[List[int]] = None) -> np.ndarray:
+    """Forecast steps to evaluate: the requested horizons, or 1..periods_ahead"""
+    if horizons:
+        steps = np.unique(np.asarray(horizons, dtype=int))
+        if steps[0] < 1:
+            raise ValueError('Horizons must be positive')
+        return steps
+    return np.arange(1, max(int(periods_ahead), 1) + 1)
+
+
+def _path_steps(max_step: int, path_points: int) -> np.ndarray:
+    """Evenly spaced steps (always including the last) for a downsampled path"""
+    count = max(1, min(int(path_points), max_step))
+    return np.unique(np.linspace(1, max_step, count).round().astype(int))
+
+
 class CryptoPricePredictor:
     """Multi-model crypto price predictor"""
     
     def __init__(self):
+        # sklearn is imported on first use to keep app start-up fast
+        from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+        from sklearn.linear_model import LinearRegression
+        
         self.models = {
             'rf': RandomForestRegressor(n_estimators=100, random_state=42),
             'gb': GradientBoostingRegressor(n_estimators=100, random_state=42),
@@ -22,6 +42,7 @@ class CryptoPricePredictor:
         }
         self.trained_models = {}
         
+    @timed('ensemble_fit')
     def train_ensemble(self, X: np.ndarray, y: np.ndarray) -> Dict:
         """Train ensemble of models"""
         results = {}
@@ -34,7 +55,7 @@ class CryptoPricePredictor:
                 model.fit(X, y)
                 self.trained_models[name] = model
                 score = model.score(X, y)
-                results[name] = {'trained': True, 'score': float(score)}
+                results[name] = {'trained': True, 'score': score}
             except Exception as e:
                 results[name] = {'trained': False, 'error': str(e)}
         
@@ -47,7 +68,7 @@ class CryptoPricePredictor:
         for name, model in self.trained_models.items():
             try:
                 pred = model.predict(X)
-                predictions[name] = pred.tolist() if hasattr(pred, 'tolist') else [float(pred)]
+                predictions[name] = np.atleast_1d(pred)
             except Exception as e:
                 predictions[name] = None
         
@@ -55,12 +76,20 @@ class CryptoPricePredictor:
         valid_preds = [p for p in predictions.values() if p is not None]
         if valid_preds:
             ensemble_pred = np.mean(valid_preds, axis=0)
-            predictions['ensemble'] = ensemble_pred.tolist() if hasattr(ensemble_pred, 'tolist') else [float(ensemble_pred)]
+            predictions['ensemble'] = np.atleast_1d(ensemble_pred)
         
         return predictions
     
-    def predict_trend_simple(self, prices: List[float], periods_ahead: int = 1) -> Dict:
-        """Simple trend prediction using linear regression"""
+    @timed('trend')
+    def predict_trend_simple(self, prices: List[float], periods_ahead: int = 1,
+                             horizons: Optional[List[int]] = None,
+                             path_points: Optional[int] = None) -> Dict:
+        """
+        Simple trend prediction using linear regression
+
+        The fitted line is closed form, so each horizon is evaluated directly
+        instead of producing every intermediate step.
+        """
         if len(prices) < 5:
             return {'error': 'Insufficient data'}
         
@@ -68,45 +97,79 @@ class CryptoPricePredictor:
         y = np.array(prices)
         
         # Train simple linear model
+        from sklearn.linear_model import LinearRegression
         model = LinearRegression()
         model.fit(X, y)
         
+        steps = _horizon_steps(periods_ahead, horizons)
+        last_index = len(prices) - 1
+        
         # Predict future values
-        future_X = np.arange(len(prices), len(prices) + periods_ahead).reshape(-1, 1)
+        future_X = (last_index + steps).reshape(-1, 1)
         predictions = model.predict(future_X)
         
         # Calculate trend
         slope = model.coef_[0]
         trend = 'bullish' if slope > 0 else 'bearish' if slope < 0 else 'neutral'
         
-        return {
-            'predictions': predictions.tolist(),
+        result = {
+            'predictions': predictions,
             'trend': trend,
-            'slope': float(slope),
-            'confidence': float(model.score(X, y))
+            'slope': slope,
+            'confidence': model.score(X, y)
         }
+        
+        if horizons:
+            result['horizons'] = steps
+        if path_points:
+            path_steps = _path_steps(int(steps.max()), path_points)
+            path_values = model.predict((last_index + path_steps).reshape(-1, 1))
+            result['path'] = {'steps': path_steps, 'values': path_values}
+        
+        return result
     
-    def predict_arima(self, prices: List[float], periods_ahead: int = 1) -> Dict:
-        """ARIMA time series prediction"""
+    @timed('arima')
+    def predict_arima(self, prices: List[float], periods_ahead: int = 1,
+                      horizons: Optional[List[int]] = None,
+                      path_points: Optional[int] = None) -> Dict:
+        """
+        ARIMA time series prediction
+
+        The state-space forecast for the furthest horizon is computed in a
+        single call and the requested horizons are sliced out of it, so only
+        those values (and an optional downsampled path) are returned.
+        """
         try:
             if len(prices) < 20:
                 return {'error': 'Insufficient data for ARIMA'}
             
-            # Fit ARIMA model
+            steps = _horizon_steps(periods_ahead, horizons)
+            
+            # Fit ARIMA model (statsmodels is imported on first use)
+            from statsmodels.tsa.arima.model import ARIMA
             model = ARIMA(prices, order=(5, 1, 0))
             fitted_model = model.fit()
             
             # Make predictions
-            forecast = fitted_model.forecast(steps=periods_ahead)
+            forecast = np.asarray(fitted_model.forecast(steps=int(steps.max())))
             
-            return {
-                'predictions': forecast.tolist() if hasattr(forecast, 'tolist') else [float(forecast)],
+            result = {
+                'predictions': forecast[steps - 1],
                 'method': 'ARIMA',
-                'aic': float(fitted_model.aic)
+                'aic': fitted_model.aic
             }
+            
+            if horizons:
+                result['horizons'] = steps
+            if path_points:
+                path_steps = _path_steps(len(forecast), path_points)
+                result['path'] = {'steps': path_steps, 'values': forecast[path_steps - 1]}
+            
+            return result
         except Exception as e:
             return {'error': f'ARIMA prediction failed: {str(e)}'}
     
+    @timed('momentum')
     def analyze_momentum(self, prices: List[float]) -> Dict:
         """Analyze price momentum"""
         if len(prices) < 10:
@@ -125,9 +188,9 @@ class CryptoPricePredictor:
         volatility = np.std(prices[-20:]) if len(prices) >= 20 else np.std(prices)
         
         return {
-            'momentum': float(momentum),
-            'volatility': float(volatility),
-            'recent_avg': float(recent_avg),
+            'momentum': momentum,
+            'volatility': volatility,
+            'recent_avg': recent_avg,
             'signal': 'strong_buy' if momentum > 5 else 'buy' if momentum > 2 else 'hold' if momentum > -2 else 'sell' if momentum > -5 else 'strong_sell'
         }
 
@@ -142,44 +205,152 @@ class MultiTimeframePredictor:
         '30m': {'interval': '30m', 'limit': 100, 'periods': 1},
         '1h': {'interval': '1h', 'limit': 100, 'periods': 1},
         'daily': {'interval': '1d', 'limit': 100, 'periods': 1},
-        'monthly': {'interval': '1d', 'limit': 365, 'periods': 30},
-        'yearly': {'interval': '1d', 'limit': 730, 'periods': 365}
+        'monthly': {'interval': '1d', 'limit': 365, 'periods': 30, 'horizons': [1, 7, 30]},
+        'yearly': {'interval': '1d', 'limit': 730, 'periods': 365, 'horizons': [1, 7, 30, 365]}
     }
     
+    # Longest horizon (in interval steps) a caller may request
+    MAX_HORIZON = 365
+    
+    # Degradation ladder: cheap estimators always run first, expensive ones
+    # only while the latency budget still covers their expected cost
+    ESTIMATORS = [
+        ('momentum', 'cheap'),
+        ('trend', 'cheap'),
+        ('arima', 'expensive'),
+    ]
+    
+    # Initial cost guesses (ms), refined from observed run times
+    DEFAULT_COST_MS = {'momentum': 1.0, 'trend': 2.0, 'arima': 250.0}
+    
+    # Points each estimator reads: a fixed window, or (None) the timeframe's
+    # configured ``limit``, but never fewer than it needs to produce a result
+    LOOKBACK = {'momentum': 20, 'trend': None, 'arima': None}
+    MIN_POINTS = {'momentum': 10, 'trend': 5, 'arima': 20}
+    
     def __init__(self):
         self.predictor = CryptoPricePredictor()
+        self.cost_ms = dict(self.DEFAULT_COST_MS)
+        # Worker threads share the estimates
+        self._cost_lock = threading.Lock()
+    
+    @classmethod
+    def lookbacks(cls, timeframe: str) -> Dict[str, int]:
+        """Newest points each estimator reads for a timeframe, so fetches can be planned from them"""
+        limit = cls.TIMEFRAMES[timeframe]['limit']
+        return {name: max(cls.LOOKBACK[name] or limit, cls.MIN_POINTS[name]) for name, _ in cls.ESTIMATORS}
     
-    def predict_for_timeframe(self, data: List[dict], timeframe: str) -> Dict:
-        """Make prediction for specific timeframe"""
+    def predict_for_timeframe(self, data: List[dict], timeframe: str,
+                              horizons: Optional[List[int]] = None,
+                              path_points: Optional[int] = None,
+                              budget_ms: Optional[float] = None,
+                              deadline: Optional[float] = None) -> Dict:
+        """
+        Make prediction for specific timeframe
+
+        Timeframes with a ``horizons`` config (or an explicit ``horizons``
+        argument) are forecast only at those steps; ``path_points`` adds a
+        downsampled view of the full forecast path.
+
+        ``budget_ms`` (or an absolute ``time.perf_counter()`` ``deadline``)
+        bounds the work: expensive estimators are skipped when they are not
+        expected to finish in time, and ``components`` reports what ran.
+        """
+        if deadline is None and budget_ms is not None:
+            deadline = time.perf_counter() + budget_ms / 1000.0
+        
         if timeframe not in self.TIMEFRAMES:
             return {'error': f'Invalid timeframe: {timeframe}'}
         
         if not data or len(data) < 10:
             return {'error': 'Insufficient data'}
         
+        config = self.TIMEFRAMES[timeframe]
+        periods = config['periods']
+        horizons = horizons or config.get('horizons')
+        
+        if horizons and not all(0 < int(h) <= self.MAX_HORIZON for h in horizons):
+            return {'error': f'Horizons must be between 1 and {self.MAX_HORIZON}'}
+        
         # Extract prices
         prices = [d.get('price', d.get('close', 0)) for d in data]
+        # A series shared with other timeframes may be longer than an estimator reads
+        window = {name: prices[-lookback:] for name, lookback in self.lookbacks(timeframe).items()}
         
-        config = self.TIMEFRAMES[timeframe]
-        periods = config['periods']
+        estimators = {
+            'momentum': lambda: self.predictor.analyze_momentum(window['momentum']),
+            'trend': lambda: self.predictor.predict_trend_simple(window['trend'], periods, horizons, path_points),
+            'arima': lambda: self.predictor.predict_arima(window['arima'], periods, horizons, path_points),
+        }
+        outputs, components = self._run_ladder(estimators, deadline)
         
-        # Get predictions
-        trend_pred = self.predictor.predict_trend_simple(prices, periods)
-        arima_pred = self.predictor.predict_arima(prices, periods)
-        momentum = self.predictor.analyze_momentum(prices)
+        trend_pred = outputs['trend']
+        momentum = outputs['momentum']
         
         # Combine predictions
         result = {
             'timeframe': timeframe,
-            'current_price': float(prices[-1]),
+            'current_price': prices[-1],
             'trend_prediction': trend_pred,
-            'arima_prediction': arima_pred,
+            'arima_prediction': outputs['arima'],
             'momentum_analysis': momentum,
-            'recommendation': self._generate_recommendation(trend_pred, momentum)
+            'recommendation': self._generate_recommendation(trend_pred, momentum),
+            'components': components
         }
         
+        if horizons:
+            result['horizon_labels'] = self.horizon_labels(timeframe, horizons)
+        
         return result
     
+    def _run_ladder(self, estimators: Dict, deadline: Optional[float]) -> Tuple[Dict, Dict]:
+        """Run estimators cheapest first, skipping expensive ones that would overrun"""
+        started = time.perf_counter()
+        outputs = {}
+        computed, skipped = [], {}
+        
+        for name, cost_class in self.ESTIMATORS:
+            if cost_class != 'cheap' and deadline is not None:
+                remaining_ms = (deadline - time.perf_counter()) * 1000.0
+                with self._cost_lock:
+                    over_budget = remaining_ms < self.cost_ms[name]
+                    if over_budget:
+                        # Let a single slow outlier fade so the estimator gets retried
+                        self.cost_ms[name] = max(self.DEFAULT_COST_MS[name], 0.95 * self.cost_ms[name])
+                if over_budget:
+                    outputs[name] = {'error': 'Skipped to stay within latency budget', 'skipped': True}
+                    skipped[name] = 'budget'
+                    continue
+            
+            t0 = time.perf_counter()
+            outputs[name] = estimators[name]()
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            
+            # Exponentially weighted estimate of what this estimator costs
+            with self._cost_lock:
+                self.cost_ms[name] = 0.8 * self.cost_ms[name] + 0.2 * elapsed_ms
+            
+            if 'error' in outputs[name]:
+                skipped[name] = 'failed'
+            else:
+                computed.append(name)
+        
+        components = {
+            'computed': computed,
+            'skipped': skipped,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000.0, 2)
+        }
+        if deadline is not None:
+            components['degraded'] = any(reason == 'budget' for reason in skipped.values())
+        
+        return outputs, components
+    
+    def horizon_labels(self, timeframe: str, horizons: List[int]) -> List[str]:
+        """Human readable labels for horizon steps, e.g. 7 steps of 1d -> '7d'"""
+        interval = self.TIMEFRAMES[timeframe]['interval']
+        count, unit = int(interval[:-1]), interval[-1]
+        return [f'{int(h) * count}{unit}' for h in sorted(set(horizons))]
+    
     def _generate_recommendation(self, trend: Dict, momentum: Dict) -> Dict:
         """Generate buy/sell/hold recommendation"""
         if 'error' in trend or 'error' in momentum:
@@ -228,17 +399,18 @@ class MultiTimeframePredictor:
         
         return {
             'action': action,
-            'confidence': float(confidence),
+            'confidence': confidence,
             'reason': ', '.join(reason_parts),
             'score': score
         }
     
-    def predict_all_timeframes(self, historical_data: Dict) -> Dict:
-        """Generate predictions for all timeframes"""
+    def predict_all_timeframes(self, historical_data: Dict, budget_ms: Optional[float] = None) -> Dict:
+        """Generate predictions for all timeframes, sharing one latency budget"""
         results = {}
+        deadline = time.perf_counter() + budget_ms / 1000.0 if budget_ms is not None else None
         
         for timeframe in self.TIMEFRAMES.keys():
             data = historical_data.get(timeframe, [])
-            results[timeframe] = self.predict_for_timeframe(data, timeframe)
+            results[timeframe] = self.predict_for_timeframe(data, timeframe, deadline=deadline)
         
         return results
@@ -0,0 +1,134 @@
+"""
+Admission control for requests that cost upstream calls or model work
+
+Each client draws from its own token bucket, and every endpoint class
+(upstream fetches, model compute) has a bounded number of requests in
+flight per process. Requests over either limit are turned away at once
+with a ``Retry-After`` hint instead of queueing behind the work already
+running. Callers only consult the controller on cache misses, so cached
+reads are always served.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """A request turned away by admission control"""
+
+    def __init__(self, status: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+
+class TokenBucket:
+    """Tokens refilled at ``rate`` per second up to ``burst``"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+
+class AdmissionController:
+    """Per-client rate limits plus per-endpoint-class concurrency limits"""
+
+    def __init__(self, rate: float = 5.0, burst: float = 20.0,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 queue_timeout: float = 0.05, max_clients: int = 10000):
+        """
+        Args:
+            rate: Tokens per second granted to each client (0 disables rate limiting)
+            burst: Bucket capacity, i.e. the largest burst a client may send
+            concurrency: Requests allowed in flight per endpoint class
+                (classes not listed, or with 0, are unbounded)
+            queue_timeout: Seconds to wait for a free slot before shedding
+            max_clients: Buckets kept in memory; least recently seen are evicted
+        """
+        self.rate = rate
+        self.burst = burst
+        self.queue_timeout = queue_timeout
+        self.max_clients = max_clients
+        self.semaphores = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in (concurrency or {}).items() if limit
+        }
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'AdmissionController':
+        return cls(
+            rate=config.get('ADMISSION_RATE', 5.0),
+            burst=config.get('ADMISSION_BURST', 20.0),
+            concurrency={
+                'upstream': config.get('ADMISSION_UPSTREAM_CONCURRENCY', 2),
+                'model': config.get('ADMISSION_MODEL_CONCURRENCY', 2),
+            },
+            queue_timeout=config.get('ADMISSION_QUEUE_TIMEOUT', 0.05),
+        )
+
+    def _take(self, client: str, cost: float) -> float:
+        """Take ``cost`` tokens, returning 0 or the seconds until they are available"""
+        if not self.rate:
+            return 0.0
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                return 0.0
+            return (cost - bucket.tokens) / self.rate
+
+    def _refund(self, client: str, cost: float):
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is not None:
+                bucket.tokens = min(self.burst, bucket.tokens + min(cost, self.burst))
+
+    def acquire(self, client: str, endpoint_class: str, cost: float = 1) -> Callable[[], None]:
+        """
+        Admit a request or raise ``AdmissionRejected``
+
+        Returns the function that releases the request's concurrency slot;
+        it must be called exactly once when the work is done.
+        """
+        wait = self._take(client, cost)
+        if wait:
+            raise AdmissionRejected(429, math.ceil(wait), 'Rate limit exceeded')
+
+        semaphore = self.semaphores.get(endpoint_class)
+        if semaphore is None:
+            return lambda: None
+        if not semaphore.acquire(timeout=self.queue_timeout):
+            # Shed without charging the client for work that never ran
+            self._refund(client, cost)
+            raise AdmissionRejected(503, 1, 'Server busy, try again shortly')
+        return semaphore.release
+
+    @contextmanager
+    def admit(self, client: str, endpoint_class: str, cost: float = 1):
+        release = self.acquire(client, endpoint_class, cost)
+        try:
+            yield
+        finally:
+            release()
@@ -2,45 +2,123 @@
 Simple in-memory cache manager
 """
 import time
-from typing import Any, Optional
+from typing import Any, Dict, Optional
+
+
+class CacheEntry:
+    """
+    Cached value with its creation time and expiry
+
+    ``body`` holds the encoded HTTP body (and its content hash) once the
+    entry has been served, see ``backend.utils.response_cache``.
+    """
+
+    __slots__ = ('value', 'created', 'expiry', 'body')
+
+    def __init__(self, value: Any, created: float, expiry: Optional[float]):
+        self.value = value
+        self.created = created
+        self.expiry = expiry
+        self.body = None
+
+    def ttl_remaining(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until expiry, or None for entries that never expire"""
+        if self.expiry is None:
+            return None
+        return max(0.0, self.expiry - (now or time.time()))
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return self.expiry is not None and (now or time.time()) >= self.expiry
 
 
 class CacheManager:
     """Simple in-memory cache with TTL support"""
-    
+
     def __init__(self):
         self.cache = {}
-        
+        # [hits, misses, evictions] per key prefix, see ``stats``
+        self._counts = {}
+
+    def _count(self, key: str, field: int):
+        counts = self._counts.get(key_prefix(key))
+        if counts is None:
+            counts = self._counts[key_prefix(key)] = [0, 0, 0]
+        counts[field] += 1
+
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired"""
-        if key in self.cache:
-            value, expiry = self.cache[key]
-            if expiry is None or time.time() < expiry:
-                return value
-            else:
-                del self.cache[key]
+        entry = self.get_entry(key)
+        return entry.value if entry is not None else None
+
+    def get_entry(self, key: str, record_miss: bool = True) -> Optional[CacheEntry]:
+        """
+        Get the full cache entry (value plus metadata) if not expired
+
+        Counts a hit or miss for ``stats``. Callers that fall back to a
+        lookup of their own on a miss pass ``record_miss=False`` so the
+        miss is counted once.
+        """
+        entry = self.peek(key)
+        if entry is not None:
+            self._count(key, 0)
+        elif record_miss:
+            self._count(key, 1)
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """``get_entry`` without counting a hit or miss, for metadata lookups"""
+        entry = self.cache.get(key)
+        if entry is not None:
+            if not entry.is_expired():
+                return entry
+            if self.cache.pop(key, None) is not None:
+                self._count(key, 2)
         return None
-    
+
     def set(self, key: str, value: Any, ttl: int = 300):
         """Set value in cache with TTL in seconds"""
-        expiry = time.time() + ttl if ttl else None
-        self.cache[key] = (value, expiry)
-    
+        now = time.time()
+        expiry = now + ttl if ttl else None
+        self.cache[key] = CacheEntry(value, now, expiry)
+
     def delete(self, key: str):
         """Delete key from cache"""
         if key in self.cache:
             del self.cache[key]
-    
+
     def clear(self):
         """Clear all cache"""
         self.cache.clear()
-    
+
     def cleanup(self):
         """Remove expired entries"""
         current_time = time.time()
         expired_keys = [
-            key for key, (_, expiry) in self.cache.items()
-            if expiry is not None and current_time >= expiry
+            key for key, entry in self.cache.items()
+            if entry.is_expired(current_time)
         ]
         for key in expired_keys:
             del self.cache[key]
+            self._count(key, 2)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hits, misses, evictions (expired entries dropped), live entries and encoded bytes per key prefix"""
+        stats = {
+            prefix: {'hits': hits, 'misses': misses, 'evictions': evictions, 'entries': 0, 'bytes': 0}
+            for prefix, (hits, misses, evictions) in list(self._counts.items())
+        }
+        for key, entry in list(self.cache.items()):
+            prefix = stats.setdefault(key_prefix(key), {'hits': 0, 'misses': 0, 'evictions': 0,
+                                                        'entries': 0, 'bytes': 0})
+            prefix['entries'] += 1
+            if entry.body is not None:
+                prefix['bytes'] += entry.body.nbytes
+        return stats
+
+    def reset_stats(self):
+        self._counts.clear()
+
+
+def key_prefix(key: str) -> str:
+    """Key family used in statistics: the part before the first underscore"""
+    return key.split('_', 1)[0]
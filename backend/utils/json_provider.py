@@ -0,0 +1,80 @@
+"""
+JSON encoding with native numpy support
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Model outputs can therefore keep numpy scalars and arrays all
+the way to the response instead of converting them field by field.
+"""
+import json
+from typing import Any
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used instead
+    orjson = None
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Fallback conversions for values neither encoder handles natively"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode to UTF-8 JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits or non-contiguous arrays
+            pass
+    return json.dumps(obj, default=_default, ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj: Any) -> str:
+    """Encode to a JSON string"""
+    return dumps_bytes(obj).decode('utf-8')
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using the fast numpy-aware encoder"""
+
+    # Keep payloads in the order the views build them
+    sort_keys = False
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Compact separators are what the fast encoder produces anyway
+        if kwargs.get('separators') == (',', ':'):
+            kwargs.pop('separators')
+        if kwargs:
+            # Pretty printing and other stdlib options (debug responses)
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return dumps_bytes(obj)
+
+    def response(self, *args: Any, **kwargs: Any):
+        """``jsonify`` responses encoded straight to bytes, unless pretty printed"""
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
@@ -0,0 +1,42 @@
+"""
+Process memory usage for start-up and worker reports
+"""
+import sys
+from typing import Dict
+
+
+def memory_report() -> Dict[str, int]:
+    """
+    Memory of the current process in KiB
+
+    On Linux this reads ``/proc/self/smaps_rollup``: ``rss`` counts pages
+    still shared copy-on-write with the master, ``pss`` divides those
+    between the sharers and ``private`` is what the process owns alone.
+    Elsewhere only the peak RSS from ``getrusage`` is available.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        try:
+            import resource
+        except ImportError:  # Windows
+            return {}
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, KiB on Linux
+        return {'max_rss': peak // 1024 if sys.platform == 'darwin' else peak}
+
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def format_memory(report: Dict[str, int]) -> str:
+    return ', '.join(f'{name}={kib / 1024:.1f}MiB' for name, kib in report.items())
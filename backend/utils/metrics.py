@@ -0,0 +1,300 @@
+"""
+Process metrics aggregated across workers, in Prometheus text format
+
+Each process keeps its counters and gauges in memory and writes a snapshot
+of them (plus the stage histograms from ``backend.utils.timing`` and the
+statistics of every tracked cache) to ``METRICS_DIR/metrics-<pid>.json``.
+A background thread rewrites the snapshot every ``METRICS_FLUSH_INTERVAL``
+seconds while the process is serving requests, and every scrape rewrites
+the scraped process's own. A scrape merges all snapshots in the
+directory: counters and histograms are summed over every process that ever
+wrote one, gauges only over processes that are still running.
+
+The directory should be emptied when the server starts (see
+``gunicorn.conf.py``), otherwise counters of a previous run are included.
+"""
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from backend.utils import timing
+
+PREFIX = 'epiccrypto_'
+
+# Timing stages exported as their own histogram families, by label
+UPSTREAM_STAGES = ('binance', 'coingecko')
+MODEL_STAGES = ('trend', 'arima', 'momentum', 'ensemble_fit', 'indicators')
+
+HELP = {
+    'http_requests_total': ('counter', 'HTTP requests served, by endpoint and status code'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests being served, by endpoint'),
+    'cache_requests_total': ('counter', 'Cache lookups, by key prefix and result'),
+    'cache_evictions_total': ('counter', 'Cache entries dropped on expiry, by key prefix'),
+    'cache_entries': ('gauge', 'Live cache entries, by key prefix'),
+    'cache_body_bytes': ('gauge', 'Encoded response bytes held by cache entries, by key prefix'),
+    'upstream_requests_total': ('counter', 'Upstream API requests, by provider and status class'),
+    'upstream_breaker_transitions_total': ('counter', 'Upstream circuit breaker state changes, by provider and new state'),
+    'upstream_hedges_total': ('counter', 'Hedged upstream requests, by provider and whether the hedge won'),
+    'series_fetches_total': ('counter', 'Candle series fetches, by source and whether it returned data'),
+    'upstream_fallbacks_total': ('counter', 'Upstream fetches skipped after a recent failure (negative) '
+                                            'or answered with stale data (stale)'),
+    'upstream_request_duration_seconds': ('histogram', 'Upstream API request latency, by provider'),
+    'model_duration_seconds': ('histogram', 'Model fit and indicator durations, by method'),
+    'stage_duration_seconds': ('histogram', 'Other timed stages, by stage'),
+}
+
+_counters = {}
+_gauges = {}
+_caches = []
+_lock = threading.Lock()
+_dirty = threading.Event()
+_flusher_pid = None
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Add ``value`` to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge_add(name: str, delta: float, **labels):
+    """Move a gauge up or down"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def track_cache(cache):
+    """Include a ``CacheManager``'s statistics in this process's metrics"""
+    if all(tracked is not cache for tracked in _caches):
+        _caches.append(cache)
+
+
+def reset():
+    """
+    Zero this process's counters, stage histograms and cache statistics
+
+    Called in each forked worker so that work done in the master before the
+    fork (already in the master's own snapshot) is not counted again.
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+    timing.reset()
+    for cache in _caches:
+        cache.reset_stats()
+
+
+def metrics_dir() -> str:
+    from config import get_config
+    return get_config().METRICS_DIR or os.path.join(tempfile.gettempdir(), 'epiccrypto-metrics')
+
+
+def clear_dir(path: Optional[str] = None):
+    """Remove every snapshot, e.g. when the server (re)starts"""
+    for snapshot in glob.glob(os.path.join(path or metrics_dir(), 'metrics-*.json')):
+        try:
+            os.remove(snapshot)
+        except OSError:
+            pass
+
+
+def _stage_family(stage: str) -> Tuple[str, str]:
+    if stage in UPSTREAM_STAGES:
+        return 'upstream_request_duration_seconds', 'provider'
+    if stage in MODEL_STAGES:
+        return 'model_duration_seconds', 'method'
+    return 'stage_duration_seconds', 'stage'
+
+
+def snapshot() -> Dict:
+    """This process's metrics as plain JSON-able lists"""
+    with _lock:
+        counters = [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+        gauges = [[name, dict(labels), value] for (name, labels), value in _gauges.items()]
+
+    for cache in _caches:
+        for prefix, stats in cache.stats().items():
+            counters.append(['cache_requests_total', {'prefix': prefix, 'result': 'hit'}, stats['hits']])
+            counters.append(['cache_requests_total', {'prefix': prefix, 'result': 'miss'}, stats['misses']])
+            counters.append(['cache_evictions_total', {'prefix': prefix}, stats['evictions']])
+            gauges.append(['cache_entries', {'prefix': prefix}, stats['entries']])
+            gauges.append(['cache_body_bytes', {'prefix': prefix}, stats['bytes']])
+
+    histograms = []
+    for stage, histogram in timing.histograms().items():
+        family, label = _stage_family(stage)
+        histograms.append([family, {label: stage}, histogram['buckets'],
+                           histogram['count'], histogram['sum_ms'] / 1000.0])
+
+    return {'pid': os.getpid(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+def flush(path: Optional[str] = None, gauges: bool = True):
+    """Write this process's snapshot, without its gauges for a process that serves no requests"""
+    path = path or metrics_dir()
+    os.makedirs(path, exist_ok=True)
+    target = os.path.join(path, f'metrics-{os.getpid()}.json')
+    data = snapshot()
+    if not gauges:
+        data['gauges'] = []
+    temp = f'{target}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp, target)
+
+
+def _flush_periodically(interval: float):
+    while True:
+        _dirty.wait()
+        time.sleep(interval)
+        _dirty.clear()
+        try:
+            flush()
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+
+def mark_dirty():
+    """Schedule a snapshot write, starting this process's flush thread if needed"""
+    global _flusher_pid
+    if _flusher_pid != os.getpid():
+        from config import get_config
+        with _lock:
+            if _flusher_pid != os.getpid():
+                # Threads do not survive a fork, so each worker starts its own
+                _flusher_pid = os.getpid()
+                threading.Thread(target=_flush_periodically, args=(get_config().METRICS_FLUSH_INTERVAL,),
+                                 name='metrics-flush', daemon=True).start()
+    _dirty.set()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect(path: Optional[str] = None) -> List[Dict]:
+    """Snapshots of every process, this one freshly taken"""
+    path = path or metrics_dir()
+    snapshots = [snapshot()]
+    for name in glob.glob(os.path.join(path, 'metrics-*.json')):
+        try:
+            with open(name) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data.get('pid') == os.getpid():
+            continue
+        if not _alive(data.get('pid', 0)):
+            data['gauges'] = []
+        snapshots.append(data)
+    return snapshots
+
+
+def merge(snapshots: Iterable[Dict]) -> Dict:
+    """Sum counters, gauges and histograms with identical names and labels"""
+    counters, gauges, histograms = {}, {}, {}
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in data['gauges']:
+            key = _key(name, labels)
+            gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, count, total in data['histograms']:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0, 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += count
+            merged[2] += total
+    return {'counter': counters, 'gauge': gauges, 'histogram': histograms}
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(merged: Dict) -> str:
+    """Prometheus text exposition (format 0.0.4) of merged metrics"""
+    families = {}
+    for kind, samples in merged.items():
+        for (name, labels), value in samples.items():
+            families.setdefault(name, (kind, []))[1].append((labels, value))
+
+    bounds = [_number(ms / 1000.0) for ms in timing.BUCKETS_MS] + ['+Inf']
+    lines = []
+    for name in sorted(families):
+        kind, samples = families[name]
+        metric = PREFIX + name
+        lines.append(f'# HELP {metric} {HELP.get(name, (kind, name))[1]}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for labels, value in sorted(samples):
+            if kind != 'histogram':
+                lines.append(f'{metric}{_labels(labels)} {_number(value)}')
+                continue
+            buckets, count, total = value
+            cumulative = 0
+            for bound, bucket in zip(bounds, buckets):
+                cumulative += bucket
+                lines.append(f'{metric}_bucket{_labels(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{metric}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{metric}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def exposition(path: Optional[str] = None) -> str:
+    """Current metrics of every worker, ready to serve to a scraper"""
+    path = path or metrics_dir()
+    try:
+        flush(path)
+    except OSError as e:
+        print(f"Error writing metrics snapshot: {e}")
+    return render(merge(collect(path)))
+
+
+def init_app(app):
+    """Count requests per endpoint and keep this worker's snapshot fresh"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g.metrics_endpoint = request.endpoint or 'unknown'
+        gauge_add('http_requests_in_flight', 1, endpoint=g.metrics_endpoint)
+
+    @app.after_request
+    def _count_request(response):
+        endpoint = g.get('metrics_endpoint', request.endpoint or 'unknown')
+        inc('http_requests_total', endpoint=endpoint, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is None:
+            return
+        if exc is not None:
+            inc('http_requests_total', endpoint=endpoint, status=500)
+        gauge_add('http_requests_in_flight', -1, endpoint=endpoint)
+        mark_dirty()
@@ -0,0 +1,234 @@
+"""
+On-demand request profiling
+
+With ``PROFILING`` on, a request is profiled when it sends the admin
+header ``X-Profile: <PROFILE_TOKEN>`` or is picked by ``PROFILE_SAMPLE_RATE``.
+The profile covers the view (not the streaming of its body) and is written
+to ``PROFILE_DIR`` as either
+
+- ``collapsed``: stacks of the request's thread sampled every
+  ``PROFILE_INTERVAL_MS``, one ``frame;frame;frame count`` line per stack,
+  ready for flamegraph.pl or speedscope. Overhead is one stack walk per
+  interval, so this is the format to use on live traffic.
+- ``pstats``: a cProfile of the request, for ``python -m pstats``. Exact
+  call counts, but every Python call pays for it.
+
+Profiled responses name their file in an ``X-Profile-Id`` header.
+"""
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+EXTENSIONS = {'collapsed': 'collapsed', 'pstats': 'pstats'}
+PROFILE_NAME = re.compile(r'^(?P<created>\d{8}T\d{6}\.\d{3})-(?P<endpoint>[\w.]+)-(?P<pid>\d+)-'
+                          r'(?P<duration_ms>\d+)ms\.(?P<format>collapsed|pstats)$')
+
+
+def collapse(frame) -> str:
+    """One stack as ``outermost;...;innermost`` of ``file.py:function`` names"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> 'StackSampler':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class TracingProfile:
+    """cProfile of the calling thread, with the same interface as ``StackSampler``"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> 'TracingProfile':
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path: str):
+        self.profile.dump_stats(path)
+
+
+class RequestProfiler:
+    """Decides which requests to profile and manages the profile files"""
+
+    def __init__(self, directory: Optional[str] = None, sample_rate: float = 0.0,
+                 token: Optional[str] = None, profile_format: str = 'collapsed',
+                 interval_ms: float = 5, keep: int = 100):
+        """
+        Args:
+            directory: Where profiles are written (default: <tmp>/epiccrypto-profiles)
+            sample_rate: Share of all requests profiled at random
+            token: Value of the ``X-Profile`` header that profiles a request
+                and unlocks the profile listing; without one, header requests
+                are ignored and profiles can only be read from ``directory``
+            profile_format: ``collapsed`` or ``pstats``
+            interval_ms: Stack sampling interval of the ``collapsed`` format
+            keep: Number of newest profiles kept, older ones are deleted
+        """
+        if profile_format not in EXTENSIONS:
+            raise ValueError(f'Unknown profile format: {profile_format}')
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'epiccrypto-profiles')
+        self.sample_rate = sample_rate
+        self.token = token
+        self.format = profile_format
+        self.interval = interval_ms / 1000.0
+        self.keep = keep
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config) -> 'RequestProfiler':
+        return cls(directory=config.get('PROFILE_DIR'),
+                   sample_rate=config.get('PROFILE_SAMPLE_RATE', 0.0),
+                   token=config.get('PROFILE_TOKEN'),
+                   profile_format=config.get('PROFILE_FORMAT', 'collapsed'),
+                   interval_ms=config.get('PROFILE_INTERVAL_MS', 5),
+                   keep=config.get('PROFILE_KEEP', 100))
+
+    def authorized(self, header: Optional[str]) -> bool:
+        """Whether the ``X-Profile`` header carries the admin token (never without one)"""
+        if self.token is None:
+            return False
+        return header is not None and hmac.compare_digest(header.encode(), self.token.encode())
+
+    def wants(self, header: Optional[str]) -> bool:
+        """Whether to profile a request sending the given ``X-Profile`` header"""
+        if header is not None and self.authorized(header):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Start profiling the calling thread"""
+        if self.format == 'pstats':
+            return TracingProfile().start()
+        return StackSampler(threading.get_ident(), self.interval).start()
+
+    def finish(self, recorder, endpoint: Optional[str], seconds: float) -> Optional[str]:
+        """Stop a recorder started by ``start`` and write its profile, returning the file name"""
+        recorder.stop()
+        created = datetime.now().strftime('%Y%m%dT%H%M%S.%f')[:-3]
+        endpoint = re.sub(r'[^\w.]', '_', endpoint or 'unknown')
+        name = f'{created}-{endpoint}-{os.getpid()}-{int(seconds * 1000)}ms.{EXTENSIONS[self.format]}'
+        try:
+            recorder.write(os.path.join(self.directory, name))
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+            return None
+        self._prune()
+        return name
+
+    def profiles(self, limit: Optional[int] = None) -> List[Dict]:
+        """Profiles on disk, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+
+        profiles = []
+        for name in names:
+            match = PROFILE_NAME.match(name)
+            if match is None:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            created = datetime.strptime(match['created'], '%Y%m%dT%H%M%S.%f')
+            profiles.append({
+                'id': name,
+                'created': created.isoformat(timespec='milliseconds'),
+                'endpoint': match['endpoint'],
+                'pid': int(match['pid']),
+                'duration_ms': int(match['duration_ms']),
+                'format': match['format'],
+                'size': size,
+            })
+        profiles.sort(key=lambda profile: profile['id'], reverse=True)
+        return profiles[:limit] if limit else profiles
+
+    def path_of(self, name: str) -> Optional[str]:
+        """Path of a listed profile, None for names that are not profile files"""
+        if PROFILE_NAME.match(name) is None:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def _prune(self):
+        for profile in self.profiles()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, profile['id']))
+            except OSError:
+                pass
+
+
+def init_app(app):
+    """Profile the app's requests when ``PROFILING`` is on"""
+    from flask import g, request
+
+    if not app.config.get('PROFILING'):
+        return
+    profiler = app.extensions['profiler'] = RequestProfiler.from_config(app.config)
+
+    @app.before_request
+    def _start_profile():
+        if profiler.wants(request.headers.get('X-Profile')):
+            g.profile = (profiler.start(), time.perf_counter())
+
+    def _finish(endpoint):
+        recorder, start = g.pop('profile')
+        return profiler.finish(recorder, endpoint, time.perf_counter() - start)
+
+    @app.after_request
+    def _write_profile(response):
+        if 'profile' in g:
+            name = _finish(request.endpoint)
+            if name is not None:
+                response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def _stop_profile(exc):
+        # after_request does not run when a view raises
+        if 'profile' in g:
+            _finish(request.endpoint)
@@ -0,0 +1,104 @@
+"""
+Pre-encoded response bodies for cached API payloads
+
+A cache entry is JSON encoded once, the first time it is served, and the
+bytes (plus gzip/brotli variants built on first demand) live alongside the
+entry until it expires. Cache hits are answered straight from those bytes.
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, request
+from backend.utils.cache import CacheEntry
+from backend.utils.json_provider import dumps_bytes
+from backend.utils.timing import span
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+
+# Bodies smaller than this are always sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+
+class EncodedBody:
+    """JSON bytes of a payload with lazily built compressed variants"""
+
+    __slots__ = ('raw', 'etag', '_variants')
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.etag = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        self._variants = {}
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the raw body and every compressed variant built so far"""
+        return len(self.raw) + sum(len(data) for data in self._variants.values())
+
+    def encodings(self):
+        """Content codings worth offering for this body, best first"""
+        if len(self.raw) < MIN_COMPRESS_SIZE:
+            return []
+        return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def get(self, encoding: str) -> bytes:
+        """Body bytes in the given content coding"""
+        if encoding == 'identity':
+            return self.raw
+        data = self._variants.get(encoding)
+        if data is None:
+            with span('compress'):
+                if encoding == 'br':
+                    data = brotli.compress(self.raw, quality=5)
+                else:
+                    data = gzip.compress(self.raw, compresslevel=6)
+            self._variants[encoding] = data
+        return data
+
+
+def encoded_body(entry: CacheEntry) -> EncodedBody:
+    """Encode an entry's value once and keep the bytes on the entry"""
+    if entry.body is None:
+        with span('encode'):
+            entry.body = EncodedBody(dumps_bytes(entry.value))
+    return entry.body
+
+
+def cached_response(entry: CacheEntry) -> Response:
+    """
+    Response for a cache entry with validators and content negotiation
+
+    Sets ETag, Last-Modified and Cache-Control (max-age from the remaining
+    TTL). A matching ``If-None-Match`` (or, without one, ``If-Modified-Since``)
+    gets an empty 304; otherwise the stored bytes are sent in the best
+    encoding the client accepts.
+    """
+    body = encoded_body(entry)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(body.etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and int(entry.created) <= since.timestamp()
+
+    if not_modified:
+        response = Response(status=304)
+    else:
+        encoding = request.accept_encodings.best_match(body.encodings() + ['identity']) or 'identity'
+        response = Response(body.get(encoding), mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    # One weak validator covers every content coding of the same payload
+    response.set_etag(body.etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.last_modified = datetime.fromtimestamp(int(entry.created), tz=timezone.utc)
+
+    ttl = entry.ttl_remaining()
+    if ttl is not None:
+        response.cache_control.max_age = int(ttl)
+    response.cache_control.public = True
+    return response
@@ -0,0 +1,174 @@
+"""
+Lightweight stage timing
+
+``span('arima')`` (or the ``timed`` decorator) measures one stage of the
+work. Every measurement feeds an in-process latency histogram per stage;
+measurements taken while a request is being served are also reported to
+the client in a ``Server-Timing`` header. When timing is disabled,
+``span`` returns a shared no-op context manager and nothing is recorded.
+"""
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_enabled = True
+_spans = contextvars.ContextVar('timing_spans', default=None)
+_histograms = {}
+_lock = threading.Lock()
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Cumulative-friendly latency histogram over ``BUCKETS_MS``"""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def snapshot(self) -> Dict:
+        return {'buckets': list(self.counts), 'count': self.count, 'sum_ms': self.sum}
+
+
+def set_enabled(flag: bool):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def record(name: str, seconds: float):
+    """Record one measurement of stage ``name``"""
+    ms = seconds * 1000.0
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, ms))
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(ms)
+
+
+class _Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as stage ``name``"""
+    return _Span(name) if _enabled else _NOOP
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function as stage ``name``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def begin() -> Optional[contextvars.Token]:
+    """Start collecting spans for the current request"""
+    return _spans.set([]) if _enabled else None
+
+
+def end(token: Optional[contextvars.Token]) -> List[Tuple[str, float]]:
+    """Stop collecting and return the request's ``(stage, ms)`` spans"""
+    if token is None:
+        return []
+    spans = _spans.get() or []
+    try:
+        _spans.reset(token)
+    except ValueError:
+        # Token from another context (e.g. the request ran in a copied context)
+        _spans.set(None)
+    return spans
+
+
+def current_spans() -> List[Tuple[str, float]]:
+    return list(_spans.get() or [])
+
+
+def server_timing(spans: List[Tuple[str, float]], total_ms: Optional[float] = None) -> str:
+    """``Server-Timing`` header value, summing repeated stages in first-seen order"""
+    totals = {}
+    for name, ms in spans:
+        totals[name] = totals.get(name, 0.0) + ms
+    if total_ms is not None:
+        totals['total'] = total_ms
+    return ', '.join(f'{name};dur={ms:.1f}' for name, ms in totals.items())
+
+
+def histograms() -> Dict[str, Dict]:
+    """Snapshot of every stage's latency histogram"""
+    with _lock:
+        return {name: histogram.snapshot() for name, histogram in _histograms.items()}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def init_app(app):
+    """Time every request of a Flask app and add the ``Server-Timing`` header"""
+    from flask import g
+
+    set_enabled(app.config.get('SERVER_TIMING', True))
+
+    @app.before_request
+    def _start_timing():
+        g.timing_start = time.perf_counter()
+        g.timing_token = begin()
+
+    @app.after_request
+    def _add_server_timing(response):
+        token = g.pop('timing_token', None)
+        start = g.pop('timing_start', None)
+        if token is None:
+            return response
+        total = time.perf_counter() - start
+        spans = end(token)
+        record('request', total)
+        response.headers['Server-Timing'] = server_timing(spans, total * 1000.0)
+        return response
+
+    @app.teardown_request
+    def _stop_timing(exc):
+        # after_request does not run when a view raises
+        end(g.pop('timing_token', None))
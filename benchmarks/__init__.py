@@ -0,0 +1,3 @@
+"""
+Offline benchmark suite, see ``benchmarks.run``
+"""
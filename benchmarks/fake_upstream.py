@@ -0,0 +1,217 @@
+"""
+Local stand-in for the Binance and CoinGecko APIs
+
+Serves the endpoints the fetchers use from the benchmark candle fixtures,
+with configurable latency, jitter and faults, so the full stack can be load
+tested without touching (or getting banned by) the real APIs:
+
+- Binance: ``/api/v3/klines``
+- CoinGecko: ``/coingecko/api/v3/simple/price``, ``.../coins/<id>/market_chart``
+  and ``.../coins/list``
+
+Point the app at it with ``BINANCE_BASE_URL=http://127.0.0.1:8900/api/v3``
+and ``COINGECKO_BASE_URL=http://127.0.0.1:8900/coingecko/api/v3``.
+
+    python -m benchmarks.fake_upstream --port 8900 --latency-ms 80 --jitter-ms 40 \\
+        --error-rate 0.01 --throttle-rate 0.01 --binance-weight-limit 6000
+
+``GET /_stats`` returns the requests served so far per endpoint and status.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from aiohttp import web
+from backend.data.upstream import binance_weight
+from benchmarks import fixtures
+
+BINANCE_ROOT = '/api/v3'
+COINGECKO_ROOT = '/coingecko/api/v3'
+
+COINS = [
+    {'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'},
+    {'id': 'ethereum', 'symbol': 'eth', 'name': 'Ethereum'},
+    {'id': 'binancecoin', 'symbol': 'bnb', 'name': 'BNB'},
+    {'id': 'cardano', 'symbol': 'ada', 'name': 'Cardano'},
+    {'id': 'solana', 'symbol': 'sol', 'name': 'Solana'},
+    {'id': 'ripple', 'symbol': 'xrp', 'name': 'XRP'},
+    {'id': 'polkadot', 'symbol': 'dot', 'name': 'Polkadot'},
+    {'id': 'dogecoin', 'symbol': 'doge', 'name': 'Dogecoin'},
+]
+
+
+class FakeUpstream:
+    """Fixture-backed upstream endpoints with injected latency and faults"""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 25, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: int = 1,
+                 binance_weight_limit: Optional[int] = None, coingecko_calls_limit: Optional[int] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency_ms: Mean response delay
+            jitter_ms: Spread of the delay (uniform, +-jitter_ms)
+            error_rate: Share of requests answered 500/502/503 at random
+            throttle_rate: Share of requests answered 429 with ``Retry-After`` at random
+            retry_after: Seconds sent in ``Retry-After`` of random 429s
+            binance_weight_limit: Request weight per minute before Binance answers 429
+            coingecko_calls_limit: Calls per minute before CoinGecko answers 429
+            seed: Seed of the latency and fault draws, for repeatable runs
+        """
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.limits = {'binance': binance_weight_limit, 'coingecko': coingecko_calls_limit}
+        self.random = random.Random(seed)
+        self.fetcher = fixtures.FixtureFetcher()
+        self.used = Counter()
+        self.window = None
+        self.stats = Counter()
+
+    # Shared behaviour
+
+    def _charge(self, provider: str, weight: int) -> Optional[float]:
+        """Count weight in the current minute, returning seconds to wait when over the limit"""
+        now = time.time()
+        window = now - now % 60
+        if window != self.window:
+            self.window = window
+            self.used.clear()
+        self.used[provider] += weight
+        limit = self.limits[provider]
+        if limit is not None and self.used[provider] > limit:
+            return window + 60 - now
+        return None
+
+    async def _respond(self, request: web.Request, provider: str, name: str, build, weight: int = 1):
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        wait = self._charge(provider, weight)
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self.used['binance'])} if provider == 'binance' else {}
+        draw = self.random.random()
+        if wait is not None:
+            response = web.json_response({'code': -1003, 'msg': 'Too many requests'}, status=429,
+                                         headers=dict(headers, **{'Retry-After': str(int(wait) + 1)}))
+        elif draw < self.throttle_rate:
+            response = web.json_response({'code': -1003, 'msg': 'Too many requests'}, status=429,
+                                         headers=dict(headers, **{'Retry-After': str(self.retry_after)}))
+        elif draw < self.throttle_rate + self.error_rate:
+            response = web.json_response({'error': 'Injected upstream failure'},
+                                         status=self.random.choice((500, 502, 503)), headers=headers)
+        else:
+            response = web.json_response(build(), headers=headers)
+
+        self.stats[f'{name} {response.status}'] += 1
+        return response
+
+    @staticmethod
+    def _shift(points: List[dict], interval: str) -> List[int]:
+        """Open times in ms for the points, ending at the current interval"""
+        step = fixtures.INTERVAL_SECONDS[interval] * 1000
+        last = int(time.time() * 1000) // step * step
+        return [last - (len(points) - 1 - i) * step for i in range(len(points))]
+
+    # Binance
+
+    async def klines(self, request: web.Request) -> web.Response:
+        interval = request.query.get('interval', '1m')
+        limit = min(int(request.query.get('limit', 500)), 1000)
+        if interval not in fixtures.INTERVAL_SECONDS:
+            return web.json_response({'code': -1120, 'msg': 'Invalid interval.'}, status=400)
+
+        def build():
+            # The series ends at the current interval; a time range selects a slice of it
+            step = fixtures.INTERVAL_SECONDS[interval] * 1000
+            now = int(time.time() * 1000) // step * step
+            start, end = request.query.get('startTime'), request.query.get('endTime')
+            first = now - (limit - 1) * step
+            if start is not None:
+                first = -(-int(start) // step) * step
+            elif end is not None:
+                first = int(end) // step * step - (limit - 1) * step
+            # No history before the longest fixture
+            first = max(first, now - (fixtures.SIZES[-1] - 1) * step)
+            last = min(now, first + (limit - 1) * step, int(end) if end is not None else now)
+            if last < first:
+                return []
+            size = (now - first) // step + 1
+            points = self.fetcher.get_binance_klines(request.query.get('symbol', 'BTCUSDT'), interval, size)
+            points = points[:(last - first) // step + 1]
+            return [[first + i * step, str(p['open']), str(p['high']), str(p['low']), str(p['close']),
+                     str(p['volume'])] for i, p in enumerate(points)]
+
+        return await self._respond(request, 'binance', 'klines', build,
+                                   binance_weight(request.path, {'limit': limit}))
+
+    # CoinGecko
+
+    async def simple_price(self, request: web.Request) -> web.Response:
+        def build():
+            price = self.fetcher.get_current_price()
+            return {coin: {'usd': price['price'], 'usd_24h_change': 1.5, 'usd_24h_vol': price['volume_24h'],
+                           'usd_market_cap': price['price'] * 19.6e6}
+                    for coin in request.query.get('ids', 'bitcoin').split(',')}
+        return await self._respond(request, 'coingecko', 'simple_price', build)
+
+    async def market_chart(self, request: web.Request) -> web.Response:
+        days = max(1, min(int(request.query.get('days', 30)), 1000))
+
+        def build():
+            points = self.fetcher.get_historical_data(request.match_info['coin_id'], days)
+            times = self._shift(points, '1d')
+            return {
+                'prices': [[ts, p['price']] for ts, p in zip(times, points)],
+                'total_volumes': [[ts, p['volume']] for ts, p in zip(times, points)],
+                'market_caps': [[ts, p['price'] * 19.6e6] for ts, p in zip(times, points)],
+            }
+        return await self._respond(request, 'coingecko', 'market_chart', build)
+
+    async def coins_list(self, request: web.Request) -> web.Response:
+        return await self._respond(request, 'coingecko', 'coins_list', lambda: COINS)
+
+    async def stats_view(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(f'{BINANCE_ROOT}/klines', self.klines)
+        app.router.add_get(f'{COINGECKO_ROOT}/simple/price', self.simple_price)
+        app.router.add_get(f'{COINGECKO_ROOT}/coins/list', self.coins_list)
+        app.router.add_get(f'{COINGECKO_ROOT}/coins/{{coin_id}}/market_chart', self.market_chart)
+        app.router.add_get('/_stats', self.stats_view)
+        return app
+
+
+def base_urls(host: str, port: int) -> Dict[str, str]:
+    """App settings pointing both fetchers at a stand-in on ``host:port``"""
+    return {
+        'BINANCE_BASE_URL': f'http://{host}:{port}{BINANCE_ROOT}',
+        'COINGECKO_BASE_URL': f'http://{host}:{port}{COINGECKO_ROOT}',
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local Binance/CoinGecko stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=25)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--binance-weight-limit', type=int)
+    parser.add_argument('--coingecko-calls-limit', type=int)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    upstream = FakeUpstream(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                            args.retry_after, args.binance_weight_limit, args.coingecko_calls_limit, args.seed)
+    web.run_app(upstream.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
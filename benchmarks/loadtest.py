@@ -0,0 +1,235 @@
+"""
+Load test of the full stack against the local upstream stand-in
+
+For every combination of ``--workers`` and ``--threads`` this starts the
+stand-in (``benchmarks.fake_upstream``) and ``gunicorn app:app`` with that
+many workers and threads, waits until the app answers, then keeps
+``--concurrency`` clients busy for ``--duration`` seconds on a weighted mix of
+endpoints. It reports throughput and latency percentiles per endpoint.
+
+    python -m benchmarks.loadtest --workers 1,2,4 --threads 1,4 --duration 30
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000   # an already running app
+
+Every request comes from one address, so the per-client admission rate is
+off unless ``--env ADMISSION_RATE=...`` is given. The upstream budgets are
+raised to the stand-in's own limits and kept in a private state directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+import numpy as np
+from benchmarks import fake_upstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COINS = ['bitcoin', 'ethereum', 'binancecoin', 'cardano', 'solana', 'ripple', 'polkadot', 'dogecoin']
+
+# (endpoint label, URL template, weight): a read-heavy mix like the dashboard's
+MIX = [
+    ('price', '/api/price/{coin}', 30),
+    ('predict_1h', '/api/predict/{coin}?timeframe=1h', 20),
+    ('predict_5m', '/api/predict/{coin}?timeframe=5m', 10),
+    ('predict_daily', '/api/predict/{coin}?timeframe=daily', 5),
+    ('recommendation', '/api/recommendation/{coin}?timeframe=1h', 10),
+    ('historical', '/api/historical/{coin}?days=30', 10),
+    ('analyze', '/api/analyze/{coin}', 10),
+    ('coins', '/api/coins', 5),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'{process.args[0]} exited with {process.returncode}')
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout:.0f}s')
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def drive(base_url: str, concurrency: int, duration: float, mix=MIX, coins=COINS,
+                seed: int = 0, timeout: float = 30) -> Dict[str, Dict]:
+    """Keep ``concurrency`` clients busy for ``duration`` seconds; raw results per endpoint"""
+    rng = random.Random(seed)
+    labels = [label for label, _, _ in mix]
+    weights = [weight for _, _, weight in mix]
+    templates = {label: template for label, template, _ in mix}
+    results = defaultdict(lambda: {'latencies': [], 'statuses': defaultdict(int)})
+    deadline = time.perf_counter() + duration
+
+    async def client(session: aiohttp.ClientSession):
+        while time.perf_counter() < deadline:
+            label = rng.choices(labels, weights)[0]
+            url = base_url + templates[label].format(coin=rng.choice(coins))
+            t0 = time.perf_counter()
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    status = str(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            results[label]['latencies'].append(time.perf_counter() - t0)
+            results[label]['statuses'][status] += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: Dict[str, Dict], duration: float) -> Dict[str, Dict]:
+    """Throughput, latency percentiles and status counts per endpoint, plus ``all``"""
+    summary = {}
+    everything = {'latencies': [], 'statuses': defaultdict(int)}
+    for label, result in sorted(results.items()) + [('all', everything)]:
+        if label != 'all':
+            everything['latencies'].extend(result['latencies'])
+            for status, count in result['statuses'].items():
+                everything['statuses'][status] += count
+        latencies_ms = np.array(result['latencies']) * 1000.0
+        if not len(latencies_ms):
+            continue
+        summary[label] = {
+            'requests': len(latencies_ms),
+            'rps': len(latencies_ms) / duration,
+            'ok': result['statuses'].get('200', 0) + result['statuses'].get('304', 0),
+            'statuses': dict(result['statuses']),
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'p99_ms': float(np.percentile(latencies_ms, 99)),
+            'max_ms': float(latencies_ms.max()),
+        }
+    return summary
+
+
+def print_summary(title: str, summary: Dict[str, Dict], out=sys.stdout):
+    out.write(f'\n{title}\n')
+    out.write(f"{'endpoint':<16}{'requests':>9}{'req/s':>9}{'ok %':>7}{'p50 ms':>9}{'p95 ms':>9}"
+              f"{'p99 ms':>9}{'max ms':>9}  statuses\n")
+    for label, row in summary.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(row['statuses'].items()))
+        out.write(f"{label:<16}{row['requests']:>9}{row['rps']:>9.1f}{row['ok'] / row['requests'] * 100:>7.1f}"
+                  f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+                  f"  {statuses}\n")
+    out.flush()
+
+
+def start_stack(workers: int, threads: int, upstream_port: int, extra_env: Dict[str, str],
+                log) -> Tuple[subprocess.Popen, str]:
+    """Start gunicorn on a free port against the stand-in; returns the process and its URL"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update(fake_upstream.base_urls('127.0.0.1', upstream_port))
+    env.update({
+        'UPSTREAM_STATE_DIR': tempfile.mkdtemp(prefix='loadtest-upstream-'),
+        'METRICS_DIR': tempfile.mkdtemp(prefix='loadtest-metrics-'),
+        'BINANCE_WEIGHT_PER_MINUTE': '6000',
+        'COINGECKO_CALLS_PER_MINUTE': '100000',
+        'ADMISSION_RATE': '0',
+    })
+    env.update(extra_env)
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--threads', str(threads), '--timeout', '120', 'app:app']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=log)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Load test the app against a local upstream stand-in')
+    parser.add_argument('--workers', default='2', help='Comma separated gunicorn worker counts')
+    parser.add_argument('--threads', default='4', help='Comma separated gunicorn thread counts')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per combination')
+    parser.add_argument('--url', help='Load an already running app instead of starting gunicorn')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the app, e.g. PREDICTION_BUDGET_MS=500')
+    parser.add_argument('--upstream-latency-ms', type=float, default=80)
+    parser.add_argument('--upstream-jitter-ms', type=float, default=40)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-binance-weight-limit', type=int, default=6000)
+    parser.add_argument('--upstream-coingecko-calls-limit', type=int)
+    parser.add_argument('--startup-timeout', type=float, default=120,
+                        help='Seconds to wait for the app (warm-up included)')
+    parser.add_argument('--save', help='Write all summaries as JSON to this file')
+    parser.add_argument('--log', default=os.path.join(tempfile.gettempdir(), 'loadtest.log'),
+                        help='File for gunicorn and stand-in output')
+    args = parser.parse_args(argv)
+
+    extra_env = dict(item.split('=', 1) for item in args.env)
+    report = {}
+    with open(args.log, 'a') as log:
+        if args.url:
+            summary = summarize(asyncio.run(drive(args.url, args.concurrency, args.duration)), args.duration)
+            print_summary(f'{args.url}, {args.concurrency} clients', summary)
+            report[args.url] = summary
+        else:
+            upstream_port = free_port()
+            upstream_command = [
+                sys.executable, '-m', 'benchmarks.fake_upstream', '--port', str(upstream_port),
+                '--latency-ms', str(args.upstream_latency_ms), '--jitter-ms', str(args.upstream_jitter_ms),
+                '--error-rate', str(args.upstream_error_rate), '--throttle-rate', str(args.upstream_throttle_rate),
+                '--binance-weight-limit', str(args.upstream_binance_weight_limit), '--seed', '0',
+            ]
+            if args.upstream_coingecko_calls_limit:
+                upstream_command += ['--coingecko-calls-limit', str(args.upstream_coingecko_calls_limit)]
+            upstream = subprocess.Popen(upstream_command, cwd=ROOT, stdout=log, stderr=log)
+            try:
+                wait_until_up(f'http://127.0.0.1:{upstream_port}/_stats', 30, upstream)
+                for workers in map(int, args.workers.split(',')):
+                    for threads in map(int, args.threads.split(',')):
+                        app, url = start_stack(workers, threads, upstream_port, extra_env, log)
+                        try:
+                            wait_until_up(f'{url}/api/health', args.startup_timeout, app)
+                            results = asyncio.run(drive(url, args.concurrency, args.duration))
+                        finally:
+                            stop(app)
+                        title = f'{workers} worker(s) x {threads} thread(s), {args.concurrency} clients'
+                        summary = summarize(results, args.duration)
+                        print_summary(title, summary)
+                        report[f'{workers}x{threads}'] = summary
+            finally:
+                stop(upstream)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nSaved to {args.save}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
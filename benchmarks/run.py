@@ -0,0 +1,275 @@
+"""
+Offline benchmarks for the preprocessing, prediction and API hot paths
+
+Every benchmark runs on the seeded synthetic candles in ``benchmarks.fixtures``;
+route benchmarks serve them through a stub fetcher, so nothing touches the
+network. Model cases only run at sizes up to ``MODEL_MAX_SIZE``; the larger
+fixtures exercise downsampling and JSON encoding. Each case reports calls/s,
+points/s, latency percentiles and the peak memory (tracemalloc) of one call.
+
+    python -m benchmarks.run                          # everything
+    python -m benchmarks.run --sizes 100,1000 -k arima
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json  # exit 1 on regressions
+
+A case regresses when its median latency or peak memory exceeds the
+baseline's by more than ``--threshold`` (default 25%).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+from benchmarks import fixtures
+
+# A case is (name, points per call, setup) where setup() returns the call to time
+Case = Tuple[str, int, Callable[[], Callable[[], object]]]
+
+# Largest series the model cases run on. Predictions read at most 730 candles,
+# and ARIMA or the indicators on a million points would take far too long.
+MODEL_MAX_SIZE = 5000
+
+# Points ``/historical`` downsampling is benchmarked down to
+DOWNSAMPLE_POINTS = 1000
+
+
+def _bind(func: Callable, load: Callable[[], object]) -> Callable[[], Callable[[], object]]:
+    """Setup that loads the input once and returns ``func`` applied to it"""
+    def setup():
+        data = load()
+        return lambda: func(data)
+    return setup
+
+
+def _model_cases(sizes: List[int]) -> Iterator[Case]:
+    from backend.data.preprocessor import DataPreprocessor
+    from backend.models.predictor import CryptoPricePredictor
+
+    preprocessor = DataPreprocessor()
+    predictor = CryptoPricePredictor()
+
+    for size in (size for size in sizes if size <= MODEL_MAX_SIZE):
+        def points(size=size):
+            return fixtures.candles('1h', size)
+
+        def prices(size=size):
+            return fixtures.load('1h', size)['close'].tolist()
+
+        yield f'indicators[{size}]', size, _bind(preprocessor.calculate_technical_indicators, points)
+        yield f'momentum[{size}]', size, _bind(predictor.analyze_momentum, prices)
+        yield f'trend[{size}]', size, _bind(predictor.predict_trend_simple, prices)
+        yield f'arima[{size}]', size, _bind(predictor.predict_arima, prices)
+
+
+def _series_cases(sizes: List[int]) -> Iterator[Case]:
+    from backend.data.downsample import downsample_points
+    from backend.utils.json_provider import dumps_bytes
+
+    for size in sizes:
+        def points(size=size):
+            return fixtures.candles('1h', size)
+
+        def downsample(data):
+            return downsample_points(data, DOWNSAMPLE_POINTS)
+
+        yield f'downsample[{size}]', size, _bind(downsample, points)
+        yield f'json[{size}]', size, _bind(dumps_bytes, points)
+
+
+def _timeframe_cases() -> Iterator[Case]:
+    from backend.models.predictor import MultiTimeframePredictor
+
+    predictor = MultiTimeframePredictor()
+    fetcher = fixtures.FixtureFetcher()
+    for timeframe, config in predictor.TIMEFRAMES.items():
+        def candles(config=config):
+            return fetcher.get_binance_klines(interval=config['interval'], limit=config['limit'])
+
+        def predict(data, timeframe=timeframe):
+            return predictor.predict_for_timeframe(data, timeframe)
+
+        yield f'predict_for_timeframe[{timeframe}]', config['limit'], _bind(predict, candles)
+
+
+def _route_cases() -> Iterator[Case]:
+    from backend.api import routes
+    from backend.models.predictor import MultiTimeframePredictor
+
+    clients = []
+    # Read from __dict__, so the real fetcher is not created just to be put back
+    original_fetcher = routes.service.__dict__.get('data_fetcher')
+
+    def get(url):
+        if not clients:
+            # Built on first use, so filtering out the route cases leaves the app alone
+            from app import create_app
+            from backend.utils.admission import AdmissionController
+
+            app = create_app()
+            app.config['TESTING'] = True
+            # Benchmarks measure the work, not the limits put on it
+            app.extensions['admission'] = AdmissionController(rate=0)
+            routes.service.data_fetcher = fixtures.FixtureFetcher()
+            clients.append(app.test_client())
+
+        response = clients[0].get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} answered {response.status_code}')
+
+    try:
+        for timeframe, config in MultiTimeframePredictor.TIMEFRAMES.items():
+            url = f'/api/predict/bitcoin?timeframe={timeframe}'
+
+            def cold(url=url):
+                def call():
+                    routes.cache.clear()
+                    get(url)
+                return call
+
+            def warm(url=url):
+                get(url)
+                return lambda: get(url)
+
+            yield f'route_predict_cold[{timeframe}]', config['limit'], cold
+            yield f'route_predict_warm[{timeframe}]', config['limit'], warm
+    finally:
+        # The route service is shared with the rest of the process
+        if original_fetcher is None:
+            routes.service.__dict__.pop('data_fetcher', None)
+        else:
+            routes.service.data_fetcher = original_fetcher
+
+
+def cases(sizes: List[int]) -> Iterator[Case]:
+    yield from _model_cases(sizes)
+    yield from _series_cases(sizes)
+    yield from _timeframe_cases()
+    yield from _route_cases()
+
+
+def measure(call: Callable[[], object], points: int, min_time: float, min_runs: int,
+            max_runs: int) -> Dict:
+    """Latency distribution of ``call`` plus the peak memory of one run"""
+    call()  # Warm-up: lazy imports, caches, first-call allocations
+
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_runs and (len(latencies) < min_runs or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000.0
+    total = float(sum(latencies))
+    return {
+        'runs': len(latencies),
+        'points': points,
+        'calls_per_s': len(latencies) / total if total else float('inf'),
+        'points_per_s': points * len(latencies) / total if total else float('inf'),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p90_ms': float(np.percentile(latencies_ms, 90)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Descriptions of the cases whose median latency or peak memory regressed"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key, label in (('p50_ms', 'p50'), ('peak_mb', 'peak memory')):
+            if before[key] > 0 and result[key] > before[key] * (1 + threshold):
+                regressions.append(f'{name}: {label} {before[key]:.2f} -> {result[key]:.2f} '
+                                   f'(+{(result[key] / before[key] - 1) * 100:.0f}%)')
+    return regressions
+
+
+def environment() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(sizes: List[int], keyword: Optional[str] = None, min_time: float = 1.0, min_runs: int = 3,
+        max_runs: int = 1000, out=sys.stdout) -> Dict[str, Dict]:
+    """Run the selected cases, printing one line per case, and return their results"""
+    results = {}
+    selected = cases(sizes)
+    out.write(f"{'case':<34}{'runs':>6}{'calls/s':>11}{'points/s':>13}"
+              f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MB':>10}\n")
+    try:
+        for name, points, setup in selected:
+            if keyword and keyword not in name:
+                continue
+            result = results[name] = measure(setup(), points, min_time, min_runs, max_runs)
+            out.write(f"{name:<34}{result['runs']:>6}{result['calls_per_s']:>11.1f}{result['points_per_s']:>13.0f}"
+                      f"{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                      f"{result['peak_mb']:>10.2f}\n")
+            out.flush()
+    finally:
+        # Undoes what the cases changed, also when one of them fails
+        selected.close()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Offline benchmarks for EPICcrypto hot paths')
+    parser.add_argument('--sizes', default=','.join(map(str, fixtures.SIZES)),
+                        help='Comma separated fixture sizes for the per-function cases '
+                             f'(model cases skip sizes over {MODEL_MAX_SIZE})')
+    parser.add_argument('-k', dest='keyword', help='Only run cases whose name contains this')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds to repeat each case for')
+    parser.add_argument('--min-runs', type=int, default=3)
+    parser.add_argument('--max-runs', type=int, default=1000)
+    parser.add_argument('--save', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline JSON written by --save')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown / memory growth over the baseline (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = run(sizes, args.keyword, args.min_time, args.min_runs, args.max_runs)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f'Saved {len(results)} results to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != environment():
+            print(f"Warning: baseline was recorded on {baseline.get('environment')}")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold:.0%}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print(f'No regressions over {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,6 +21,97 @@ class Config:
     API_TIMEOUT = int(os.environ.get('API_TIMEOUT', 30))
     MAX_RETRIES = int(os.environ.get('MAX_RETRIES', 3))
     
+    # Prediction latency budget in milliseconds (0 disables the budget)
+    PREDICTION_BUDGET_MS = float(os.environ.get('PREDICTION_BUDGET_MS', 2000))
+    
+    # Seconds between server-side refreshes of each streamed coin, and caps on
+    # the coins streamed and the open streams per worker (0 for no cap). Every
+    # open stream holds a gunicorn thread, so keep STREAM_MAX_SUBSCRIBERS well
+    # below --threads (8 in the Procfile) to leave threads for other requests.
+    STREAM_INTERVAL = float(os.environ.get('STREAM_INTERVAL', 15))
+    STREAM_MAX_COINS = int(os.environ.get('STREAM_MAX_COINS', 10))
+    STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 4))
+    
+    # Admission control for cache misses: per-client token bucket (requests
+    # per second and burst) and requests in flight per process for upstream
+    # fetches and model work. Rate 0 or concurrency 0 disables that limit.
+    ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', 5))
+    ADMISSION_BURST = float(os.environ.get('ADMISSION_BURST', 20))
+    ADMISSION_UPSTREAM_CONCURRENCY = int(os.environ.get('ADMISSION_UPSTREAM_CONCURRENCY', 2))
+    ADMISSION_MODEL_CONCURRENCY = int(os.environ.get('ADMISSION_MODEL_CONCURRENCY', 2))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0.05))
+    
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted for
+    # the client address (0: clients connect directly, headers are ignored)
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    
+    # Upstream API roots (point these at a local stand-in for testing)
+    COINGECKO_BASE_URL = os.environ.get('COINGECKO_BASE_URL', 'https://api.coingecko.com/api/v3')
+    BINANCE_BASE_URL = os.environ.get('BINANCE_BASE_URL', 'https://api.binance.com/api/v3')
+    
+    # Host-wide upstream rate budgets, shared by all worker processes through
+    # files in UPSTREAM_STATE_DIR. Background refreshes leave the reserve share
+    # for interactive requests and queue behind any interactive fetch waiting
+    # for budget; fetches wait at most UPSTREAM_MAX_WAIT seconds for budget
+    # (background ones six times as long).
+    BINANCE_WEIGHT_PER_MINUTE = int(os.environ.get('BINANCE_WEIGHT_PER_MINUTE', 6000))
+    COINGECKO_CALLS_PER_MINUTE = int(os.environ.get('COINGECKO_CALLS_PER_MINUTE', 30))
+    UPSTREAM_INTERACTIVE_RESERVE = float(os.environ.get('UPSTREAM_INTERACTIVE_RESERVE', 0.2))
+    UPSTREAM_MAX_WAIT = float(os.environ.get('UPSTREAM_MAX_WAIT', 5))
+    UPSTREAM_STATE_DIR = os.environ.get('UPSTREAM_STATE_DIR') or None
+    
+    # Klines ranges longer than one Binance request are fetched as pages,
+    # BINANCE_KLINE_CONCURRENCY at a time (each still drawing from the budget)
+    BINANCE_KLINE_CONCURRENCY = int(os.environ.get('BINANCE_KLINE_CONCURRENCY', 4))
+    
+    # Upstream outages: a provider's circuit opens after UPSTREAM_BREAKER_THRESHOLD
+    # consecutive failures and is probed again after UPSTREAM_BREAKER_COOLDOWN
+    # seconds. Meanwhile data fetched up to UPSTREAM_STALE_MAX_AGE seconds ago
+    # is served in place of fresh data (0 disables the fallback).
+    UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5))
+    UPSTREAM_BREAKER_COOLDOWN = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 30))
+    UPSTREAM_STALE_MAX_AGE = float(os.environ.get('UPSTREAM_STALE_MAX_AGE', 3600))
+    
+    # Upstream tail latency: requests time out after three times the provider's
+    # recent p99, between UPSTREAM_TIMEOUT_MIN and UPSTREAM_TIMEOUT seconds. GETs
+    # unanswered after the p95 are sent again (first response wins) for at most
+    # UPSTREAM_HEDGE_RATE of requests (0 disables hedging).
+    UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 10))
+    UPSTREAM_TIMEOUT_MIN = float(os.environ.get('UPSTREAM_TIMEOUT_MIN', 1))
+    UPSTREAM_HEDGE_RATE = float(os.environ.get('UPSTREAM_HEDGE_RATE', 0.05))
+    
+    # Upstream record/replay: "record" saves every upstream response to
+    # UPSTREAM_ARCHIVE_DIR, "replay" serves them from there without network
+    # (after the original delay with UPSTREAM_REPLAY_TIMING=True)
+    UPSTREAM_RECORDING = os.environ.get('UPSTREAM_RECORDING') or None
+    UPSTREAM_ARCHIVE_DIR = os.environ.get('UPSTREAM_ARCHIVE_DIR', 'upstream-archive')
+    UPSTREAM_REPLAY_TIMING = os.environ.get('UPSTREAM_REPLAY_TIMING', 'False') == 'True'
+    
+    # Async serving mode: open upstream connections and model threads per worker
+    UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', 200))
+    MODEL_WORKERS = int(os.environ.get('MODEL_WORKERS', 4))
+    
+    # Per-stage timing: Server-Timing headers and in-process latency histograms
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True') == 'True'
+    
+    # Metrics snapshots shared by the workers of one server (default: <tmp>/epiccrypto-metrics)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    
+    # Request profiling, off unless PROFILING=True. Profiles a random
+    # PROFILE_SAMPLE_RATE share of requests, plus requests sending
+    # "X-Profile: <PROFILE_TOKEN>" when a token is set; the profile listing
+    # is only served to that token. PROFILE_FORMAT is
+    # "collapsed" (stack sampling every PROFILE_INTERVAL_MS) or "pstats"
+    # (cProfile); the newest PROFILE_KEEP files are kept in PROFILE_DIR.
+    PROFILING = os.environ.get('PROFILING', 'False') == 'True'
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN') or None
+    PROFILE_FORMAT = os.environ.get('PROFILE_FORMAT', 'collapsed')
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or None
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 100))
+    
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
@@ -6,7 +6,8 @@ let state = {
     selectedCoin: 'bitcoin',
     selectedTimeframe: '1h',
     currentPrice: null,
-    prediction: null
+    prediction: null,
+    stream: null
 };
 
 // Initialize app
@@ -16,9 +17,7 @@ document.addEventListener('DOMContentLoaded', () => {
     initializeLoadAllButton();
     
     // Load initial data
-    loadCurrentPrice();
-    loadPrediction();
-    loadTechnicalAnalysis();
+    loadDashboard();
 });
 
 // Coin selection
@@ -34,9 +33,7 @@ function initializeCoinButtons() {
             state.selectedCoin = btn.dataset.coin;
             
             // Reload data
-            loadCurrentPrice();
-            loadPrediction();
-            loadTechnicalAnalysis();
+            loadDashboard();
         });
     });
 }
@@ -54,7 +51,11 @@ function initializeTimeframeButtons() {
             state.selectedTimeframe = btn.dataset.timeframe;
             
             // Reload prediction
-            loadPrediction();
+            if (window.EventSource) {
+                loadDashboard();
+            } else {
+                loadPrediction();
+            }
         });
     });
 }
@@ -67,6 +68,70 @@ function initializeLoadAllButton() {
     }
 }
 
+// Load price, prediction and analysis, pushed over a single event stream
+function loadDashboard() {
+    if (!window.EventSource) {
+        loadCurrentPrice();
+        loadPrediction();
+        loadTechnicalAnalysis();
+        return;
+    }
+    
+    if (state.stream) {
+        state.stream.close();
+    }
+    
+    document.getElementById('priceCard').innerHTML = '<div class="loading">Loading price data...</div>';
+    document.getElementById('predictionSection').innerHTML =
+        '<h2>AI Prediction & Recommendation</h2><div class="loading">Generating AI prediction...</div>';
+    document.getElementById('technicalAnalysis').innerHTML =
+        '<h2>Technical Analysis</h2><div class="loading">Loading technical indicators...</div>';
+    
+    const stream = new EventSource(`${API_BASE}/stream/${state.selectedCoin}?timeframe=${state.selectedTimeframe}`);
+    state.stream = stream;
+    
+    stream.addEventListener('price', event => {
+        const data = JSON.parse(event.data);
+        if (data.error) {
+            document.getElementById('priceCard').innerHTML = `<div class="error">Error: ${data.error}</div>`;
+            return;
+        }
+        state.currentPrice = data;
+        displayCurrentPrice(data);
+    });
+    
+    stream.addEventListener('prediction', event => {
+        const data = JSON.parse(event.data);
+        if (data.error) {
+            document.getElementById('predictionSection').innerHTML =
+                `<h2>AI Prediction & Recommendation</h2><div class="error">Error: ${data.error}</div>`;
+            return;
+        }
+        state.prediction = data.prediction;
+        displayPrediction(data.prediction);
+    });
+    
+    // Refused (e.g. 503 when the server's streams are all taken): poll instead
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED && state.stream === stream) {
+            state.stream = null;
+            loadCurrentPrice();
+            loadPrediction();
+            loadTechnicalAnalysis();
+        }
+    };
+    
+    stream.addEventListener('analysis', event => {
+        const data = JSON.parse(event.data);
+        if (data.error) {
+            document.getElementById('technicalAnalysis').innerHTML =
+                `<h2>Technical Analysis</h2><div class="error">Error: ${data.error}</div>`;
+            return;
+        }
+        displayTechnicalAnalysis(data);
+    });
+}
+
 // Load current price
 async function loadCurrentPrice() {
     const priceCard = document.getElementById('priceCard');
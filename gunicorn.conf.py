@@ -0,0 +1,55 @@
+"""
+Gunicorn settings and hooks, read automatically from the working directory
+
+The app is imported once in the master (``preload_app``) and warmed up
+before workers are forked; see ``backend.api.warmup``. Set ``PRELOAD=0``
+to have each worker import the app itself, or ``WARMUP=0`` to preload
+without fetching data. Command line options take precedence over this file.
+"""
+import os
+
+preload_app = os.environ.get('PRELOAD', '1') != '0'
+
+
+def on_starting(server):
+    """Drop metrics snapshots left by a previous run"""
+    from backend.utils import metrics
+    metrics.clear_dir()
+
+
+def when_ready(server):
+    """Warm up in the master, after the app import and before the first fork"""
+    from backend.utils.memory import format_memory, memory_report
+
+    if not server.cfg.preload_app or os.environ.get('WARMUP', '1') == '0':
+        return
+
+    from backend.api.routes import service
+    from backend.api.warmup import warm_up
+
+    server.log.info('Master memory before warm-up: %s', format_memory(memory_report()))
+    try:
+        summary = warm_up(service)
+        server.log.info('Warm-up done: %s', summary)
+    except Exception as e:
+        server.log.warning('Warm-up failed, workers will load on demand: %s', e)
+
+    from backend.utils import metrics
+    try:
+        # Count the warm-up's fetches and model runs once, not again in every worker
+        metrics.flush(gauges=False)
+    except OSError as e:
+        server.log.warning('Could not write warm-up metrics: %s', e)
+    server.log.info('Master memory after warm-up: %s', format_memory(memory_report()))
+
+
+def post_fork(server, worker):
+    from backend.utils import metrics
+    from backend.utils.memory import format_memory, memory_report
+    metrics.reset()
+    server.log.info('Worker %s memory after fork: %s', worker.pid, format_memory(memory_report()))
+
+
+def post_worker_init(worker):
+    from backend.utils.memory import format_memory, memory_report
+    worker.log.info('Worker %s memory after init: %s', worker.pid, format_memory(memory_report()))
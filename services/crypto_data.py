@@ -1,19 +1,30 @@
 import yfinance as yf
 import pandas as pd
-import numpy as np
 import logging
 from datetime import datetime, timedelta
 import time
+from backend.data.recording import Recorder
+from config import get_config
 
 logger = logging.getLogger(__name__)
 
 class CryptoDataService:
     """Service for fetching cryptocurrency data with caching"""
     
-    def __init__(self):
+    def __init__(self, session=None):
+        """
+        Args:
+            session: ``requests`` session for yfinance; by default one that records or
+                replays upstream responses when ``UPSTREAM_RECORDING`` is set
+        """
         self.cache = {}
         self.cache_duration = 60  # Cache for 60 seconds
         self.cache_timestamps = {}
+        
+        if session is None:
+            recorder = Recorder.from_config(get_config())
+            session = recorder.session() if recorder is not None else None
+        self.session = session
     
     def _get_cache_key(self, symbol, timeframe):
         """Generate cache key"""
@@ -67,7 +78,7 @@ class CryptoDataService:
             
             # Fetch data from yfinance with timeout protection
             logger.info(f"Fetching data for {symbol} with timeframe {timeframe}")
-            ticker = yf.Ticker(symbol)
+            ticker = yf.Ticker(symbol, session=self.session)
             data = ticker.history(period=config['period'], interval=config['interval'])
             
             if data.empty:
@@ -129,11 +140,6 @@ class CryptoDataService:
             indicators['bb_upper'] = (sma_20 + (std_20 * 2)).iloc[-1]
             indicators['bb_lower'] = (sma_20 - (std_20 * 2)).iloc[-1]
             
-            # Convert numpy types to Python types for JSON serialization
-            for key, value in indicators.items():
-                if isinstance(value, (np.integer, np.floating)):
-                    indicators[key] = float(value)
-            
             return indicators
             
         except Exception as e:
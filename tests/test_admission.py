@@ -0,0 +1,43 @@
+"""
+Tests for admission control
+"""
+import pytest
+from backend.utils.admission import AdmissionController, AdmissionRejected
+
+
+def test_token_bucket_limits_each_client():
+    """Test a client is limited to its burst while others are unaffected"""
+    controller = AdmissionController(rate=1, burst=3)
+    for _ in range(3):
+        controller.acquire('a', 'model')()
+    
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire('a', 'model')
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == 1
+    
+    controller.acquire('b', 'model')()
+
+
+def test_concurrency_limit_sheds_and_refunds():
+    """Test saturated endpoint classes answer 503 without charging tokens"""
+    controller = AdmissionController(rate=1, burst=2, concurrency={'model': 1}, queue_timeout=0)
+    release = controller.acquire('a', 'model')
+    
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire('b', 'model')
+    assert excinfo.value.status == 503
+    
+    # Other classes are not affected
+    controller.acquire('b', 'upstream')()
+    
+    release()
+    with controller.admit('b', 'model'):
+        pass
+
+
+def test_disabled_limits():
+    """Test rate 0 and unlisted classes admit everything"""
+    controller = AdmissionController(rate=0)
+    for _ in range(100):
+        controller.acquire('a', 'model')()
@@ -38,3 +38,322 @@ def test_index_page(client):
     response = client.get('/')
     assert response.status_code == 200
     assert b'AI Crypto Prediction' in response.data
+
+
+class FakeFetcher:
+    """Stand-in for CryptoDataFetcher that counts upstream calls"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def get_binance_klines(self, symbol, interval, limit):
+        self.calls.append(('binance', symbol, interval))
+        return [{'close': 100 + i + (i % 3)} for i in range(limit)]
+    
+    def get_historical_data(self, coin_id, days):
+        self.calls.append(('coingecko', coin_id, days))
+        return [{'price': 200 + i} for i in range(days)]
+
+
+def test_predict_batch_shares_fetches(client, monkeypatch):
+    """Test batch predictions stream one line per pair and dedupe fetches"""
+    import json
+    from backend.api import routes
+    
+    fetcher = FakeFetcher()
+    monkeypatch.setattr(routes.service, 'data_fetcher', fetcher)
+    routes.cache.clear()
+    
+    response = client.post('/api/predict/batch?budget_ms=1', json={'requests': [
+        {'coin_id': 'bitcoin', 'timeframe': '5m'},
+        {'coin_id': 'bitcoin', 'timeframe': '10m'},
+        ['ethereum', 'daily'],
+    ]})
+    assert response.status_code == 200
+    
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert sorted((l['coin_id'], l['timeframe']) for l in lines) == [
+        ('bitcoin', '10m'), ('bitcoin', '5m'), ('ethereum', 'daily')
+    ]
+    assert all('prediction' in l for l in lines)
+    # 5m and 10m both read 5m klines
+    assert len(fetcher.calls) == 2
+    # Degraded by the 1 ms budget, so not cached for clients without one
+    assert routes.cache.get('prediction_bitcoin_10m') is None
+    assert routes.cache.get('series_bitcoin_5m_120') is not None
+    routes.cache.clear()
+
+
+def test_predict_batch_rejects_invalid_body(client):
+    """Test batch validation errors"""
+    response = client.post('/api/predict/batch', json={'requests': [['bitcoin', 'weekly']]})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_analyze_coin(client, monkeypatch):
+    """Test technical analysis from fetched history"""
+    from backend.api import routes
+    
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+    
+    response = client.get('/api/analyze/bitcoin')
+    assert response.status_code == 200
+    data = response.get_json()
+    # Hourly candles, the series 1h predictions read, from Binance
+    assert data['current_price'] == 199
+    assert data['indicators']['MA_7'] is not None
+    assert 'MA_Cross' in data['technical_analysis']
+    routes.cache.clear()
+
+
+def test_conditional_get(client, monkeypatch):
+    """Test cached responses carry validators and honour If-None-Match"""
+    from backend.api import routes
+    
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+    
+    response = client.get('/api/historical/bitcoin?days=30')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+    assert 'max-age=' in response.headers['Cache-Control']
+    assert len(response.get_json()['data']) == 30
+    
+    response = client.get('/api/historical/bitcoin?days=30', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    
+    response = client.get('/api/historical/bitcoin?days=30', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    routes.cache.clear()
+
+
+def test_cached_body_compression(client, monkeypatch):
+    """Test large cached payloads are served pre-compressed"""
+    import gzip
+    import json
+    from backend.api import routes
+    
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+    
+    plain = client.get('/api/historical/bitcoin?days=365')
+    assert 'Content-Encoding' not in plain.headers
+    
+    compressed = client.get('/api/historical/bitcoin?days=365', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert compressed.headers['ETag'] == plain.headers['ETag']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    
+    entry = routes.cache.get_entry('historical_bitcoin_365')
+    assert entry.body.raw == plain.data
+    routes.cache.clear()
+
+
+def test_historical_downsampling_and_pagination(client, monkeypatch):
+    """Test max_points and cursor/limit share one upstream fetch"""
+    from backend.api import routes
+    
+    fetcher = FakeFetcher()
+    monkeypatch.setattr(routes.service, 'data_fetcher', fetcher)
+    routes.cache.clear()
+    
+    data = client.get('/api/historical/bitcoin?days=365&max_points=50').get_json()
+    assert len(data['data']) == 50
+    assert data['data'][0]['price'] == 200 and data['data'][-1]['price'] == 564
+    
+    page = client.get('/api/historical/bitcoin?days=365&max_points=50&limit=20').get_json()
+    assert page['data'] == data['data'][:20]
+    assert page['total'] == 50 and page['next_cursor'] == 20
+    
+    last = client.get('/api/historical/bitcoin?days=365&max_points=50&cursor=40&limit=20').get_json()
+    assert last['data'] == data['data'][40:]
+    assert last['next_cursor'] is None
+    
+    assert len(fetcher.calls) == 1
+    assert client.get('/api/historical/bitcoin?max_points=2').status_code == 400
+    routes.cache.clear()
+
+
+def test_recommendation_reuses_prediction(client, monkeypatch):
+    """Test recommendations are served from the cached prediction"""
+    from backend.api import routes
+    
+    fetcher = FakeFetcher()
+    monkeypatch.setattr(routes.service, 'data_fetcher', fetcher)
+    routes.cache.clear()
+    
+    prediction = client.get('/api/predict/bitcoin?timeframe=1h').get_json()['prediction']
+    response = client.get('/api/recommendation/bitcoin?timeframe=1h')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['recommendation'] == prediction['recommendation']
+    assert data['current_price'] == prediction['current_price']
+    assert data['timestamp']
+    
+    assert len(fetcher.calls) == 1
+    assert routes.cache.get('recommendation_bitcoin_1h') is None
+    routes.cache.clear()
+
+
+def test_service_single_flight(monkeypatch):
+    """Test concurrent misses for one key share a single build"""
+    import threading
+    import time
+    from backend.api.prediction_service import PredictionService
+    from backend.utils.cache import CacheManager
+    
+    class SlowFetcher(FakeFetcher):
+        def get_historical_data(self, coin_id, days):
+            time.sleep(0.05)
+            return super().get_historical_data(coin_id, days)
+    
+    fetcher = SlowFetcher()
+    service = PredictionService(fetcher, None, None, CacheManager())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.historical_series('bitcoin', 30)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(fetcher.calls) == 1
+    assert all(len(result) == 30 for result in results)
+
+
+def test_degraded_predictions_are_not_shared():
+    """Test a prediction cut short by one request's budget is neither cached nor handed to others"""
+    import threading
+    import time
+    from backend.api.prediction_service import PredictionService
+    from backend.data.preprocessor import DataPreprocessor
+    from backend.models.predictor import MultiTimeframePredictor
+    from backend.utils.cache import CacheManager
+    
+    service = PredictionService(FakeFetcher(), DataPreprocessor(), MultiTimeframePredictor(), CacheManager())
+    service.yahoo = None
+    
+    degraded = service.prediction('bitcoin', '1h', budget_ms=1)
+    assert degraded['prediction']['components']['degraded'] is True
+    assert service.cache.peek('prediction_bitcoin_1h') is None
+    
+    # A request without a budget waiting on a degraded build gets a full prediction
+    original = service.predictor.predict_for_timeframe
+    started, release = threading.Event(), threading.Event()
+    
+    def slow_predict(*args, **kwargs):
+        started.set()
+        release.wait(2)
+        return original(*args, **kwargs)
+    
+    service.predictor.predict_for_timeframe = slow_predict
+    leader = threading.Thread(target=service.prediction, args=('bitcoin', '1h'), kwargs={'budget_ms': 1})
+    leader.start()
+    started.wait(2)
+    follower = []
+    thread = threading.Thread(target=lambda: follower.append(service.prediction('bitcoin', '1h')))
+    thread.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join()
+    thread.join()
+    
+    assert follower[0]['prediction']['components']['computed'] == ['momentum', 'trend', 'arima']
+    assert service.cache.peek('prediction_bitcoin_1h') is not None
+
+
+def test_all_predictions_retry_failed_timeframes_soon():
+    """Test an aggregate with a failed timeframe is cached only for the negative TTL"""
+    from backend.api.prediction_service import NEGATIVE_TTL, PredictionService
+    from backend.data.preprocessor import DataPreprocessor
+    from backend.models.predictor import MultiTimeframePredictor
+    from backend.utils.cache import CacheManager
+    
+    class MinuteOutage(FakeFetcher):
+        def get_binance_klines(self, symbol, interval, limit):
+            return [] if interval == '1m' else super().get_binance_klines(symbol, interval, limit)
+    
+    service = PredictionService(MinuteOutage(), DataPreprocessor(), MultiTimeframePredictor(), CacheManager())
+    service.yahoo = None
+    
+    result = service.all_predictions('bitcoin')
+    assert result['predictions']['1m'] == {'error': 'Failed to fetch data for prediction'}
+    assert 'recommendation' in result['predictions']['1h']
+    assert service.cache.peek('prediction_all_bitcoin').ttl_remaining() <= NEGATIVE_TTL
+
+
+def test_admission_sheds_misses_but_serves_hits(client, monkeypatch):
+    """Test rate limited clients get 429 on cache misses and still get cache hits"""
+    from backend.api import routes
+    from backend.utils.admission import AdmissionController
+    
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+    client.application.extensions['admission'] = AdmissionController(rate=0.01, burst=1)
+    
+    assert client.get('/api/historical/bitcoin?days=30').status_code == 200
+    
+    response = client.get('/api/historical/bitcoin?days=60')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert 'error' in response.get_json()
+    
+    assert client.get('/api/historical/bitcoin?days=30').status_code == 200
+    # A forged X-Forwarded-For does not buy a fresh budget
+    spoofed = client.get('/api/historical/bitcoin?days=90', headers={'X-Forwarded-For': '10.0.0.3'})
+    assert spoofed.status_code == 429
+    # Other clients keep their own budget
+    other = client.get('/api/historical/bitcoin?days=60', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 200
+    routes.cache.clear()
+
+
+def test_failed_fetches_are_negative_cached_and_fall_back_to_stale():
+    """Test a failing upstream is not hit again within NEGATIVE_TTL and stale data is served"""
+    from backend.api import prediction_service
+    from backend.api.prediction_service import PredictionService
+    from backend.utils.cache import CacheManager
+    
+    class FlakyFetcher(FakeFetcher):
+        def __init__(self):
+            super().__init__()
+            self.down = False
+        
+        def get_current_price(self, coin_id):
+            self.calls.append(('price', coin_id))
+            return None if self.down else {'symbol': coin_id, 'price': 100.0}
+    
+    fetcher = FlakyFetcher()
+    fetcher.down = True
+    service = PredictionService(fetcher, None, None, CacheManager())
+    assert service.price('dogecoin') is None
+    assert service.price('dogecoin') is None
+    assert len(fetcher.calls) == 1
+    
+    fetcher.down = False
+    assert service.price('bitcoin') == {'symbol': 'bitcoin', 'price': 100.0}
+    fetcher.down = True
+    service.cache.delete('price_bitcoin')
+    assert service.price('bitcoin') == {'symbol': 'bitcoin', 'price': 100.0, 'stale': True}
+    assert service.cache.peek('price_bitcoin').ttl_remaining() <= prediction_service.NEGATIVE_TTL
+    
+    service.cache.clear()
+    service._last_good['price_bitcoin'] = ({'price': 100.0}, 0)
+    assert service.price('bitcoin') is None
+
+
+def test_stream_rejects_unsupported_coins(client, monkeypatch):
+    """Test streams are only opened for coins the service knows"""
+    from backend.api import routes
+    
+    monkeypatch.setattr(routes.service, 'coins', lambda: {'popular': [], 'all': [{'id': 'shiba-inu'}]})
+    response = client.get('/api/stream/not-a-coin')
+    assert response.status_code == 404
+    assert 'error' in response.get_json()
+    assert routes.stream_hub.producers == {}
@@ -0,0 +1,150 @@
+"""
+Tests for the asyncio serving mode against a local stand-in upstream
+"""
+import asyncio
+import tempfile
+import time
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from backend.api.async_server import create_async_app
+from backend.api.prediction_service import PredictionService
+from backend.data.async_crypto_api import AsyncCryptoDataFetcher, BlockingBridge
+from backend.data.preprocessor import DataPreprocessor
+from backend.data.upstream import BudgetRouter, RateBudget
+from backend.models.predictor import MultiTimeframePredictor
+from backend.utils.cache import CacheManager
+
+
+def make_upstream(calls, delay):
+    """Stand-in for the Binance and CoinGecko endpoints the fetcher uses"""
+    async def klines(request):
+        calls.append(('binance', request.query['symbol'], request.query['interval']))
+        await asyncio.sleep(delay)
+        limit = int(request.query['limit'])
+        return web.json_response([
+            [1700000000000 + i * 60000, '1', '2', '0.5', str(100 + i + i % 3), '10'] for i in range(limit)
+        ])
+
+    async def market_chart(request):
+        calls.append(('coingecko', request.match_info['coin_id'], int(request.query['days'])))
+        await asyncio.sleep(delay)
+        points = [[1700000000000 + i * 86400000, 200 + i] for i in range(int(request.query['days']))]
+        return web.json_response({'prices': points, 'total_volumes': points, 'market_caps': points})
+
+    app = web.Application()
+    app.router.add_get('/binance/klines', klines)
+    app.router.add_get('/coingecko/coins/{coin_id}/market_chart', market_chart)
+    return app
+
+
+async def run_with_server(check, delay=0.0, service=None):
+    calls = []
+    upstream = TestServer(make_upstream(calls, delay))
+    await upstream.start_server()
+    base = str(upstream.make_url('')).rstrip('/')
+
+    fetcher = AsyncCryptoDataFetcher(f'{base}/coingecko', f'{base}/binance')
+    state_dir = tempfile.mkdtemp()
+    fetcher.router = BudgetRouter({
+        f'{base}/coingecko': RateBudget('test-coingecko', 1000, state_dir=state_dir),
+        f'{base}/binance': RateBudget('test-binance', 1000, state_dir=state_dir),
+    })
+    # No blocking fetcher: every upstream call must go through the async client
+    if service is None:
+        service = PredictionService(None, DataPreprocessor(), MultiTimeframePredictor(), CacheManager())
+    client = TestClient(TestServer(create_async_app(service, fetcher)))
+    await client.start_server()
+    try:
+        await check(client, calls)
+    finally:
+        await client.close()
+        await upstream.close()
+
+
+def test_async_concurrent_upstream_waits():
+    """Test slow upstream calls overlap instead of queueing on threads"""
+    async def check(client, calls):
+        coins = [f'coin{i}' for i in range(40)]
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.get(f'/api/historical/{coin}?days=30') for coin in coins))
+        elapsed = time.perf_counter() - start
+
+        assert [r.status for r in responses] == [200] * len(coins)
+        assert len(calls) == len(coins)
+        # 40 x 0.3s serially would take 12s
+        assert elapsed < 3
+
+    asyncio.run(run_with_server(check, delay=0.3))
+
+
+def test_async_prediction_shares_fetch():
+    """Test concurrent identical requests share one upstream fetch and cached body"""
+    async def check(client, calls):
+        responses = await asyncio.gather(*(client.get('/api/predict/bitcoin?timeframe=5m') for _ in range(20)))
+        assert [r.status for r in responses] == [200] * 20
+        assert calls == [('binance', 'BTCUSDT', '5m')]
+
+        data = await responses[0].json()
+        assert 'prediction' in data
+
+        etag = responses[0].headers['ETag']
+        again = await client.get('/api/predict/bitcoin?timeframe=5m', headers={'If-None-Match': etag})
+        assert again.status == 304
+
+        recommendation = await (await client.get('/api/recommendation/bitcoin?timeframe=5m')).json()
+        assert recommendation['recommendation'] == data['prediction']['recommendation']
+
+        analysis = await client.get('/api/analyze/bitcoin')
+        assert analysis.status == 200
+        # Hourly candles come from Binance like the 5m ones
+        assert (await analysis.json())['current_price'] == 199
+        assert len(calls) == 2
+
+    asyncio.run(run_with_server(check, delay=0.05))
+
+
+def test_async_falls_back_to_service_fetch():
+    """Test series the async sources cannot serve go through the service's fallback and negative cache"""
+    fallback_calls = []
+    candles = [{'timestamp': f'2024-01-01T00:{i:02d}:00', 'open': 1.0, 'high': 2.0, 'low': 0.5,
+                'close': 100.0 + i, 'volume': 10.0} for i in range(60)]
+
+    def fetch_upstream(source):
+        fallback_calls.append(source)
+        return candles if source.coin_id == 'shiba-inu' else []
+
+    service = PredictionService(None, DataPreprocessor(), MultiTimeframePredictor(), CacheManager())
+    service.fetch_upstream = fetch_upstream
+
+    async def check(client, calls):
+        # Neither Binance nor CoinGecko has 1-minute candles for these coins
+        response = await client.get('/api/predict/shiba-inu?timeframe=1m')
+        assert response.status == 200
+        assert (await response.json())['prediction']['current_price'] == 159.0
+
+        for _ in range(3):
+            assert (await client.get('/api/predict/pepe?timeframe=1m')).status == 404
+        # Later requests skip the failing fetch until the negative TTL expires
+        assert [source.coin_id for source in fallback_calls] == ['shiba-inu', 'pepe']
+        assert calls == []
+
+    asyncio.run(run_with_server(check, service=service))
+
+
+def test_blocking_bridge():
+    """Test blocking clients are awaited on the bridge's thread pool"""
+    class Slow:
+        def value(self, x):
+            time.sleep(0.2)
+            return x * 2
+
+    async def check():
+        bridge = BlockingBridge(Slow(), max_workers=8)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bridge.value(i) for i in range(8)))
+        bridge.close()
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(check())
+    assert results == [i * 2 for i in range(8)]
+    assert elapsed < 1
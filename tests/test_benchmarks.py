@@ -0,0 +1,53 @@
+"""
+Tests for the offline benchmark suite
+"""
+import io
+import numpy as np
+from benchmarks import fixtures, run
+
+
+def test_fixtures_are_deterministic(tmp_path, monkeypatch):
+    """Test fixtures are identical whether generated or loaded from disk"""
+    monkeypatch.setattr(fixtures, 'FIXTURE_DIR', str(tmp_path))
+    generated = fixtures.load('5m', 1000)
+    loaded = fixtures.load('5m', 1000)
+    assert np.array_equal(generated['close'], loaded['close'])
+    assert np.all(loaded['high'] >= loaded['close']) and np.all(loaded['low'] <= loaded['close'])
+
+    points = fixtures.candles('5m', 1000)
+    assert len(points) == 1000
+    assert set(points[0]) == {'timestamp', 'open', 'high', 'low', 'close', 'volume'}
+
+
+def test_run_and_compare():
+    """Test a case is measured and a slower result is flagged against the baseline"""
+    out = io.StringIO()
+    results = run.run([100], keyword='momentum[100]', min_time=0, min_runs=3, out=out)
+    assert list(results) == ['momentum[100]']
+    assert results['momentum[100]']['runs'] == 3
+    assert 'momentum[100]' in out.getvalue()
+
+    baseline = {'momentum[100]': dict(results['momentum[100]'])}
+    assert run.compare(results, baseline, 0.25) == []
+    slower = {'momentum[100]': dict(results['momentum[100]'], p50_ms=baseline['momentum[100]']['p50_ms'] * 2)}
+    assert run.compare(slower, baseline, 0.25)[0].startswith('momentum[100]: p50')
+
+
+def test_model_cases_capped_and_route_fetcher_restored(monkeypatch):
+    """Test model cases skip huge fixtures and route cases put the real fetcher back"""
+    from backend.api import routes
+
+    names = [name for name, _, _ in run.cases([100, 1000000])]
+    assert 'arima[100]' in names and 'json[1000000]' in names and 'downsample[1000000]' in names
+    assert not any(name.startswith(('indicators', 'arima')) and '1000000' in name for name in names)
+
+    fetcher = object()
+    monkeypatch.setattr(routes.service, 'data_fetcher', fetcher, raising=False)
+    monkeypatch.setattr(routes.service, '_last_good', {})
+    try:
+        results = run.run([100], keyword='route_predict_warm[1m]', min_time=0, min_runs=1, max_runs=1,
+                          out=io.StringIO())
+    finally:
+        routes.cache.clear()
+    assert list(results) == ['route_predict_warm[1m]']
+    assert routes.service.data_fetcher is fetcher
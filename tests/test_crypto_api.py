@@ -0,0 +1,136 @@
+"""
+Tests for paged Binance klines fetching
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from backend.data import upstream
+from backend.data.async_crypto_api import AsyncCryptoDataFetcher
+from backend.data.crypto_api import (
+    BINANCE_KLINES_LIMIT, CryptoDataFetcher, kline_pages, stitch_klines
+)
+from backend.data.upstream import CircuitBreaker, RateBudget
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+START_MS = int(START.timestamp() * 1000)
+
+
+class RangeKlinesHandler(BaseHTTPRequestHandler):
+    """Minute klines honouring ``startTime``, ``endTime`` and ``limit`` like Binance"""
+    calls = []
+    delay = 0.0
+
+    def do_GET(self):
+        query = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        self.calls.append(query)
+        time.sleep(self.delay)
+        first = -(-int(query['startTime']) // 60000) * 60000
+        opens = range(first, int(query['endTime']) + 1, 60000)[:int(query['limit'])]
+        body = json.dumps([[t, '1', '2', '0.5', str((t - START_MS) // 60000), '10'] for t in opens])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def klines_server(monkeypatch, tmp_path):
+    """Local klines endpoint, with a closed breaker and a full budget for Binance"""
+    monkeypatch.setitem(upstream._breakers, 'binance', CircuitBreaker('binance'))
+    monkeypatch.setitem(upstream._budgets, 'binance', RateBudget('binance', 6000, state_dir=str(tmp_path)))
+    RangeKlinesHandler.calls, RangeKlinesHandler.delay = [], 0.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeKlinesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_kline_pages_cover_range():
+    """Test ranges split into contiguous pages of at most one request's candles"""
+    end = datetime(2024, 1, 3, 2, 39, tzinfo=timezone.utc)
+    pages = kline_pages('1m', start=START, end=end)
+    assert [page['limit'] for page in pages] == [1000, 1000, 1000, 40]
+    assert pages[0]['startTime'] == START_MS
+    assert pages[-1]['endTime'] == int(end.timestamp() * 1000)
+    assert all(a['endTime'] + 1 == b['startTime'] for a, b in zip(pages, pages[1:]))
+
+    # ``limit`` candles from a start, or up to an end
+    assert [page['limit'] for page in kline_pages('1h', 2160, start=START)] == [1000, 1000, 160]
+    assert [page['limit'] for page in kline_pages('1d', 100, end=end)] == [100]
+
+
+def test_stitch_klines_orders_and_dedupes():
+    """Test overlapping pages become one ordered series with each candle once"""
+    late = [[180000, '1', '1', '1', '4', '1'], [240000, '1', '1', '1', '5', '1']]
+    early = [[60000, '1', '1', '1', '2', '1'], [120000, '1', '1', '1', '3', '1'], [180000, '1', '1', '1', '4', '1']]
+    columns = stitch_klines([late, early])
+    assert columns['open_time'].tolist() == [60000, 120000, 180000, 240000]
+    assert columns['close'].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert stitch_klines([])['close'].size == 0
+
+
+def test_long_ranges_fetched_in_concurrent_pages(klines_server):
+    """Test ranges beyond one request are fetched page by page at once and stitched"""
+    RangeKlinesHandler.delay = 0.2
+    fetcher = CryptoDataFetcher(binance_base_url=klines_server, kline_concurrency=4)
+
+    start = time.perf_counter()
+    candles = fetcher.get_binance_klines('btcusdt', '1m', 2500, start=START)
+    elapsed = time.perf_counter() - start
+
+    assert len(RangeKlinesHandler.calls) == 3
+    assert all(call['symbol'] == 'BTCUSDT' for call in RangeKlinesHandler.calls)
+    assert elapsed < 3 * RangeKlinesHandler.delay
+    assert len(candles) == 2500
+    assert [c['close'] for c in candles] == [float(i) for i in range(2500)]
+    assert set(candles[0]) == {'timestamp', 'open', 'high', 'low', 'close', 'volume'}
+
+    # One candle more than a request holds takes a second page
+    RangeKlinesHandler.calls = []
+    fetcher.get_binance_klines('BTCUSDT', '1m', BINANCE_KLINES_LIMIT + 1, end=START)
+    assert len(RangeKlinesHandler.calls) == 2
+
+
+def test_async_long_ranges_match_blocking(klines_server):
+    """Test the asyncio client pages ranges into the same series"""
+    async def fetch():
+        fetcher = AsyncCryptoDataFetcher(binance_base_url=klines_server)
+        try:
+            return await fetcher.get_binance_klines('BTCUSDT', '1m', 1500, start=START)
+        finally:
+            await fetcher.close()
+
+    candles = asyncio.run(fetch())
+    assert len(RangeKlinesHandler.calls) == 2
+    assert candles == CryptoDataFetcher(binance_base_url=klines_server).get_binance_klines(
+        'BTCUSDT', '1m', 1500, start=START)
+
+
+def test_async_pages_bounded_by_kline_concurrency(klines_server):
+    """Test the asyncio client has at most ``kline_concurrency`` pages in flight"""
+    RangeKlinesHandler.delay = 0.2
+
+    async def fetch():
+        fetcher = AsyncCryptoDataFetcher(binance_base_url=klines_server, kline_concurrency=2)
+        try:
+            return await fetcher.get_binance_klines('BTCUSDT', '1m', 4000, start=START)
+        finally:
+            await fetcher.close()
+
+    start = time.perf_counter()
+    candles = asyncio.run(fetch())
+    elapsed = time.perf_counter() - start
+
+    assert len(RangeKlinesHandler.calls) == 4
+    assert len(candles) == 4000
+    # Two rounds of two pages, rather than all four at once
+    assert elapsed >= 2 * RangeKlinesHandler.delay
@@ -0,0 +1,37 @@
+"""
+Tests for LTTB downsampling
+"""
+import numpy as np
+from backend.data.downsample import lttb_indices, downsample_points
+
+
+def test_lttb_keeps_endpoints_and_count():
+    """Test the first/last points are kept and the output size is exact"""
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+    
+    keep = lttb_indices(x, y, 100)
+    
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_preserves_spikes():
+    """Test isolated extremes survive downsampling"""
+    y = np.zeros(500)
+    y[123] = 10.0
+    y[321] = -10.0
+    
+    keep = lttb_indices(np.arange(500), y, 20)
+    
+    assert 123 in keep
+    assert 321 in keep
+
+
+def test_downsample_points_small_series_unchanged():
+    """Test series already under the limit are returned as is"""
+    points = [{'price': i} for i in range(10)]
+    
+    assert downsample_points(points, 50) is points
+    assert len(downsample_points(points, 5)) == 5
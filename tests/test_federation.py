@@ -0,0 +1,148 @@
+"""
+Tests for the federated candle series
+"""
+import pandas as pd
+import pytest
+from backend.api.prediction_service import PredictionService
+from backend.data.crypto_api import format_klines
+from backend.data import upstream
+from backend.data.federation import (
+    CANDLE_FIELDS, BinanceSource, CoinGeckoSource, SeriesFederation, SeriesRequest, Source, YahooSource
+)
+from backend.data.upstream import MIN_SAMPLES, CircuitBreaker, RateBudget
+from backend.utils.cache import CacheManager
+
+
+class CandleFetcher:
+    """Stand-in for CryptoDataFetcher returning formatted points, optionally failing Binance"""
+
+    def __init__(self, binance_down=False):
+        self.binance_down = binance_down
+        self.calls = []
+
+    def get_binance_klines(self, symbol, interval, limit):
+        self.calls.append(('binance', symbol, interval, limit))
+        if self.binance_down:
+            return []
+        return [{'timestamp': f'2024-01-01T00:{i % 60:02d}:00', 'open': 1.0, 'high': 2.0, 'low': 0.5,
+                 'close': 100.0 + i, 'volume': 10.0} for i in range(limit)]
+
+    def get_historical_data(self, coin_id, days):
+        self.calls.append(('coingecko', coin_id, days))
+        points = 288 if days == 1 else days * 24 if days <= 90 else days
+        return [{'timestamp': f'2024-01-01T00:00:{i % 60:02d}', 'price': 200.0 + i, 'volume': 5.0,
+                 'market_cap': 1e9} for i in range(points)]
+
+
+@pytest.fixture
+def healthy(monkeypatch, tmp_path):
+    """Closed breakers and full budgets for the providers, whatever other tests did to the shared ones"""
+    for provider in ('binance', 'coingecko'):
+        monkeypatch.setitem(upstream._breakers, provider, CircuitBreaker(provider))
+        monkeypatch.setitem(upstream._budgets, provider, RateBudget(provider, 6000, state_dir=str(tmp_path)))
+    monkeypatch.setitem(upstream._breakers, 'yahoo', CircuitBreaker('yahoo'))
+
+
+def test_unknown_coins_are_not_served_bitcoin(healthy):
+    """Test coins without a Binance pair use CoinGecko, or get nothing, instead of BTCUSDT"""
+    fetcher = CandleFetcher()
+    service = PredictionService(fetcher, cache=CacheManager())
+    service.yahoo = None
+
+    candles = service.series('shiba-inu', '5m')
+    assert fetcher.calls == [('coingecko', 'shiba-inu', 1)]
+    assert len(candles) == 120
+    assert set(candles[0]) == set(CANDLE_FIELDS)
+    assert candles[-1]['open'] == candles[-1]['close'] == 487.0
+
+    # No source has 1-minute candles for it
+    assert service.series('shiba-inu', '1m') == []
+    assert len(fetcher.calls) == 1
+
+
+def test_failover_to_next_source(healthy):
+    """Test an empty answer from the preferred source falls through to the next one"""
+    fetcher = CandleFetcher(binance_down=True)
+    service = PredictionService(fetcher, cache=CacheManager())
+    service.yahoo = None
+
+    candles = service.series('bitcoin', 'daily')
+    assert fetcher.calls == [('binance', 'BTCUSDT', '1d', 730), ('coingecko', 'bitcoin', 730)]
+    assert len(candles) == 730
+    assert candles[-1]['close'] == 929.0
+
+
+def test_sources_ranked_by_availability_and_latency(healthy, monkeypatch):
+    """Test open breakers and slow sources move down the order"""
+    federation = SeriesFederation([BinanceSource(CandleFetcher), CoinGeckoSource(CandleFetcher)])
+    request = SeriesRequest('bitcoin', '1h', 100)
+    assert [s.name for s in federation.candidates(request)] == ['binance', 'coingecko']
+
+    for _ in range(MIN_SAMPLES):
+        federation.latency['binance'].observe(2.0)
+    assert [s.name for s in federation.candidates(request)] == ['coingecko', 'binance']
+
+    federation.latency['binance'].samples.clear()
+    breaker = CircuitBreaker('coingecko', threshold=1)
+    breaker.record(None)
+    monkeypatch.setitem(upstream._breakers, 'coingecko', breaker)
+    for _ in range(MIN_SAMPLES):
+        federation.latency['coingecko'].observe(0.01)
+    assert [s.name for s in federation.candidates(request)] == ['binance', 'coingecko']
+
+    # Windows a source cannot serve leave it out; Binance pages long ones
+    assert [s.name for s in federation.candidates(SeriesRequest('bitcoin', '1h', 2400))] == ['binance']
+    assert [s.name for s in federation.candidates(SeriesRequest('bitcoin', '1m', 100))] == ['binance']
+
+
+def test_yahoo_candles_are_normalized():
+    """Test yfinance frames become candles in the shared schema"""
+    index = pd.date_range('2024-01-01', periods=5, freq='h', tz='UTC')
+    frame = pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': [10.0, 11, 12, 13, 14],
+                          'Volume': 3.0}, index=index)
+    source = YahooSource(lambda: None)
+    request = SeriesRequest('bitcoin', '1h', 3)
+
+    assert source.supports(request)
+    assert source.call(request) == ('get_historical_data', ('BTC-USD', '1h', 3))
+    candles = source.normalize(frame, request)
+    assert [c['close'] for c in candles] == [12.0, 13.0, 14.0]
+    # Same naive local-time format as the Binance and CoinGecko candles
+    kline = [int(index[2].timestamp() * 1000), '1', '2', '0.5', '12', '3']
+    assert candles[0]['timestamp'] == format_klines([kline])[0]['timestamp']
+    assert '+' not in candles[0]['timestamp']
+    assert set(candles[0]) == set(CANDLE_FIELDS)
+    assert not source.supports(SeriesRequest('shiba-inu', '1h', 3))
+
+
+def test_yahoo_outage_opens_its_breaker(healthy, monkeypatch):
+    """Test failing Yahoo fetches are timed, open Yahoo's breaker and then stop being sent"""
+    calls = []
+
+    class DownYahoo:
+        def get_historical_data(self, symbol, interval, limit):
+            calls.append(symbol)
+            raise ConnectionError('Yahoo is down')
+
+    monkeypatch.setitem(upstream._breakers, 'yahoo', CircuitBreaker('yahoo', threshold=2, cooldown=60))
+    federation = SeriesFederation([BinanceSource(lambda: CandleFetcher(binance_down=True)), YahooSource(DownYahoo)])
+    request = SeriesRequest('bitcoin', '1h', 100)
+
+    for _ in range(4):
+        assert federation.fetch(request) == []
+    assert calls == ['BTC-USD', 'BTC-USD']
+    assert upstream._breakers['yahoo'].state == upstream.OPEN
+    assert len(federation.latency['yahoo'].samples) == 2
+    assert [s.name for s in federation.candidates(request)] == ['binance', 'yahoo']
+
+
+def test_incomplete_sources_fail_on_construction():
+    """Test a source missing part of the interface cannot be instantiated"""
+    class PriceOnlySource(Source):
+        def supports(self, request):
+            return True
+
+    with pytest.raises(TypeError):
+        PriceOnlySource(lambda: None)
+    for source in (BinanceSource, CoinGeckoSource, YahooSource):
+        assert source(lambda: None).name
@@ -0,0 +1,82 @@
+"""
+Tests for the numpy-aware JSON encoder
+"""
+import json
+import numpy as np
+import pytest
+from flask import Flask, jsonify
+from backend.utils import json_provider
+
+
+def test_numpy_values_serialize():
+    """Test numpy scalars and arrays encode without manual conversion"""
+    payload = {
+        'predictions': np.array([1.5, 2.5]),
+        'horizons': np.arange(1, 4),
+        'slope': np.float64(0.25),
+        'score': np.int64(3),
+        'nested': [np.float32(1.0)],
+    }
+    
+    decoded = json.loads(json_provider.dumps(payload))
+    
+    assert decoded == {
+        'predictions': [1.5, 2.5],
+        'horizons': [1, 2, 3],
+        'slope': 0.25,
+        'score': 3,
+        'nested': [1.0],
+    }
+
+
+def test_stdlib_fallback(monkeypatch):
+    """Test the encoder works when orjson is not installed"""
+    monkeypatch.setattr(json_provider, 'orjson', None)
+    
+    encoded = json_provider.dumps({'values': np.array([1, 2]), 'x': np.int64(7)})
+    
+    assert json.loads(encoded) == {'values': [1, 2], 'x': 7}
+
+
+def test_non_contiguous_arrays():
+    """Test arrays orjson cannot serialize directly still encode"""
+    values = np.arange(10.0)[::2]
+    
+    assert json.loads(json_provider.dumps(values)) == [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def test_jsonify_uses_fast_encoder(monkeypatch):
+    """Test jsonify responses are encoded by dumps_bytes with orjson"""
+    if json_provider.orjson is None:
+        pytest.skip('orjson is not installed')
+    
+    calls = []
+    real_orjson = json_provider.orjson
+    
+    class RecordingOrjson:
+        def __getattr__(self, name):
+            return getattr(real_orjson, name)
+        
+        def dumps(self, obj, **kwargs):
+            calls.append(obj)
+            return real_orjson.dumps(obj, **kwargs)
+    
+    monkeypatch.setattr(json_provider, 'orjson', RecordingOrjson())
+    encoded = []
+    real_dumps_bytes = json_provider.dumps_bytes
+    monkeypatch.setattr(json_provider, 'dumps_bytes', lambda obj: encoded.append(obj) or real_dumps_bytes(obj))
+    
+    app = Flask(__name__)
+    app.json = json_provider.NumpyJSONProvider(app)
+    with app.app_context():
+        response = jsonify({'slope': np.float64(0.5)})
+        # Compact separators, as Flask passes them, take the fast path as well
+        assert app.json.dumps({'x': 1}, separators=(',', ':')) == '{"x":1}'
+    
+    assert response.get_data() == b'{"slope":0.5}\n'
+    assert encoded[0] == {'slope': 0.5}
+    assert len(calls) == 2
+    
+    # Pretty printing still goes through the stdlib
+    assert app.json.dumps({'x': 1}, indent=2) == '{\n  "x": 1\n}'
+    assert len(calls) == 2
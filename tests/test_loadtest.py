@@ -0,0 +1,66 @@
+"""
+Tests for the upstream stand-in and the load generator
+"""
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from benchmarks import loadtest
+from benchmarks.fake_upstream import FakeUpstream
+
+
+async def with_upstream(upstream, check):
+    client = TestClient(TestServer(upstream.app()))
+    await client.start_server()
+    try:
+        await check(client)
+    finally:
+        await client.close()
+
+
+def test_fake_upstream_serves_klines_and_limits():
+    """Test klines are served like Binance's and the weight limit answers 429"""
+    async def check(client):
+        response = await client.get('/api/v3/klines?symbol=BTCUSDT&interval=1h&limit=100')
+        assert response.status == 200
+        assert response.headers['X-MBX-USED-WEIGHT-1M'] == '2'
+        klines = await response.json()
+        assert len(klines) == 100
+        assert klines[1][0] - klines[0][0] == 3600 * 1000
+        assert float(klines[-1][2]) >= float(klines[-1][4])
+
+        throttled = await client.get('/api/v3/klines?symbol=BTCUSDT&interval=1h&limit=100')
+        assert throttled.status == 429
+        assert int(throttled.headers['Retry-After']) >= 1
+
+        chart = await (await client.get('/coingecko/api/v3/coins/bitcoin/market_chart?vs_currency=usd&days=30')).json()
+        assert len(chart['prices']) == 30
+
+        stats = await (await client.get('/_stats')).json()
+        assert stats == {'klines 200': 1, 'klines 429': 1, 'market_chart 200': 1}
+
+    asyncio.run(with_upstream(FakeUpstream(latency_ms=0, jitter_ms=0, binance_weight_limit=3), check))
+
+
+def test_fake_upstream_injected_errors():
+    """Test every request fails when the error rate is 1"""
+    async def check(client):
+        statuses = {(await client.get('/coingecko/api/v3/simple/price?ids=bitcoin')).status for _ in range(10)}
+        assert statuses <= {500, 502, 503}
+
+    asyncio.run(with_upstream(FakeUpstream(latency_ms=0, jitter_ms=0, error_rate=1.0, seed=1), check))
+
+
+def test_drive_and_summarize():
+    """Test the load generator reports every endpoint of its mix"""
+    async def check(client):
+        base = str(client.make_url('')).rstrip('/')
+        mix = [('klines', '/api/v3/klines?symbol={coin}&interval=5m&limit=10', 3),
+               ('price', '/coingecko/api/v3/simple/price?ids={coin}', 1)]
+        results = await loadtest.drive(base, concurrency=4, duration=0.5, mix=mix, coins=['BTCUSDT'])
+        summary = loadtest.summarize(results, 0.5)
+
+        assert set(summary) == {'klines', 'price', 'all'}
+        assert summary['all']['requests'] == summary['klines']['requests'] + summary['price']['requests']
+        assert summary['all']['ok'] == summary['all']['requests']
+        assert summary['klines']['p50_ms'] >= 10
+
+    asyncio.run(with_upstream(FakeUpstream(latency_ms=20, jitter_ms=5), check))
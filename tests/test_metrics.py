@@ -0,0 +1,83 @@
+"""
+Tests for the Prometheus metrics endpoint
+"""
+import json
+import os
+from backend.utils import metrics, timing
+from backend.utils.cache import CacheManager
+
+
+def test_cache_stats_per_prefix():
+    """Test cache hits, misses, evictions and sizes are kept per key prefix"""
+    cache = CacheManager()
+    cache.set('price_bitcoin', {'price': 1}, ttl=60)
+    cache.set('price_ethereum', {'price': 2}, ttl=-1)
+
+    assert cache.get('price_bitcoin') == {'price': 1}
+    assert cache.get('price_ethereum') is None
+    assert cache.get_entry('prediction_bitcoin_1h', record_miss=False) is None
+    assert cache.peek('price_bitcoin') is not None
+
+    stats = cache.stats()
+    assert stats['price'] == {'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 1, 'bytes': 0}
+    assert 'prediction' not in stats
+
+
+def test_merge_across_processes(tmp_path):
+    """Test snapshots of other processes are summed, gauges of dead ones dropped"""
+    metrics.reset()
+    timing.reset()
+    metrics.inc('upstream_requests_total', provider='binance', status='2xx')
+    metrics.gauge_add('http_requests_in_flight', 1, endpoint='api.predict_price')
+    timing.record('binance', 0.2)
+
+    # A worker that has exited since its last flush
+    other = {
+        'pid': 2 ** 22 + 1,
+        'counters': [['upstream_requests_total', {'provider': 'binance', 'status': '2xx'}, 4]],
+        'gauges': [['http_requests_in_flight', {'endpoint': 'api.predict_price'}, 3]],
+        'histograms': [['upstream_request_duration_seconds', {'provider': 'binance'},
+                        [0] * 7 + [2] + [0] * 6, 2, 0.4]],
+    }
+    (tmp_path / 'metrics-other.json').write_text(json.dumps(other))
+
+    text = metrics.exposition(str(tmp_path))
+    assert os.path.exists(tmp_path / f'metrics-{os.getpid()}.json')
+    assert '# TYPE epiccrypto_upstream_requests_total counter' in text
+    assert 'epiccrypto_upstream_requests_total{provider="binance",status="2xx"} 5' in text
+    assert 'epiccrypto_http_requests_in_flight{endpoint="api.predict_price"} 1' in text
+    assert 'epiccrypto_upstream_request_duration_seconds_bucket{provider="binance",le="0.25"} 3' in text
+    assert 'epiccrypto_upstream_request_duration_seconds_bucket{provider="binance",le="+Inf"} 3' in text
+    assert 'epiccrypto_upstream_request_duration_seconds_count{provider="binance"} 3' in text
+    metrics.reset()
+
+
+def test_metrics_endpoint(monkeypatch, tmp_path):
+    """Test the endpoint reports cache, model and request metrics"""
+    from app import create_app
+    from backend.api import routes
+    from tests.test_api import FakeFetcher
+
+    monkeypatch.setattr(metrics, 'metrics_dir', lambda: str(tmp_path))
+    app = create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+    metrics.reset()
+
+    with app.test_client() as client:
+        client.get('/api/predict/bitcoin?timeframe=1h')
+        client.get('/api/predict/bitcoin?timeframe=1h')
+        response = client.get('/api/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'epiccrypto_cache_requests_total{prefix="prediction",result="hit"} 1' in text
+    assert 'epiccrypto_cache_requests_total{prefix="prediction",result="miss"} 1' in text
+    assert 'epiccrypto_cache_requests_total{prefix="series",result="miss"} 1' in text
+    assert 'epiccrypto_model_duration_seconds_count{method="trend"} 1' in text
+    assert 'epiccrypto_http_requests_total{endpoint="api.predict_price",status="200"} 2' in text
+    assert 'epiccrypto_http_requests_in_flight{endpoint="api.get_metrics"} 1' in text
+    routes.cache.clear()
+    metrics.reset()
@@ -37,3 +37,87 @@ def test_multi_timeframe_predictor():
     assert '1m' in predictor.TIMEFRAMES
     assert '1h' in predictor.TIMEFRAMES
     assert 'daily' in predictor.TIMEFRAMES
+
+
+def test_multi_horizon_prediction():
+    """Test yearly forecasts only carry the configured horizons"""
+    predictor = MultiTimeframePredictor()
+    data = [{'price': 100 + i + (i % 7)} for i in range(120)]
+    
+    result = predictor.predict_for_timeframe(data, 'yearly', path_points=10)
+    
+    trend = result['trend_prediction']
+    assert list(trend['horizons']) == [1, 7, 30, 365]
+    assert len(trend['predictions']) == 4
+    assert len(trend['path']['values']) == 10
+    assert trend['path']['steps'][-1] == 365
+    assert len(result['arima_prediction']['predictions']) == 4
+    assert result['horizon_labels'] == ['1d', '7d', '30d', '365d']
+
+
+def test_trend_horizons_match_full_path():
+    """Test direct horizon evaluation matches the step-by-step forecast"""
+    predictor = CryptoPricePredictor()
+    prices = [100 + i * 2 for i in range(30)]
+    
+    full = predictor.predict_trend_simple(prices, periods_ahead=30)
+    direct = predictor.predict_trend_simple(prices, horizons=[1, 7, 30])
+    
+    expected = [full['predictions'][h - 1] for h in (1, 7, 30)]
+    assert np.allclose(direct['predictions'], expected)
+
+
+def test_latency_budget_skips_expensive_estimators():
+    """Test ARIMA is skipped when the budget cannot cover it"""
+    predictor = MultiTimeframePredictor()
+    data = [{'price': 100 + i} for i in range(60)]
+    
+    result = predictor.predict_for_timeframe(data, '1h', budget_ms=1)
+    
+    components = result['components']
+    assert components['computed'] == ['momentum', 'trend']
+    assert components['skipped'] == {'arima': 'budget'}
+    assert components['degraded'] is True
+    assert result['arima_prediction']['skipped'] is True
+    assert result['recommendation']['action']
+
+
+def test_unbounded_prediction_runs_all_estimators():
+    """Test every estimator runs without a budget"""
+    predictor = MultiTimeframePredictor()
+    data = [{'price': 100 + i + (i % 5)} for i in range(60)]
+    
+    result = predictor.predict_for_timeframe(data, '1h')
+    
+    assert result['components']['computed'] == ['momentum', 'trend', 'arima']
+    assert 'degraded' not in result['components']
+
+
+def test_estimators_read_their_lookback():
+    """Test each estimator reads only the newest points it declares"""
+    lookbacks = MultiTimeframePredictor.lookbacks('1m')
+    assert lookbacks == {'momentum': 20, 'trend': 60, 'arima': 60}
+    assert MultiTimeframePredictor.lookbacks('yearly')['arima'] == 730
+    
+    predictor = MultiTimeframePredictor()
+    # A longer series (e.g. shared with another timeframe) gives the same result as its tail
+    data = [{'price': 100 + i + (i % 5)} for i in range(200)]
+    full = predictor.predict_for_timeframe(data, '1m')
+    tail = predictor.predict_for_timeframe(data[-60:], '1m')
+    assert full['trend_prediction']['slope'] == tail['trend_prediction']['slope']
+    assert full['momentum_analysis']['momentum'] == tail['momentum_analysis']['momentum']
+
+
+def test_series_plan_covers_every_reader():
+    """Test each interval is fetched once, as deep as its most demanding reader needs"""
+    from backend.api.prediction_service import ANALYSIS_LOOKBACK, plan_series
+    plan = plan_series()
+    
+    assert plan['5m'] == plan['10m'] == ('5m', 120)
+    assert plan['1m'] == ('1m', 60)
+    assert plan['daily'] == plan['yearly'] == ('1d', 730)
+    for timeframe, (interval, window) in plan.items():
+        assert interval == MultiTimeframePredictor.TIMEFRAMES[timeframe]['interval']
+        assert window >= max(MultiTimeframePredictor.lookbacks(timeframe).values())
+    assert plan['1h'] == ('1h', 100)
+    assert plan['1h'][1] >= ANALYSIS_LOOKBACK
@@ -0,0 +1,90 @@
+"""
+Tests for on-demand request profiling
+"""
+import pstats
+import threading
+import time
+import pytest
+from app import create_app
+from backend.utils import profiling
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stack_sampler_collapses_stacks(tmp_path):
+    """Test sampled stacks name the functions the thread was running"""
+    sampler = profiling.StackSampler(threading.get_ident(), 0.002).start()
+    busy_wait(0.1)
+    sampler.stop()
+
+    assert sum(sampler.stacks.values()) > 5
+    stack, _ = sampler.stacks.most_common(1)[0]
+    assert stack.split(';')[-1] == 'test_profiling.py:busy_wait'
+
+    path = tmp_path / 'out.collapsed'
+    sampler.write(str(path))
+    line = path.read_text().splitlines()[0]
+    assert line.rsplit(' ', 1)[1].isdigit()
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = create_app()
+    app.config.update(TESTING=True, PROFILING=True, PROFILE_DIR=str(tmp_path),
+                      PROFILE_TOKEN='secret', PROFILE_INTERVAL_MS=1, PROFILE_KEEP=2)
+    profiling.init_app(app)
+    return app
+
+
+def test_profile_on_admin_header(profiled_app):
+    """Test only requests with the admin token are profiled, and listed"""
+    with profiled_app.test_client() as client:
+        assert 'X-Profile-Id' not in client.get('/api/health').headers
+        assert 'X-Profile-Id' not in client.get('/api/health', headers={'X-Profile': 'wrong'}).headers
+
+        response = client.get('/api/health', headers={'X-Profile': 'secret'})
+        name = response.headers['X-Profile-Id']
+        assert name.endswith('.collapsed')
+
+        assert client.get('/api/profiles').status_code == 403
+        listing = client.get('/api/profiles', headers={'X-Profile': 'secret'}).get_json()
+        assert listing['format'] == 'collapsed'
+        assert [p['id'] for p in listing['profiles']] == [name]
+        assert listing['profiles'][0]['endpoint'] == 'api.health_check'
+
+        download = client.get(f'/api/profiles/{name}', headers={'X-Profile': 'secret'})
+        assert download.status_code == 200
+        assert client.get('/api/profiles/..%2Fapp.py', headers={'X-Profile': 'secret'}).status_code == 404
+
+        # Only the newest PROFILE_KEEP files are kept
+        for _ in range(3):
+            client.get('/api/health', headers={'X-Profile': 'secret'})
+        assert len(client.get('/api/profiles', headers={'X-Profile': 'secret'}).get_json()['profiles']) == 2
+
+
+def test_pstats_format_and_sampling(tmp_path):
+    """Test sampled requests are profiled with cProfile in the pstats format"""
+    app = create_app()
+    app.config.update(TESTING=True, PROFILING=True, PROFILE_DIR=str(tmp_path),
+                      PROFILE_FORMAT='pstats', PROFILE_SAMPLE_RATE=1.0)
+    profiling.init_app(app)
+
+    with app.test_client() as client:
+        name = client.get('/api/health').headers['X-Profile-Id']
+        # Without a token the profiles are not served at all
+        assert client.get('/api/profiles').status_code == 403
+        assert client.get(f'/api/profiles/{name}').status_code == 403
+    stats = pstats.Stats(str(tmp_path / name))
+    assert any(func[2] == 'health_check' for func in stats.stats)
+
+
+def test_profiles_disabled():
+    """Test the listing is not served unless profiling is on"""
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        assert client.get('/api/profiles').status_code == 404
@@ -0,0 +1,70 @@
+"""
+Tests for recording and replaying upstream responses
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend.data.crypto_api import CryptoDataFetcher
+from backend.data.recording import Recorder, request_key
+
+
+class KlinesHandler(BaseHTTPRequestHandler):
+    calls = []
+    delay = 0.0
+
+    def do_GET(self):
+        self.calls.append(self.path)
+        time.sleep(self.delay)
+        body = json.dumps([[1700000000000 + i * 60000, '1', '2', '0.5', str(100 + i), '10'] for i in range(5)])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def serve():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), KlinesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def test_request_key_normalizes_query():
+    """Test parameter order and session-specific parameters do not change the key"""
+    assert request_key('GET', 'http://x/klines?symbol=BTC&limit=5') == request_key('get', 'http://X/klines?limit=5&symbol=BTC')
+    assert request_key('GET', 'http://x/chart?range=1y&crumb=abc') == request_key('GET', 'http://x/chart?range=1y&crumb=def')
+    assert request_key('GET', 'http://x/klines?limit=5') != request_key('GET', 'http://x/klines?limit=6')
+
+
+def test_record_then_replay_without_network(tmp_path):
+    """Test recorded responses are replayed identically after the upstream is gone"""
+    KlinesHandler.calls, KlinesHandler.delay = [], 0.2
+    server, base = serve()
+    try:
+        recording = CryptoDataFetcher(binance_base_url=base, recorder=Recorder(str(tmp_path), 'record'))
+        recorded = recording.get_binance_klines('BTCUSDT', '1m', 5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(recorded) == 5
+    assert len(KlinesHandler.calls) == 1
+    assert len(Recorder(str(tmp_path), 'replay').archive) == 1
+
+    replaying = CryptoDataFetcher(binance_base_url=base, recorder=Recorder(str(tmp_path), 'replay'))
+    start = time.perf_counter()
+    assert replaying.get_binance_klines('BTCUSDT', '1m', 5) == recorded
+    assert time.perf_counter() - start < 0.2
+    assert replaying.session.metered is False
+
+    # Requests that were never recorded fail like a network error
+    assert replaying.get_binance_klines('ETHUSDT', '1m', 5) == []
+    assert len(KlinesHandler.calls) == 1
+
+    timed = CryptoDataFetcher(binance_base_url=base, recorder=Recorder(str(tmp_path), 'replay', simulate_timing=True))
+    start = time.perf_counter()
+    timed.get_binance_klines('BTCUSDT', '1m', 5)
+    assert time.perf_counter() - start >= 0.2
@@ -0,0 +1,38 @@
+"""
+Import-time checks for worker start-up
+"""
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Loaded on first use by the requests that need them, never at import
+HEAVY_MODULES = ('pandas', 'sklearn', 'statsmodels', 'scipy', 'yfinance', 'pycoingecko')
+
+
+def import_times(module):
+    """``python -X importtime`` report for a fresh import: {module: cumulative microseconds}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', ['app', 'backend.api.async_server'])
+def test_no_heavy_imports_at_startup(module):
+    """Test importing the app does not load ML libraries or upstream clients"""
+    times = import_times(module)
+    heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+    
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:10]
+    report = '\n'.join(f'{us / 1000:8.1f} ms  {name}' for name, us in slowest)
+    assert not heavy, f'{module} imports {heavy[:10]} at start-up; slowest imports:\n{report}'
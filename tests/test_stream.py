@@ -0,0 +1,139 @@
+"""
+Tests for the Server-Sent Events hub
+"""
+import json
+import pytest
+from backend.api.stream import StreamHub, format_event
+from backend.utils.admission import AdmissionRejected
+
+
+def make_hub(calls):
+    """Create a hub whose sources record each upstream-triggering call"""
+    def price(coin_id):
+        calls.append(('price', coin_id))
+        return {'symbol': coin_id, 'price': 100}
+    
+    def analysis(coin_id):
+        calls.append(('analysis', coin_id))
+        return {'coin_id': coin_id, 'indicators': {}}
+    
+    def prediction(coin_id, timeframe):
+        calls.append(('prediction', coin_id, timeframe))
+        return {'coin_id': coin_id, 'prediction': {'timeframe': timeframe}}
+    
+    return StreamHub({'price': price, 'analysis': analysis, 'prediction': prediction}, interval=60)
+
+
+def drain(sub, count):
+    """Collect the next ``count`` events from a subscription"""
+    return [sub.get(timeout=2) for _ in range(count)]
+
+
+def test_subscribers_share_one_producer():
+    """Test one refresh feeds every subscriber of a coin"""
+    calls = []
+    hub = make_hub(calls)
+    
+    first = hub.subscribe('bitcoin', '1h')
+    events = drain(first, 3)
+    assert [event for event, _ in events] == ['price', 'analysis', 'prediction']
+    
+    # A second viewer is served from the producer snapshot
+    second = hub.subscribe('bitcoin', '1h')
+    assert [event for event, _ in drain(second, 3)] == ['price', 'analysis', 'prediction']
+    assert len(hub.producers) == 1
+    
+    # Unchanged payloads are not re-sent
+    hub.producers['bitcoin'].refresh()
+    assert first.get(timeout=0.1) is None
+    
+    hub.unsubscribe(first)
+    hub.unsubscribe(second)
+    assert hub.producers == {}
+
+
+def test_predictions_filtered_by_timeframe():
+    """Test subscribers only receive predictions for their timeframe"""
+    hub = make_hub([])
+    
+    hourly = hub.subscribe('ethereum', '1h')
+    drain(hourly, 3)
+    daily = hub.subscribe('ethereum', 'daily')
+    
+    received = [message for message in drain(daily, 3) if message]
+    predictions = [payload for event, payload in received if event == 'prediction']
+    assert predictions == [{'coin_id': 'ethereum', 'prediction': {'timeframe': 'daily'}}]
+    assert hourly.get(timeout=0.2) is None
+    
+    hub.unsubscribe(hourly)
+    hub.unsubscribe(daily)
+
+
+def test_timing_fields_do_not_trigger_events():
+    """Test recomputes that only change timestamps and timings are not re-sent"""
+    state = {'refreshes': 0, 'price': 100}
+    
+    def price(coin_id):
+        state['refreshes'] += 1
+        return {'symbol': coin_id, 'price': state['price'], 'timestamp': f"2024-01-01T00:00:{state['refreshes']:02d}"}
+    
+    def prediction(coin_id, timeframe):
+        return {'coin_id': coin_id, 'prediction': {'timeframe': timeframe,
+                                                   'components': {'elapsed_ms': state['refreshes'] * 1.5}}}
+    
+    hub = StreamHub({'price': price, 'analysis': lambda coin_id: {'coin_id': coin_id}, 'prediction': prediction},
+                    interval=60)
+    sub = hub.subscribe('bitcoin', '1h')
+    drain(sub, 3)
+    
+    hub.producers['bitcoin'].refresh()
+    assert sub.get(timeout=0.1) is None
+    
+    state['price'] = 101
+    hub.producers['bitcoin'].refresh()
+    event, payload = sub.get(timeout=1)
+    assert event == 'price' and payload['price'] == 101
+    assert sub.get(timeout=0.1) is None
+    
+    hub.unsubscribe(sub)
+
+
+def test_format_event():
+    """Test SSE message encoding"""
+    message = format_event('price', {'price': 1})
+    
+    assert message.startswith('event: price\ndata: ')
+    assert message.endswith('\n\n')
+    assert json.loads(message.split('data: ', 1)[1]) == {'price': 1}
+
+
+def test_hub_caps_and_admission():
+    """Test the hub refuses streams beyond its caps and admits new producers first"""
+    hub = make_hub([])
+    hub.max_coins, hub.max_subscribers = 1, 2
+    admitted = []
+    
+    def admit():
+        admitted.append(True)
+        return lambda: None
+    
+    first = hub.subscribe('bitcoin', '1h', admit=admit)
+    second = hub.subscribe('bitcoin', 'daily', admit=admit)
+    # Only starting the producer goes through admission
+    assert admitted == [True]
+    
+    with pytest.raises(AdmissionRejected) as full:
+        hub.subscribe('bitcoin', '1h')
+    assert full.value.status == 503
+    hub.unsubscribe(second)
+    
+    with pytest.raises(AdmissionRejected):
+        hub.subscribe('ethereum', '1h', admit=admit)
+    
+    def refuse():
+        raise AdmissionRejected(429, 1, 'Rate limit exceeded')
+    
+    hub.unsubscribe(first)
+    with pytest.raises(AdmissionRejected):
+        hub.subscribe('ethereum', '1h', admit=refuse)
+    assert hub.producers == {}
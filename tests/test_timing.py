@@ -0,0 +1,75 @@
+"""
+Tests for stage timing and Server-Timing headers
+"""
+import time
+from backend.utils import timing
+
+
+def test_spans_feed_request_and_histogram():
+    """Test spans are collected per request and into the stage histograms"""
+    timing.set_enabled(True)
+    timing.reset()
+
+    token = timing.begin()
+    with timing.span('fetch'):
+        time.sleep(0.01)
+    with timing.span('fetch'):
+        pass
+    timing.timed('fit')(lambda: None)()
+    spans = timing.end(token)
+
+    assert [name for name, _ in spans] == ['fetch', 'fetch', 'fit']
+    assert spans[0][1] >= 10
+
+    header = timing.server_timing(spans, 25.0)
+    assert header.startswith('fetch;dur=')
+    assert header.endswith('total;dur=25.0')
+    assert header.count('fetch') == 1
+
+    histograms = timing.histograms()
+    assert histograms['fetch']['count'] == 2
+    assert sum(histograms['fetch']['buckets']) == 2
+
+    # Outside a request only the histograms are updated
+    with timing.span('fetch'):
+        pass
+    assert timing.current_spans() == []
+    assert timing.histograms()['fetch']['count'] == 3
+
+
+def test_disabled_timing_records_nothing():
+    """Test disabled timing is a no-op"""
+    timing.set_enabled(False)
+    timing.reset()
+    try:
+        token = timing.begin()
+        with timing.span('fetch'):
+            pass
+        assert timing.end(token) == []
+        assert timing.histograms() == {}
+    finally:
+        timing.set_enabled(True)
+
+
+def test_server_timing_header(monkeypatch):
+    """Test API responses report their stages in Server-Timing"""
+    from app import create_app
+    from backend.api import routes
+    from tests.test_api import FakeFetcher
+
+    app = create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setattr(routes.service, 'data_fetcher', FakeFetcher())
+    routes.cache.clear()
+
+    with app.test_client() as client:
+        response = client.get('/api/predict/bitcoin?timeframe=1h')
+        assert response.status_code == 200
+        stages = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+        assert {'cache', 'trend', 'momentum', 'encode', 'total'} <= set(stages)
+        assert stages[-1] == 'total'
+
+        # A hit skips the model entirely
+        again = client.get('/api/predict/bitcoin?timeframe=1h')
+        assert 'trend' not in again.headers['Server-Timing']
+    routes.cache.clear()
@@ -0,0 +1,313 @@
+"""
+Tests for host-wide upstream rate budgets
+"""
+import multiprocessing
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from backend.data.upstream import (
+    BACKGROUND, INTERACTIVE, RateBudget, UpstreamBusy, UpstreamSession, binance_weight, priority
+)
+
+
+def _take_all(state_dir, results):
+    budget = RateBudget('shared', 8, state_dir=state_dir)
+    granted = 0
+    for _ in range(6):
+        if not budget.try_acquire(1):
+            granted += 1
+    results.put(granted)
+
+
+def test_budget_shared_across_processes(tmp_path):
+    """Test worker processes draw from one budget"""
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_take_all, args=(str(tmp_path), results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    # 12 attempts against a window of 8 (unless the window rolled over mid-test)
+    assert results.get() + results.get() in (8, 12)
+
+
+def test_background_leaves_reserve(tmp_path):
+    """Test background fetches stop short of the interactive reserve"""
+    budget = RateBudget('reserve', 10, reserve=0.2, state_dir=str(tmp_path))
+    assert all(budget.try_acquire(1, BACKGROUND) == 0 for _ in range(8))
+    assert budget.try_acquire(1, BACKGROUND) > 0
+    assert budget.try_acquire(2, INTERACTIVE) == 0
+    
+    with priority(BACKGROUND):
+        with pytest.raises(UpstreamBusy):
+            budget.acquire(1, max_wait=0)
+
+
+def test_background_waits_behind_interactive(tmp_path):
+    """Test background fetches are not admitted while an interactive fetch waits for budget"""
+    import time
+    
+    budget = RateBudget('ordered', 10, window=1.0, reserve=0, state_dir=str(tmp_path))
+    assert budget.try_acquire(10) == 0
+    wait = budget.try_acquire(5, INTERACTIVE, waiter='interactive')
+    assert wait > 0
+    
+    # The next window has room, but the interactive fetch waiting for it goes first
+    time.sleep(wait + 0.05)
+    assert budget.try_acquire(1, BACKGROUND, waiter='background') > 0
+    assert budget.try_acquire(5, INTERACTIVE, waiter='interactive') == 0
+    assert budget.try_acquire(1, BACKGROUND, waiter='background') == 0
+    
+    # Threads blocked in acquire are admitted in priority order, whoever started waiting first
+    while not budget.try_acquire(1):
+        pass
+    admitted = []
+    
+    def take(level):
+        budget.acquire(10, level=level, max_wait=5)
+        admitted.append(level)
+    
+    background = threading.Thread(target=take, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=take, args=(INTERACTIVE,))
+    interactive.start()
+    background.join()
+    interactive.join()
+    assert admitted == [INTERACTIVE, BACKGROUND]
+
+
+def test_response_headers_update_budget(tmp_path):
+    """Test Retry-After blocks the provider and used-weight headers are honoured"""
+    budget = RateBudget('binance-test', 100, state_dir=str(tmp_path),
+                        used_weight_header='X-MBX-USED-WEIGHT-1M')
+    budget.record(200, {'X-MBX-USED-WEIGHT-1M': '99'})
+    assert budget.try_acquire(1) == 0
+    assert budget.try_acquire(1) > 0
+    
+    other = RateBudget('blocked', 100, state_dir=str(tmp_path))
+    other.record(429, {'Retry-After': '30'})
+    assert 25 < other.try_acquire(1) <= 30
+    
+    assert binance_weight('/api/v3/klines', {'limit': 100}) == 2
+    assert binance_weight('/api/v3/klines', {'limit': 50}) == 1
+
+
+def test_upstream_session_honours_retry_after(tmp_path):
+    """Test a 429 from upstream makes later requests fail fast"""
+    hits = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(429)
+            self.send_header('Retry-After', '60')
+            self.end_headers()
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f'http://127.0.0.1:{server.server_port}/api'
+    try:
+        session = UpstreamSession({root: RateBudget('limited', 100, state_dir=str(tmp_path))})
+        assert session.get(f'{root}/ping', timeout=5).status_code == 429
+        with pytest.raises(UpstreamBusy):
+            session.get(f'{root}/ping', timeout=5)
+        assert len(hits) == 1
+    finally:
+        server.shutdown()
+
+
+def test_circuit_breaker_opens_and_probes(monkeypatch):
+    """Test consecutive failures open the breaker and a successful probe closes it"""
+    from backend.data import upstream
+    from backend.data.upstream import CircuitBreaker, CircuitOpen
+    
+    now = [1000.0]
+    monkeypatch.setattr(upstream.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('flaky', threshold=3, cooldown=30)
+    for status in (500, None, 503):
+        breaker.before_request()
+        breaker.record(status)
+    assert breaker.state == upstream.OPEN
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.before_request()
+    assert raised.value.retry_after == 30
+    
+    # One probe after the cooldown; others still fail fast while it runs
+    now[0] += 31
+    breaker.before_request()
+    assert breaker.state == upstream.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_request()
+    breaker.record(502)
+    assert breaker.state == upstream.OPEN
+    
+    now[0] += 31
+    breaker.before_request()
+    breaker.record(200)
+    assert breaker.state == upstream.CLOSED
+    # Rate limiting is not an outage
+    for _ in range(5):
+        breaker.record(429)
+    assert breaker.state == upstream.CLOSED
+
+
+def test_upstream_session_fails_fast_when_circuit_open(tmp_path, monkeypatch):
+    """Test an open circuit stops requests before they reach the failing upstream"""
+    from backend.data import upstream
+    from backend.data.upstream import CircuitBreaker, CircuitOpen
+    
+    hits = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(503)
+            self.end_headers()
+        
+        def log_message(self, *args):
+            pass
+    
+    monkeypatch.setitem(upstream._breakers, 'outage', CircuitBreaker('outage', threshold=2, cooldown=60))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f'http://127.0.0.1:{server.server_port}/api'
+    try:
+        budget = RateBudget('outage', 100, state_dir=str(tmp_path))
+        session = UpstreamSession({root: budget})
+        assert session.get(f'{root}/ping', timeout=5).status_code == 503
+        assert session.get(f'{root}/ping', timeout=5).status_code == 503
+        with pytest.raises(CircuitOpen):
+            session.get(f'{root}/ping', timeout=5)
+        assert len(hits) == 2
+        # Rejected requests do not spend budget
+        assert budget.try_acquire(98) == 0
+    finally:
+        server.shutdown()
+
+
+def test_latency_tracker_adapts_timeout_and_caps_hedges():
+    """Test timeouts follow the recent p99 within bounds and hedges stay under the rate"""
+    from backend.data.upstream import MIN_SAMPLES, LatencyTracker
+    
+    latency = LatencyTracker('adaptive', min_timeout=0.5, max_timeout=10, hedge_rate=0.25)
+    assert latency.timeout() == 10
+    assert latency.hedge_delay() is None
+    
+    for _ in range(MIN_SAMPLES):
+        latency.observe(0.4)
+    assert latency.timeout() == pytest.approx(1.2)
+    # Not hedged until a whole credit has been earned
+    assert latency.hedge_delay() is None
+    assert latency.hedge_delay() is None
+    assert latency.hedge_delay() == pytest.approx(0.4)
+    assert latency.take_hedge()
+    latency.refund_hedge()
+    assert latency.take_hedge()
+    assert not latency.take_hedge()
+    for _ in range(MIN_SAMPLES):
+        latency.observe(0.01)
+    assert latency.timeout() == pytest.approx(1.2)
+    latency.samples.clear()
+    for _ in range(MIN_SAMPLES):
+        latency.observe(0.01)
+    assert latency.timeout() == 0.5
+    
+    hedges = 0
+    for _ in range(40):
+        latency.hedge_delay()
+        hedges += latency.take_hedge()
+    assert hedges == 10
+
+
+def test_upstream_session_hedges_slow_gets(tmp_path, monkeypatch):
+    """Test a slow GET is duplicated after the p95 and the faster response wins"""
+    import time
+    from backend.data import upstream
+    from backend.data.upstream import MIN_SAMPLES, LatencyTracker
+    
+    hits = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            body = str(len(hits)).encode()
+            # Only the first request is slow
+            if body == b'1':
+                time.sleep(1.0)
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    latency = LatencyTracker('hedged', min_timeout=5, max_timeout=10, hedge_rate=1.0)
+    for _ in range(MIN_SAMPLES):
+        latency.observe(0.05)
+    monkeypatch.setitem(upstream._latencies, 'hedged', latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f'http://127.0.0.1:{server.server_port}/api'
+    closed = []
+    original_close = requests.Response.close
+    
+    def close(response):
+        closed.append(response.text)
+        original_close(response)
+    
+    monkeypatch.setattr(requests.Response, 'close', close)
+    try:
+        session = UpstreamSession({root: RateBudget('hedged', 100, state_dir=str(tmp_path))})
+        start = time.perf_counter()
+        response = session.get(f'{root}/ping', timeout=30)
+        assert time.perf_counter() - start < 0.8
+        assert response.text == '2'
+        assert len(hits) == 2
+        
+        # The slow loser's response is closed once it arrives
+        time.sleep(1.2)
+        assert closed == ['1']
+        session.close()
+        assert not any(thread.name.startswith('upstream-hedge') for thread in threading.enumerate())
+    finally:
+        server.shutdown()
+
+
+def test_upstream_session_sends_unhedgeable_gets_inline(tmp_path, monkeypatch):
+    """Test GETs without hedge credit are sent on the calling thread"""
+    from backend.data import upstream
+    from backend.data.upstream import MIN_SAMPLES, LatencyTracker
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'ok'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    latency = LatencyTracker('inline', min_timeout=5, max_timeout=10, hedge_rate=0.05)
+    for _ in range(MIN_SAMPLES):
+        latency.observe(0.05)
+    monkeypatch.setitem(upstream._latencies, 'inline', latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f'http://127.0.0.1:{server.server_port}/api'
+    try:
+        session = UpstreamSession({root: RateBudget('inline', 100, state_dir=str(tmp_path))})
+        monkeypatch.setattr(session, '_hedged', lambda *args: pytest.fail('hedged without credit'))
+        for _ in range(10):
+            assert session.get(f'{root}/ping').status_code == 200
+    finally:
+        server.shutdown()
@@ -0,0 +1,77 @@
+"""
+Tests for the pre-fork warm-up and its columnar series store
+"""
+import gc
+import numpy as np
+from backend.api.prediction_service import PredictionService
+from backend.api.warmup import warm_up
+from backend.data.series_store import SeriesStore
+from backend.utils.cache import CacheManager
+from backend.utils.memory import memory_report
+
+
+class WarmFetcher:
+    """Stand-in fetcher returning formatted points and counting calls"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def get_supported_coins(self):
+        return [{'id': 'bitcoin', 'symbol': 'btc', 'name': 'Bitcoin'}]
+    
+    def get_binance_klines(self, symbol, interval, limit):
+        self.calls.append(('binance', symbol, interval))
+        return [{'timestamp': f'2024-01-01T00:{i:02d}:00', 'open': 1.0, 'high': 2.0, 'low': 0.5,
+                 'close': 100.0 + i, 'volume': 10.0} for i in range(min(limit, 60))]
+    
+    def get_historical_data(self, coin_id, days):
+        self.calls.append(('coingecko', coin_id, days))
+        return [{'timestamp': f'2024-01-{i % 28 + 1:02d}T12:00:00.250000', 'price': 200.0 + i,
+                 'volume': 5.0, 'market_cap': 1e9} for i in range(days)]
+
+
+def test_series_store_round_trip():
+    """Test packed series come back exactly as fetched, from contiguous buffers"""
+    fetcher = WarmFetcher()
+    series = {
+        ('binance', 'BTCUSDT', '1m', 100): fetcher.get_binance_klines('BTCUSDT', '1m', 100),
+        ('coingecko', 'bitcoin', 30): fetcher.get_historical_data('bitcoin', 30),
+        ('coingecko', 'missing', 30): [],
+    }
+    store = SeriesStore(series)
+    
+    assert len(store) == 2
+    assert all(column.flags['C_CONTIGUOUS'] for column in store.columns.values())
+    for source in ('binance', 'BTCUSDT', '1m', 100), ('coingecko', 'bitcoin', 30):
+        points, remaining = store.get(source, 60)
+        assert points == series[source]
+        assert 0 < remaining <= 60
+    
+    assert store.get(('coingecko', 'missing', 30), 60) is None
+    assert store.get(('coingecko', 'bitcoin', 30), 0) is None
+
+
+def test_warm_up_serves_workers_without_fetching():
+    """Test series warmed in the master are served without upstream calls"""
+    fetcher = WarmFetcher()
+    service = PredictionService(fetcher, cache=CacheManager())
+    try:
+        summary = warm_up(service, ['bitcoin'])
+    finally:
+        gc.unfreeze()
+    
+    # Every timeframe's candles plus the default price history
+    assert summary['series'] == len({service.series_source('bitcoin', tf) for tf in service.predictor.TIMEFRAMES}) + 1
+    assert summary['series_failed'] == 0
+    
+    fetched = len(fetcher.calls)
+    result = service.prediction('bitcoin', '1h')
+    assert 'prediction' in result
+    assert service.historical('bitcoin', 30)['data'][0]['price'] == 200.0
+    assert len(fetcher.calls) == fetched
+
+
+def test_memory_report():
+    """Test memory figures are reported in KiB"""
+    report = memory_report()
+    assert report and all(isinstance(value, (int, np.integer)) for value in report.values())